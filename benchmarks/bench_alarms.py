@@ -0,0 +1,64 @@
+"""Cost of checking alarm rules on every stored sample.
+
+Decodes replay.SyntheticBMS frames once, then times CANReceiver._store on
+them with no AlarmEngine, with alarms.DEFAULT_RULES, and with the defaults
+plus N extra rules on signals that do not occur (the per-sample cost should
+not grow with them).
+
+    python benchmarks/bench_alarms.py [--frames N] [--rules N]
+"""
+
+import argparse
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import alarms  # noqa: E402
+import can_utils as cu  # noqa: E402
+import replay  # noqa: E402
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--frames", type=int, default=200000)
+    argparser.add_argument("--rules", type=int, default=500)
+    args = argparser.parse_args()
+
+    generator = replay.SyntheticBMS(board_ids=[1])
+    parser = cu.CANParser([1])
+    frames = []
+    for message in islice(generator.iter_frames(frame_rate=1000.0), args.frames):
+        parsed = parser.parse_frame(message)
+        if parsed:
+            frames.append((message.timestamp, *parsed))
+    samples = sum(len(data) for _, _, data in frames)
+    print(f"{len(frames):,} frames, {samples:,} samples")
+
+    extra = [
+        alarms.Rule(f"extra {index}", f"unused_{index}", above=float(index))
+        for index in range(args.rules)
+    ]
+    engines = {
+        "no alarms": None,
+        "default rules": alarms.AlarmEngine(),
+        f"+{args.rules} rules": alarms.AlarmEngine([*alarms.DEFAULT_RULES, *extra]),
+    }
+    for name, engine in engines.items():
+        receiver = cu.CANReceiver(bms_id=[1])
+        receiver.alarms = engine
+        start = time.perf_counter()
+        for first in range(0, len(frames), 256):
+            receiver._store(frames[first : first + 256])
+        elapsed = time.perf_counter() - start
+        events = len(engine.events) if engine else 0
+        print(
+            f"{name:16} {elapsed / samples * 1e9:7.1f} ns/sample"
+            f"  ({elapsed * 1e3:7.1f} ms, {events} events)"
+        )
+
+
+if __name__ == "__main__":
+    main()
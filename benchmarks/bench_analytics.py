@@ -0,0 +1,98 @@
+"""Cost of the Pack page statistics per update.
+
+Feeds the same synthetic frames into analytics.PackAnalytics and into a
+per-signal pure-Python equivalent (statistics module, one regression per
+cell) and reports the time per update + stats() call.
+
+    python benchmarks/bench_analytics.py [--cells N] [--updates N]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import analytics  # noqa: E402
+import can_utils as cu  # noqa: E402
+import replay  # noqa: E402
+
+
+class PerKeyAnalytics:
+    """The same statistics computed signal by signal in Python."""
+
+    def __init__(self, window: int = 120, outlier_z: float = 3.0):
+        self.outlier_z = outlier_z
+        self.latest: Dict[str, float] = {}
+        self.current = 0.0
+        self.history: Dict[str, Deque[Tuple[float, float, float]]] = {}
+        self.window = window
+
+    def update(self, new_samples: Dict[str, cu.RingSnapshot]) -> None:
+        for key, samples in new_samples.items():
+            if key == cu.CANParser.KEY_BATTERY_CURRENT:
+                self.current = samples.values[-1]
+            elif key.startswith(cu.CANParser.KEY_CELL):
+                self.latest[key] = samples.values[-1]
+        for key, value in self.latest.items():
+            history = self.history.setdefault(key, deque(maxlen=self.window))
+            history.append((time.time(), value, self.current))
+
+    def stats(self) -> Tuple[List[str], List[float]]:
+        values = list(self.latest.values())
+        mean = statistics.fmean(values)
+        std = statistics.pstdev(values)
+        outliers = [
+            key
+            for key, value in self.latest.items()
+            if abs(value - mean) > self.outlier_z * std
+        ]
+        slopes = []
+        for history in self.history.values():
+            if len(history) >= 3:
+                times, voltages, currents = zip(*history)
+                slopes.append(statistics.linear_regression(times, voltages).slope)
+                if max(currents) - min(currents) >= 1.0:
+                    slopes.append(
+                        statistics.linear_regression(currents, voltages).slope
+                    )
+        return outliers, slopes
+
+
+def bench(name: str, pack, updates: List[Dict[str, cu.RingSnapshot]]) -> None:
+    start = time.perf_counter()
+    for new_samples in updates:
+        pack.update(new_samples)
+        pack.stats()
+    elapsed = time.perf_counter() - start
+    print(f"{name:10} {elapsed / len(updates) * 1e3:8.3f} ms/update")
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--cells", type=int, default=128)
+    argparser.add_argument("--thermistors", type=int, default=64)
+    argparser.add_argument("--updates", type=int, default=500)
+    args = argparser.parse_args()
+
+    generator = replay.SyntheticBMS(cells=args.cells, thermistors=args.thermistors)
+    parser = cu.CANParser(0x01)
+    updates = []
+    for tick in range(args.updates):
+        new_samples: Dict[str, cu.RingSnapshot] = {}
+        for message in generator.cycle(float(tick)):
+            for key, value in parser.parse_message(message).items():
+                new_samples[key] = cu.RingSnapshot(tick, [float(tick)], [value])
+        updates.append(new_samples)
+
+    print(f"{args.updates} updates, {args.cells} cells, {args.thermistors} thermistors")
+    bench("numpy", analytics.PackAnalytics(), updates)
+    bench("per-key", PerKeyAnalytics(), updates)
+
+
+if __name__ == "__main__":
+    main()
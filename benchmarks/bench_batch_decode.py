@@ -0,0 +1,83 @@
+"""Per-frame versus batch decoding, both driven by the compiled frame schema.
+
+per-frame   CANParser.parse_frame on every 0x44xx/0x45xx message
+batch       analytics.decode_packed on the same frames held as arrays
+collect     analytics.frame_arrays, turning python-can messages into arrays
+            (paid once per file; a raw log loader can skip it)
+fields      the same for the fixed-layout frames (0x40xx-0x43xx) and
+            analytics.decode_fields
+
+  python benchmarks/bench_batch_decode.py [--frames N] [--boards N]
+"""
+
+import argparse
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import analytics  # noqa: E402
+import can_utils as cu  # noqa: E402
+import replay  # noqa: E402
+
+
+def report(name: str, frames: int, seconds: float) -> None:
+    print(f"{name:10} {frames / seconds:14,.0f} frames/s  ({seconds * 1e3:9.1f} ms)")
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--frames", type=int, default=500000)
+    argparser.add_argument("--boards", type=int, default=1)
+    args = argparser.parse_args()
+
+    board_ids = list(range(1, args.boards + 1))
+    generator = replay.SyntheticBMS(board_ids=board_ids)
+    packed_ids = (cu.CANParser.EACH_CELL_VOLTAGE_ID, cu.CANParser.EACH_TEMPERATURE_ID)
+    messages = []
+    fixed = []
+    for message in islice(generator.iter_frames(frame_rate=1000.0), args.frames):
+        if message.arbitration_id & ~cu.BOARD_ID_MASK in packed_ids:
+            messages.append(message)
+        else:
+            fixed.append(message)
+    print(f"{len(messages):,} packed frames, {len(board_ids)} board(s)")
+
+    parse = cu.CANParser(board_ids).parse_frame
+    start = time.perf_counter()
+    readings = 0
+    for message in messages:
+        readings += len(parse(message)[1])
+    per_frame = time.perf_counter() - start
+    report("per-frame", len(messages), per_frame)
+
+    start = time.perf_counter()
+    frames = analytics.frame_arrays(messages)
+    report("collect", len(messages), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cells, thermistors = analytics.decode_packed(frames, board_ids)
+    batch = time.perf_counter() - start
+    report("batch", len(messages), batch)
+
+    assert len(cells.values) + len(thermistors.values) == readings
+    print(f"speed-up   {per_frame / batch:14.1f} x")
+
+    print(f"{len(fixed):,} fixed-layout frames")
+    start = time.perf_counter()
+    readings = sum(len(parse(message)[1]) for message in fixed)
+    per_frame = time.perf_counter() - start
+    report("per-frame", len(fixed), per_frame)
+    frames = analytics.frame_arrays(fixed)
+    start = time.perf_counter()
+    fields = analytics.decode_fields(frames, board_ids)
+    batch = time.perf_counter() - start
+    report("batch", len(fixed), batch)
+    assert sum(len(column.values) for column in fields.values()) == readings
+    print(f"speed-up   {per_frame / batch:14.1f} x")
+
+
+if __name__ == "__main__":
+    main()
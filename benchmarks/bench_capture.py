@@ -0,0 +1,117 @@
+"""Aggregate decode throughput versus channel count.
+
+Runs 1..N free-running synthetic channels two ways and reports aggregate
+frames/s decoded and samples/s stored in the receiver:
+
+  threads     one thread per channel in this process (receive + parse + inject),
+              the way extra CANReceivers would run today
+  processes   capture.MultiChannelCapture: one process per channel publishing
+              to a shared-memory ring, drained into the receiver here
+
+Scaling of the process variant is bounded by the number of cores; the
+thread variant by the GIL.
+
+    python benchmarks/bench_capture.py [--channels N] [--seconds S]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import can_utils as cu  # noqa: E402
+import capture  # noqa: E402
+import replay  # noqa: E402
+
+
+def stored_samples(receiver: cu.CANReceiver) -> int:
+    return sum(
+        buffer.seq for board in receiver.boards.values() for buffer in board.values()
+    )
+
+
+def run_consumer(receiver: cu.CANReceiver, stop_event: threading.Event):
+    thread = threading.Thread(
+        target=asyncio.run, args=(receiver.process_messages(stop_event),)
+    )
+    thread.start()
+    return thread
+
+
+def bench_threads(channels: int, seconds: float) -> Tuple[int, int]:
+    receiver = cu.CANReceiver(bms_id=None)
+    stop_event = threading.Event()
+    consumer = run_consumer(receiver, stop_event)
+    frames = [0] * channels
+
+    def decode(channel: int) -> None:
+        bus = replay.SyntheticBus([1])
+        parse = receiver.parser.parse_frame
+        board_base = channel * capture.CHANNEL_STRIDE
+        while not stop_event.is_set():
+            message = bus.recv()
+            frames[channel] += 1
+            parsed = parse(message)
+            if parsed:
+                receiver.inject(time.time(), parsed[1], board_base + parsed[0])
+
+    workers = [
+        threading.Thread(target=decode, args=(channel,)) for channel in range(channels)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+    consumer.join()
+    return sum(frames), stored_samples(receiver)
+
+
+def bench_processes(channels: int, seconds: float) -> Tuple[int, int]:
+    receiver = cu.CANReceiver(bms_id=None)
+    stop_event = threading.Event()
+    consumer = run_consumer(receiver, stop_event)
+    multi = capture.MultiChannelCapture(
+        receiver,
+        [
+            capture.ChannelConfig(f"synthetic{channel}", "synthetic", bms_id=[1])
+            for channel in range(channels)
+        ],
+    )
+    multi.start()
+    time.sleep(seconds)
+    multi.stop()
+    stop_event.set()
+    consumer.join()
+    stats = multi.stats()
+    if stats["dropped_samples"]:
+        print(f"    ({stats['dropped_samples']:,} samples dropped, consumer behind)")
+    return stats["frames"], stored_samples(receiver)
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--channels", type=int, default=4)
+    argparser.add_argument("--seconds", type=float, default=3.0)
+    args = argparser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.seconds:.0f} s per run")
+    for name, bench in (("threads", bench_threads), ("processes", bench_processes)):
+        for channels in range(1, args.channels + 1):
+            frames, samples = bench(channels, args.seconds)
+            print(
+                f"{name:10} {channels} channel(s)"
+                f"  {frames / args.seconds:12,.0f} frames/s"
+                f"  {samples / args.seconds:12,.0f} samples/s stored"
+            )
+
+
+if __name__ == "__main__":
+    main()
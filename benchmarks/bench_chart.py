@@ -0,0 +1,138 @@
+"""Cost of feeding a long session into the LineCharts.
+
+Simulates ``--hours`` of one sample per second per signal, delivered to
+``--charts`` charts once per chart tick, and compares:
+
+  append        one LineChartDataPoint per sample, y range over the full history
+  minmax        layout.MinMaxSeries bucketing, only the changed tail rebuilt
+
+For each it reports the points held per chart at the end of the session (what
+page.update() has to serialize) and the time spent per tick. The LTTB line
+shows the one-shot cost of downsampling a whole session.
+
+    python benchmarks/bench_chart.py [--hours N] [--charts N] [--points N]
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import flet as ft
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import layout  # noqa: E402
+
+
+def lttb(
+    xs: Sequence[float], ys: Sequence[float], threshold: int
+) -> List[Tuple[float, float]]:
+    """Largest-Triangle-Three-Buckets downsampling of a complete series."""
+    length = len(xs)
+    if threshold >= length or threshold < 3:
+        return list(zip(xs, ys))
+
+    points = [(xs[0], ys[0])]
+    every = (length - 2) / (threshold - 2)
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        if end < next_end:
+            next_count = next_end - end
+            avg_x = sum(xs[end:next_end]) / next_count
+            avg_y = sum(ys[end:next_end]) / next_count
+        else:
+            avg_x, avg_y = xs[-1], ys[-1]
+
+        point_x, point_y = xs[selected], ys[selected]
+        best_area = -1.0
+        for index in range(start, end):
+            area = abs(
+                (point_x - avg_x) * (ys[index] - point_y)
+                - (point_x - xs[index]) * (avg_y - point_y)
+            )
+            if area > best_area:
+                best_area = area
+                selected = index
+        points.append((xs[selected], ys[selected]))
+    points.append((xs[-1], ys[-1]))
+    return points
+
+
+def make_session(hours: float, tick: float) -> List[Tuple[List[float], List[float]]]:
+    rng = random.Random(0)
+    per_tick = max(1, round(tick))
+    ticks = []
+    for start in range(0, int(hours * 3600), per_tick):
+        xs = [float(start + i) for i in range(per_tick)]
+        ticks.append(
+            (xs, [3.7 + 0.3 * math.sin(x / 900) + rng.gauss(0, 0.005) for x in xs])
+        )
+    return ticks
+
+
+def bench_append(ticks, charts: int) -> Tuple[int, float]:
+    series = [(ft.LineChartData(data_points=[]), []) for _ in range(charts)]
+    start = time.perf_counter()
+    for xs, ys in ticks:
+        for data, values in series:
+            data.data_points.extend(
+                ft.LineChartDataPoint(x=x, y=y) for x, y in zip(xs, ys)
+            )
+            values.extend(ys)
+            min(values), max(values)
+    return len(series[0][0].data_points), time.perf_counter() - start
+
+
+def bench_minmax(ticks, charts: int, points: int) -> Tuple[int, float]:
+    series = [
+        (layout.MinMaxSeries(points), ft.LineChartData(data_points=[]))
+        for _ in range(charts)
+    ]
+    start = time.perf_counter()
+    for xs, ys in ticks:
+        for downsampled, data in series:
+            downsampled.extend(xs, ys)
+            first, changed = downsampled.changes()
+            del data.data_points[first:]
+            data.data_points.extend(ft.LineChartDataPoint(x=x, y=y) for x, y in changed)
+            downsampled.low, downsampled.high
+    return len(series[0][1].data_points), time.perf_counter() - start
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--hours", type=float, default=2.0)
+    argparser.add_argument("--charts", type=int, default=4)
+    argparser.add_argument("--points", type=int, default=400)
+    argparser.add_argument("--tick", type=float, default=2.0, help="seconds")
+    args = argparser.parse_args()
+
+    ticks = make_session(args.hours, args.tick)
+    print(f"{len(ticks):,} ticks x {args.charts} charts")
+    for name, run in (
+        ("append", lambda: bench_append(ticks, args.charts)),
+        ("minmax", lambda: bench_minmax(ticks, args.charts, args.points)),
+    ):
+        points, elapsed = run()
+        print(
+            f"{name:8} {points:9,} points/chart"
+            f"  {elapsed / len(ticks) * 1e3:8.3f} ms/tick  ({elapsed:6.2f} s total)"
+        )
+
+    xs = [x for tick_xs, _ in ticks for x in tick_xs]
+    ys = [y for _, tick_ys in ticks for y in tick_ys]
+    start = time.perf_counter()
+    lttb(xs, ys, args.points)
+    elapsed = time.perf_counter() - start
+    print(f"{'lttb':8} {args.points:9,} points/chart  {elapsed * 1e3:8.3f} ms/series")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Cost of serving the decoded stream to more viewers.
+
+Feeds a CANReceiver with replay.SyntheticBMS cycles and times
+FanoutServer.publish (read, encode, write) for 1..N FanoutClients on a Unix
+socket, every client subscribed to everything or, with --prefixes, split
+between cell and thermistor prefixes.
+
+    python benchmarks/bench_fanout.py [--clients 1 4 16] [--ticks N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import can_utils as cu  # noqa: E402
+import fanout  # noqa: E402
+import replay  # noqa: E402
+
+
+async def run(clients: int, args: argparse.Namespace, address: str) -> float:
+    source = cu.CANReceiver(bms_id=None, max_data_points=4096)
+    generator = replay.SyntheticBMS(
+        board_ids=list(range(1, args.boards + 1)), cells=96, thermistors=32
+    )
+    server = fanout.FanoutServer(source, address)
+    await server.start()
+    subscriptions: List[List[str]] = [[]]
+    if args.prefixes:
+        subscriptions = [["cell_id_"], ["thrm_id_"], ["cell_id_", "thrm_id_"]]
+    viewers = [
+        fanout.FanoutClient(
+            cu.CANReceiver(bms_id=None),
+            address,
+            subscriptions[index % len(subscriptions)],
+        )
+        for index in range(clients)
+    ]
+    for viewer in viewers:
+        await viewer.start()
+    await asyncio.sleep(0.1)
+
+    timestamp = 0.0
+    publishing = 0.0
+    for _ in range(args.ticks):
+        for _ in range(args.cycles_per_tick):
+            timestamp += 0.1
+            for message in generator.cycle(timestamp):
+                parsed = source.parser.parse_frame(message)
+                if parsed:
+                    source.inject(timestamp, parsed[1], parsed[0])
+        source._store(source._drain())
+        start = time.perf_counter()
+        await server.publish()
+        publishing += time.perf_counter() - start
+        await asyncio.sleep(0.005)  # let the viewers read
+
+    for viewer in viewers:
+        viewer.stop()
+    await server.stop()
+    return publishing
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    argparser.add_argument("--ticks", type=int, default=200)
+    argparser.add_argument("--cycles-per-tick", type=int, default=5)
+    argparser.add_argument("--boards", type=int, default=1)
+    argparser.add_argument("--prefixes", action="store_true")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, "fanout.sock")
+        for clients in args.clients:
+            seconds = asyncio.run(run(clients, args, address))
+            print(
+                f"{clients:3} client(s)  publish {seconds / args.ticks * 1e3:7.3f}"
+                f" ms/tick"
+            )
+
+
+if __name__ == "__main__":
+    main()
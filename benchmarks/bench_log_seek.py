@@ -0,0 +1,126 @@
+"""Zooming into a short window of a long session log.
+
+Writes a synthetic session as CSV and as an indexed columnar log (flushed
+every few seconds, like BackgroundLogWriter), then times fetching a short
+window from the middle of it:
+
+  csv scan       parse the CSV from the top until the window has passed
+  bmslog full    read_log, then cut the window out
+  bmslog index   IndexedLogReader: open the index, read only the chunks needed
+
+and an overview of the whole session from the index summaries.
+
+    python benchmarks/bench_log_seek.py [--hours H] [--signals N] [--window S]
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import session_log  # noqa: E402
+
+
+def write_session(basename: str, hours: float, signals: int, flush_every: int):
+    rng = random.Random(0)
+    start = 1.7e9
+    writers = [
+        session_log.create_writer(log_format, basename)
+        for log_format in ("csv", "bmslog")
+    ]
+    for tick in range(int(hours * 3600)):
+        timestamp = start + tick
+        samples = {
+            f"cell_id_{signal}": [
+                (timestamp, 3.7 + 0.3 * math.sin(tick / 600) + rng.gauss(0, 0.005))
+            ]
+            for signal in range(signals)
+        }
+        for writer in writers:
+            writer.write(samples)
+            if tick % flush_every == 0:
+                writer.flush()
+    for writer in writers:
+        writer.close()
+    return start
+
+
+def timed(name: str, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{name:14} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+    return result
+
+
+def csv_scan(path: str, low: float, high: float) -> int:
+    count = 0
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader)
+        for row in reader:
+            timestamp = float(row[0])
+            if timestamp > high:
+                break
+            if timestamp >= low:
+                count += sum(1 for value in row[1:] if value)
+    return count
+
+
+def full_read(path: str, low: float, high: float) -> int:
+    return sum(
+        sum(1 for timestamp in timestamps if low <= timestamp <= high)
+        for timestamps, _ in session_log.read_log(path).values()
+    )
+
+
+def indexed_read(path: str, low: float, high: float) -> int:
+    columns = session_log.IndexedLogReader(path).read(low, high)
+    return sum(len(timestamps) for timestamps, _ in columns.values())
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--hours", type=float, default=12.0)
+    argparser.add_argument("--signals", type=int, default=32)
+    argparser.add_argument("--window", type=float, default=10.0)
+    argparser.add_argument("--at-minute", type=float, default=340.0)
+    argparser.add_argument("--flush-every", type=int, default=5)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        basename = os.path.join(directory, "session")
+        start = write_session(basename, args.hours, args.signals, args.flush_every)
+        csv_path = basename + session_log.CSVLogWriter.EXTENSION
+        log_path = basename + session_log.ColumnarLogWriter.EXTENSION
+        print(
+            f"{args.hours:g} h x {args.signals} signals: csv"
+            f" {os.path.getsize(csv_path) / 1e6:.1f} MB, bmslog"
+            f" {os.path.getsize(log_path) / 1e6:.1f} MB + index"
+            f" {os.path.getsize(log_path + session_log.INDEX_EXTENSION) / 1e6:.1f} MB"
+        )
+
+        low = start + args.at_minute * 60
+        high = low + args.window
+        print(f"{args.window:g} s window at minute {args.at_minute:g}:")
+        counts = [
+            timed("csv scan", csv_scan, csv_path, low, high),
+            timed("bmslog full", full_read, log_path, low, high),
+            timed("bmslog index", indexed_read, log_path, low, high),
+        ]
+        assert len(set(counts)) == 1, counts
+
+        reader = timed("open index", session_log.IndexedLogReader, log_path)
+        overview = timed("overview", reader.overview)
+        points = max(len(key_overview.start) for key_overview in overview.values())
+        print(f"overview: {len(reader.blocks)} blocks -> {points} points per signal")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Microbenchmark for CANParser.parse_message.
+
+Compares the current table-driven parser against the original if/elif chain
+on a mix of frames resembling a saturated BMS bus.
+
+    python benchmarks/bench_parser.py [--frames N] [--repeat R]
+"""
+
+import argparse
+import random
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import can
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import can_utils as cu  # noqa: E402
+
+
+class LegacyCANParser:
+    """The pre-dispatch-table parser, kept verbatim as the baseline."""
+
+    def __init__(self, board_id: int):
+        self.board_id = board_id
+
+    def parse_message(self, message) -> Optional[Dict[str, Union[int, float]]]:  # noqa: PLR0911
+        message_id = message.arbitration_id
+        if message_id == 0x4000 + self.board_id:
+            return self._parse_battery_voltage_current(message.data)
+        elif message_id == 0x4100 + self.board_id:
+            return self._parse_cell_voltage(message.data)
+        elif message_id == 0x4200 + self.board_id:
+            return self._parse_soc_duty(message.data)
+        elif message_id == 0x4300 + self.board_id:
+            return self._parse_temp(message.data)
+        elif message_id == 0x4400 + self.board_id:
+            return self._parse_each_cell_voltage(message.data)
+        elif message_id == 0x4500 + self.board_id:
+            return self._parse_each_temperature(message.data)
+        return None
+
+    def _parse_battery_voltage_current(self, data):
+        battery_voltage, battery_current = struct.unpack("<I i", data[:8])
+        return {
+            "battery_voltage": round(battery_voltage * 100e-6, 2),
+            "battery_current": round(battery_current * 1e-3, 2),
+        }
+
+    def _parse_cell_voltage(self, data):
+        min_cell_voltage, max_cell_voltage = struct.unpack("<I I", data[:8])
+        return {
+            "min_cell_voltage": round(min_cell_voltage * 100e-6, 2),
+            "max_cell_voltage": round(max_cell_voltage * 100e-6, 2),
+        }
+
+    def _parse_soc_duty(self, data):
+        _, remain, soc, _, duty, _ = struct.unpack("<H H B B B B", data[:8])
+        return {"remain": remain, "soc": soc, "duty": duty}
+
+    def _parse_temp(self, data):
+        battery_average, battery_max, pcb_average, pcb_max = struct.unpack(
+            "<h h h h", data[:8]
+        )
+        return {
+            "battery_average_temp": round(battery_average, 2),
+            "battery_max_temp": round(battery_max, 2),
+            "pcb_average_temp": round(pcb_average, 2),
+            "pcb_max_temp": round(pcb_max, 2),
+        }
+
+    def _parse_cell_message(self, data):
+        cell_id = (data & 0xFE00) >> 9
+        cell_voltage = data & 0x1FF
+        return {f"cell_id_{cell_id}": round(cell_voltage * 10e-3, 2)}
+
+    def _parse_each_cell_voltage(self, data):
+        cell1, cell2, cell3, cell4 = struct.unpack("<H H H H", data[:8])
+        result = {}
+        result.update(self._parse_cell_message(cell1))
+        result.update(self._parse_cell_message(cell2))
+        result.update(self._parse_cell_message(cell3))
+        result.update(self._parse_cell_message(cell4))
+        return result
+
+    def _parse_thrm_message(self, data):
+        thrm_id = (data & 0xFC00) >> 10
+        compressed_temp = data & 0x03FF
+        sign_bit = (compressed_temp & 0x0200) >> 9
+        abs_temperature = compressed_temp & 0x01FF
+        temperature = -abs_temperature if sign_bit == 1 else abs_temperature
+        return {f"thrm_id_{thrm_id}": round(temperature, 2)}
+
+    def _parse_each_temperature(self, data):
+        result = {}
+        if len(data) % 2 != 0:
+            return result
+        for i in range(0, len(data), 2):
+            (thrm,) = struct.unpack("<H", data[i : i + 2])
+            result.update(self._parse_thrm_message(thrm))
+        return result
+
+
+def make_frames(count: int, board_id: int) -> List[can.Message]:
+    rng = random.Random(0)
+    frames = []
+    for i in range(count):
+        kind = i % 8
+        if kind == 0:
+            arbitration_id = 0x4000
+            data = struct.pack("<I i", 480000, rng.randint(-50000, 50000))
+        elif kind == 1:
+            arbitration_id = 0x4100
+            data = struct.pack("<I I", 36000, 41000)
+        elif kind == 2:
+            arbitration_id = 0x4200
+            data = struct.pack("<H H B B B B", 0, 5000, 80, 0, 30, 0)
+        elif kind == 3:
+            arbitration_id = 0x4300
+            data = struct.pack("<h h h h", 25, 30, 28, 35)
+        elif kind in (4, 5, 6):
+            arbitration_id = 0x4400
+            base = rng.randrange(0, 96, 4)
+            data = struct.pack(
+                "<H H H H",
+                *(((base + n) << 9) | rng.randint(300, 420) for n in range(4)),
+            )
+        else:
+            arbitration_id = 0x4500
+            base = rng.randrange(0, 60, 4)
+            data = struct.pack(
+                "<H H H H",
+                *(((base + n) << 10) | rng.randint(0, 60) for n in range(4)),
+            )
+        frames.append(
+            can.Message(
+                arbitration_id=arbitration_id + board_id,
+                data=data,
+                is_extended_id=True,
+            )
+        )
+    return frames
+
+
+def measure(parser, frames: List[can.Message], repeat: int) -> float:
+    parse = parser.parse_message
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in frames:
+            parse(message)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--frames", type=int, default=200000)
+    argparser.add_argument("--repeat", type=int, default=5)
+    argparser.add_argument("--board-id", type=int, default=0x01)
+    args = argparser.parse_args()
+
+    frames = make_frames(args.frames, args.board_id)
+    legacy = LegacyCANParser(args.board_id)
+    current = cu.CANParser(args.board_id)
+    for message in frames[:1000]:
+        assert legacy.parse_message(message) == current.parse_message(message)
+
+    before = measure(legacy, frames, args.repeat)
+    after = measure(current, frames, args.repeat)
+    print(f"before (if/elif):     {before:12,.0f} frames/s")
+    print(f"after  (dispatch):    {after:12,.0f} frames/s")
+    print(f"speedup:              {after / before:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""End-to-end throughput benchmarks for the CAN receive pipeline.
+
+Drives CANParser and CANReceiver with frames from replay.SyntheticBMS and
+reports:
+
+  parse            frames/s through CANParser.parse_message
+  enqueue          frames/s through parse + CANReceiver.inject
+  process          samples/s drained by CANReceiver.process_messages
+  virtual bus      frames/s from a python-can virtual bus into data_points
+  latency          recv-to-data_points latency for single frames
+  memory           traced allocation growth while filling the ring buffers
+  read             cost of get_data_points / get_snapshots / read_since
+
+    python benchmarks/bench_pipeline.py [--frames N] [--boards N] [--cells N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from itertools import islice
+from pathlib import Path
+from typing import Callable, List
+
+import can
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import can_utils as cu  # noqa: E402
+import replay  # noqa: E402
+
+
+class Consumer:
+    """Runs CANReceiver.process_messages on its own event loop thread.
+
+    With ``receive``, the receiver also reads its bus on that loop.
+    """
+
+    def __init__(self, receiver: cu.CANReceiver, receive: bool = False):
+        self.receiver = receiver
+        self.receive = receive
+        self.started = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._run(),))
+
+    async def _run(self) -> None:
+        if self.receive:
+            self.receiver.start_receiving()
+        self.started.set()
+        try:
+            await self.receiver.process_messages(self.stop_event)
+        finally:
+            self.receiver.stop_receiving()
+
+    def __enter__(self) -> "Consumer":
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+
+def stored_samples(receiver: cu.CANReceiver) -> int:
+    return sum(
+        buffer.seq for board in receiver.boards.values() for buffer in board.values()
+    )
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("pipeline did not drain")
+        time.sleep(0.001)
+
+
+def report(name: str, count: float, seconds: float, unit: str) -> None:
+    print(f"{name:14} {count / seconds:14,.0f} {unit}/s  ({seconds * 1e3:9.1f} ms)")
+
+
+def bench_parse(frames: List[can.Message], board_ids: List[int]) -> None:
+    parse = cu.CANParser(board_ids).parse_frame
+    start = time.perf_counter()
+    for message in frames:
+        parse(message)
+    report("parse", len(frames), time.perf_counter() - start, "frames")
+
+
+def bench_enqueue(frames: List[can.Message], board_ids: List[int]) -> cu.CANReceiver:
+    receiver = cu.CANReceiver(bms_id=board_ids)
+    parse = receiver.parser.parse_frame
+    inject = receiver.inject
+    start = time.perf_counter()
+    for message in frames:
+        parsed = parse(message)
+        if parsed:
+            inject(message.timestamp, parsed[1], parsed[0])
+    report("enqueue", len(frames), time.perf_counter() - start, "frames")
+    return receiver
+
+
+def bench_process(receiver: cu.CANReceiver) -> None:
+    start = time.perf_counter()
+    with Consumer(receiver):
+        wait_until(lambda: not receiver.pending_frames)
+        elapsed = time.perf_counter() - start
+    report("process", stored_samples(receiver), elapsed, "samples")
+
+
+def bench_virtual_bus(frames: List[can.Message], board_ids: List[int]) -> None:
+    receiver = cu.CANReceiver(
+        channel="bench-pipeline", bms_id=board_ids, interface="virtual"
+    )
+    sender = can.Bus(interface="virtual", channel="bench-pipeline")
+    try:
+        with Consumer(receiver, receive=True):
+            start = time.perf_counter()
+            for message in frames:
+                sender.send(message)
+            wait_until(
+                lambda: receiver.frames_received >= len(frames)
+                and not receiver.pending_frames
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        sender.shutdown()
+    report("virtual bus", len(frames), elapsed, "frames")
+
+
+def bench_latency(board_id: int, probes: int) -> None:
+    receiver = cu.CANReceiver(
+        channel="bench-latency", bms_id=board_id, interface="virtual"
+    )
+    sender = can.Bus(interface="virtual", channel="bench-latency")
+    probe = replay.SyntheticBMS(board_ids=[board_id], cells=0, thermistors=0)
+    latencies = []
+    try:
+        with Consumer(receiver, receive=True):
+            for _ in range(probes):
+                message = probe.cycle()[2]  # 0x42xx SOC frame
+                buffer = receiver.data_points.get(cu.CANParser.KEY_SOC)
+                seq = buffer.seq if buffer else 0
+                start = time.perf_counter()
+                sender.send(message)
+                wait_until(
+                    lambda: cu.CANParser.KEY_SOC in receiver.data_points
+                    and receiver.data_points[cu.CANParser.KEY_SOC].seq > seq,
+                    timeout=5.0,
+                )
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.002)
+    finally:
+        sender.shutdown()
+    latencies.sort()
+    print(
+        f"{'latency':14} median {statistics.median(latencies) * 1e3:7.3f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e3:7.3f} ms"
+        f"  max {latencies[-1] * 1e3:7.3f} ms"
+    )
+
+
+def bench_memory(
+    generator: replay.SyntheticBMS,
+    board_ids: List[int],
+    max_data_points: int,
+    frames: int,
+) -> None:
+    receiver = cu.CANReceiver(bms_id=board_ids, max_data_points=max_data_points)
+    parse = receiver.parser.parse_frame
+    stream = generator.iter_frames(frame_rate=1000.0)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    with Consumer(receiver):
+        steps = 4
+        for step in range(1, steps + 1):
+            for message in islice(stream, frames // steps):
+                parsed = parse(message)
+                if parsed:
+                    receiver.inject(message.timestamp, parsed[1], parsed[0])
+            wait_until(lambda: not receiver.pending_frames)
+            current = tracemalloc.get_traced_memory()[0] - baseline
+            print(
+                f"{'memory':14} after {step * frames // steps:9,} frames"
+                f"  {current / 1e6:9.2f} MB  ({stored_samples(receiver):,} samples)"
+            )
+    tracemalloc.stop()
+    bench_read(receiver)
+
+
+def bench_read(receiver: cu.CANReceiver) -> None:
+    samples = sum(
+        len(buffer) for board in receiver.boards.values() for buffer in board.values()
+    )
+    for name, call in (
+        ("get_data_points", receiver.get_data_points),
+        ("get_snapshots", receiver.get_snapshots),
+    ):
+        start = time.perf_counter()
+        for board_id in receiver.board_ids:
+            asyncio.run(call(board_id))
+        elapsed = time.perf_counter() - start
+        print(f"{name:14} {elapsed * 1e3:9.2f} ms for {samples:,} buffered samples")
+
+    cursors = {
+        board_id: asyncio.run(receiver.read_since({}, board_id))[1]
+        for board_id in receiver.board_ids
+    }
+    start = time.perf_counter()
+    for board_id, cursor in cursors.items():
+        asyncio.run(receiver.read_since(cursor, board_id))
+    elapsed = time.perf_counter() - start
+    print(f"{'read_since':14} {elapsed * 1e3:9.2f} ms with nothing new")
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--frames", type=int, default=100000)
+    argparser.add_argument("--boards", type=int, default=1)
+    argparser.add_argument("--cells", type=int, default=96)
+    argparser.add_argument("--thermistors", type=int, default=32)
+    argparser.add_argument("--max-data-points", type=int, default=10000)
+    argparser.add_argument("--probes", type=int, default=200)
+    args = argparser.parse_args()
+
+    board_ids = list(range(1, args.boards + 1))
+    generator = replay.SyntheticBMS(
+        board_ids=board_ids, cells=args.cells, thermistors=args.thermistors
+    )
+    frames = list(islice(generator.iter_frames(frame_rate=1000.0), args.frames))
+    print(
+        f"{args.frames:,} frames, {len(board_ids)} board(s), "
+        f"{generator.frames_per_cycle} frames/cycle"
+    )
+
+    bench_parse(frames, board_ids)
+    receiver = bench_enqueue(frames, board_ids)
+    bench_process(receiver)
+    bench_virtual_bus(frames, board_ids)
+    bench_latency(board_ids[0], args.probes)
+    bench_memory(generator, board_ids, args.max_data_points, args.frames)
+
+
+if __name__ == "__main__":
+    main()
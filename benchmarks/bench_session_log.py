@@ -0,0 +1,92 @@
+"""Compare the CSV and columnar session log backends.
+
+Writes the same synthetic session through every backend in session_log.WRITERS
+and reports file size, write time and the time to load it back into columns.
+
+    python benchmarks/bench_session_log.py [--seconds N] [--cells N]
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import session_log  # noqa: E402
+
+
+def make_ticks(seconds: int, cells: int, thermistors: int, rate: int):
+    rng = random.Random(0)
+    start = 1.7e9
+    for tick in range(seconds):
+        samples = {}
+        for cell in range(cells):
+            samples[f"cell_id_{cell}"] = [
+                (
+                    start + tick + i / rate,
+                    round(3.7 + 0.3 * math.sin(tick / 600) + rng.gauss(0, 0.005), 2),
+                )
+                for i in range(rate)
+            ]
+        for thrm in range(thermistors):
+            samples[f"thrm_id_{thrm}"] = [
+                (start + tick + i / rate, 25 + tick // 120 + rng.randint(-1, 1))
+                for i in range(rate)
+            ]
+        yield samples
+
+
+def load_csv(path: str):
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        columns = {key: ([], []) for key in header[1:]}
+        for row in reader:
+            timestamp = float(row[0])
+            for key, value in zip(header[1:], row[1:]):
+                if value:
+                    columns[key][0].append(timestamp)
+                    columns[key][1].append(float(value))
+    return columns
+
+
+LOADERS = {"csv": load_csv, "bmslog": session_log.read_log}
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--seconds", type=int, default=600)
+    argparser.add_argument("--cells", type=int, default=128)
+    argparser.add_argument("--thermistors", type=int, default=64)
+    argparser.add_argument("--rate", type=int, default=5, help="samples/s/signal")
+    args = argparser.parse_args()
+
+    ticks = list(make_ticks(args.seconds, args.cells, args.thermistors, args.rate))
+    with tempfile.TemporaryDirectory() as directory:
+        basename = os.path.join(directory, "session")
+        for log_format, loader in LOADERS.items():
+            writer = session_log.create_writer(log_format, basename)
+            start = time.perf_counter()
+            for samples in ticks:
+                writer.write(samples)
+            writer.close()
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loader(writer.path)
+            load_time = time.perf_counter() - start
+            size = os.path.getsize(writer.path)
+            print(
+                f"{log_format:8} {size / 1e6:9.2f} MB"
+                f"  write {write_time:7.2f} s  load {load_time:7.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Import-time budget for the app and the headless tools.
+
+Imports each entry module in a fresh interpreter under ``python -X importtime``
+and checks two things: the cumulative import time stays under its budget, and
+modules that are meant to load lazily (python-can, numpy, flet for the
+recorder, ...) are not pulled in at import. Exits non-zero on a regression.
+
+    python benchmarks/bench_startup.py [--runs N] [--scale X] [--top N]
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# module: (budget in ms, modules that must not be imported)
+BUDGETS: Dict[str, Tuple[float, List[str]]] = {
+    "can_utils": (150.0, ["can", "numpy", "flet"]),
+    "session_log": (100.0, ["can", "numpy", "flet"]),
+    "recorder": (250.0, ["can", "numpy", "flet"]),
+    "bms_plotter": (
+        1500.0,
+        [
+            "can",
+            "numpy",
+            "alarms",
+            "analytics",
+            "capture",
+            "fanout",
+            "replay",
+            "session_log",
+        ],
+    ),
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """{module: (self us, cumulative us)} for one cold import of ``module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return times
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--runs", type=int, default=5)
+    argparser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply every budget, slow boxes"
+    )
+    argparser.add_argument("--top", type=int, default=5, help="slowest imports shown")
+    args = argparser.parse_args()
+
+    failures = []
+    for module, (budget, forbidden) in BUDGETS.items():
+        runs = [import_times(module) for _ in range(args.runs)]
+        total = statistics.median(run[module][1] for run in runs) / 1e3
+        budget *= args.scale
+        status = "ok" if total <= budget else "OVER BUDGET"
+        print(f"{module:12} {total:8.1f} ms  (budget {budget:6.0f} ms)  {status}")
+        if total > budget:
+            failures.append(f"{module} took {total:.1f} ms")
+
+        slowest = sorted(runs[-1].items(), key=lambda item: -item[1][0])
+        for name, (self_us, _) in slowest[: args.top]:
+            print(f"    {name:40} {self_us / 1e3:8.1f} ms self")
+        for name in forbidden:
+            if name in runs[-1]:
+                failures.append(f"{module} imports {name} at import time")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
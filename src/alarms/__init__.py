@@ -0,0 +1,409 @@
+import csv
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import can_utils as cu
+import metrics
+import session_log
+
+_RAISED = metrics.REGISTRY.counter(
+    "bms_alarms_raised_total", "Alarm rules that went active"
+)
+_DETECTION_SECONDS = metrics.REGISTRY.histogram(
+    "bms_alarm_detection_seconds",
+    "Wall time from the sample that raised an alarm to the alarm being raised",
+)
+_BACKLOG = metrics.REGISTRY.gauge(
+    "bms_alarm_backlog_batches", "Stored batches waiting to be checked for alarms"
+)
+# Key of the engine's own alarm for falling behind the receiver.
+BACKLOG_KEY = "alarm_backlog"
+
+
+class Rule(NamedTuple):
+    """A limit on one signal, or on every signal starting with ``key[:-1]``
+    when ``key`` ends in "*" (e.g. "thrm_id_*").
+
+    The alarm is raised when the value (or with ``rate``, its change per
+    second) goes above ``above`` or below ``below`` and stays there for
+    ``debounce`` seconds of frame time; it clears once back inside the limits
+    by ``hysteresis`` for as long.
+    """
+
+    name: str
+    key: str
+    above: Optional[float] = None
+    below: Optional[float] = None
+    rate: bool = False
+    hysteresis: float = 0.0
+    debounce: float = 0.0
+    severity: str = "warning"
+
+    def matches(self, key: str) -> bool:
+        if self.key.endswith("*"):
+            return key.startswith(self.key[:-1])
+        return key == self.key
+
+
+# Generic Li-ion limits, used when no rules file is given.
+DEFAULT_RULES: Tuple[Rule, ...] = (
+    Rule(
+        "cell over-voltage",
+        "cell_id_*",
+        above=4.25,
+        hysteresis=0.05,
+        debounce=0.5,
+        severity="critical",
+    ),
+    Rule(
+        "cell under-voltage",
+        "cell_id_*",
+        below=2.8,
+        hysteresis=0.1,
+        debounce=0.5,
+        severity="critical",
+    ),
+    Rule("low cell voltage", "min_cell_voltage", below=3.0, hysteresis=0.1, debounce=1),
+    Rule(
+        "over-temperature",
+        "thrm_id_*",
+        above=60,
+        hysteresis=5,
+        debounce=1,
+        severity="critical",
+    ),
+    Rule("battery over-temperature", "battery_max_temp", above=55, hysteresis=5),
+    Rule(
+        "temperature rising fast", "battery_max_temp", above=1.0, rate=True, debounce=5
+    ),
+)
+
+
+class AlarmEvent(NamedTuple):
+    """A rule going active or clearing, at the frame time of the sample."""
+
+    timestamp: float
+    board_id: int
+    key: str
+    rule: Rule
+    value: float
+    active: bool
+
+    def describe(self) -> str:
+        unit = "/s" if self.rule.rate else ""
+        state = "ALARM" if self.active else "clear"
+        return (
+            f"{state} {self.rule.name}: {self.key} = {self.value:g}{unit}"
+            f" (board {self.board_id})"
+        )
+
+
+class _RuleState:
+    """One rule on one signal of one board."""
+
+    __slots__ = (
+        "rule",
+        "above",
+        "below",
+        "clear_above",
+        "clear_below",
+        "active",
+        "since",
+        "last_timestamp",
+        "last_value",
+    )
+
+    def __init__(self, rule: Rule):
+        self.rule = rule
+        self.above = math.inf if rule.above is None else rule.above
+        self.below = -math.inf if rule.below is None else rule.below
+        self.clear_above = self.above - rule.hysteresis
+        self.clear_below = self.below + rule.hysteresis
+        self.active = False
+        self.since: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self.last_value = 0.0
+
+    def update(self, timestamp: float, value: float) -> Optional[float]:
+        """The evaluated value if the alarm changes state, else None."""
+        if self.rule.rate:
+            last_timestamp = self.last_timestamp
+            last_value = self.last_value
+            self.last_timestamp = timestamp
+            self.last_value = value
+            if last_timestamp is None or timestamp <= last_timestamp:
+                return None
+            value = (value - last_value) / (timestamp - last_timestamp)
+        if self.active:
+            changing = self.clear_below <= value <= self.clear_above
+        else:
+            changing = value > self.above or value < self.below
+        if not changing:
+            self.since = None
+            return None
+        if self.since is None:
+            self.since = timestamp
+        if timestamp - self.since < self.rule.debounce:
+            return None
+        self.active = not self.active
+        self.since = None
+        return value
+
+
+class _SignalRules:
+    """The rules on one signal of one board, with a fast path: while none of
+    them is active or pending and none watches the rate, a value inside
+    [low, high] cannot change anything and skips them all.
+    """
+
+    __slots__ = ("states", "low", "high", "quiet")
+
+    def __init__(self, rules: List[Rule]):
+        self.states = [_RuleState(rule) for rule in rules]
+        self.low = max((state.below for state in self.states), default=-math.inf)
+        self.high = min((state.above for state in self.states), default=math.inf)
+        self.quiet = not any(rule.rate for rule in rules)
+
+    def settle(self) -> None:
+        self.quiet = not any(
+            state.active or state.since is not None or state.rule.rate
+            for state in self.states
+        )
+
+
+class AlarmEngine:
+    """Evaluate rules on every sample as it is stored.
+
+    Rules are matched to a signal the first time it is seen on a board, so a
+    sample costs one dict lookup and, within limits, one range check,
+    however many rules there are. ``submit`` and ``submit_columns`` queue
+    stored batches for a thread of the engine's own, started on first use,
+    so the receiver's event loop never waits for rules or listeners. No
+    batch is ever skipped: a backlog of more than ``backlog_limit`` batches
+    raises the engine's own critical alarm on BACKLOG_KEY (board 0) instead,
+    cleared once it is down to half that. ``listeners`` are called with each
+    AlarmEvent on that thread. ``process`` evaluates on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[Rule] = DEFAULT_RULES,
+        history: int = 1000,
+        backlog_limit: int = 1024,
+    ):
+        self.rules: List[Rule] = list(rules)
+        self.events: Deque[AlarmEvent] = deque(maxlen=history)
+        # (board ID, key, rule name) -> the event that raised it
+        self.active: Dict[Tuple[int, str, str], AlarmEvent] = {}
+        self.listeners: List[Callable[[AlarmEvent], None]] = []
+        self.backlog_rule = Rule(
+            "alarm checks behind",
+            BACKLOG_KEY,
+            above=backlog_limit,
+            hysteresis=backlog_limit // 2,
+            severity="critical",
+        )
+        self._lagging = False
+        self._signals: Dict[int, Dict[str, _SignalRules]] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, frames: List[cu.Frame]) -> None:
+        self._submit(self.process, frames)
+
+    def submit_columns(
+        self, board_id: int, columns: Dict[str, Tuple[Sequence[float], Sequence]]
+    ) -> None:
+        self._submit(self.process_columns, board_id, columns)
+
+    def _submit(self, method: Callable, *args) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="alarm-engine", daemon=True
+            )
+            self._thread.start()
+        self._queue.put((method, args))
+
+    def close(self) -> None:
+        """Evaluate what is queued, then stop the thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            method, args = item
+            try:
+                method(*args)
+            except Exception as e:
+                print(f"Alarm evaluation error: {e!r}")
+            self._check_backlog()
+
+    def _check_backlog(self) -> None:
+        backlog = self._queue.qsize()
+        _BACKLOG.set(backlog)
+        rule = self.backlog_rule
+        if self._lagging:
+            lagging = backlog > rule.above - rule.hysteresis
+        else:
+            lagging = backlog > rule.above
+        if lagging != self._lagging:
+            self._lagging = lagging
+            self._publish(
+                AlarmEvent(time.time(), 0, BACKLOG_KEY, rule, backlog, lagging)
+            )
+
+    def _compile(self, board_id: int, key: str) -> _SignalRules:
+        signals = self._signals.get(board_id)
+        if signals is None:
+            signals = self._signals[board_id] = {}
+        rules = signals[key] = _SignalRules(
+            [rule for rule in self.rules if rule.matches(key)]
+        )
+        return rules
+
+    def process(self, frames: Iterable[cu.Frame]) -> None:
+        boards = self._signals
+        empty: Dict[str, _SignalRules] = {}
+        for timestamp, board_id, data in frames:
+            signals = boards.get(board_id, empty)
+            for key, value in data.items():
+                rules = signals.get(key)
+                if rules is None:
+                    rules = self._compile(board_id, key)
+                    signals = boards[board_id]
+                elif rules.quiet and rules.low <= value <= rules.high:
+                    continue
+                self._evaluate(rules, timestamp, board_id, key, value)
+
+    def process_columns(
+        self, board_id: int, columns: Dict[str, Tuple[Sequence[float], Sequence]]
+    ) -> None:
+        for key, (timestamps, values) in columns.items():
+            rules = self._signals.get(board_id, {}).get(key)
+            if rules is None:
+                rules = self._compile(board_id, key)
+            if not rules.states:
+                continue
+            for timestamp, value in zip(timestamps, values):
+                if not (rules.quiet and rules.low <= value <= rules.high):
+                    self._evaluate(rules, timestamp, board_id, key, value)
+
+    def _evaluate(
+        self,
+        rules: _SignalRules,
+        timestamp: float,
+        board_id: int,
+        key: str,
+        value: Union[int, float],
+    ) -> None:
+        for state in rules.states:
+            changed = state.update(timestamp, value)
+            if changed is not None:
+                self._emit(timestamp, board_id, key, state, changed)
+        rules.settle()
+
+    def _emit(
+        self, timestamp: float, board_id: int, key: str, state: _RuleState, value
+    ) -> None:
+        if state.active:
+            _DETECTION_SECONDS.observe(max(time.time() - timestamp, 0.0))
+        self._publish(
+            AlarmEvent(timestamp, board_id, key, state.rule, value, state.active)
+        )
+
+    def _publish(self, event: AlarmEvent) -> None:
+        self.events.append(event)
+        alarm = (event.board_id, event.key, event.rule.name)
+        if event.active:
+            self.active[alarm] = event
+            _RAISED.inc()
+        else:
+            self.active.pop(alarm, None)
+        for listener in self.listeners:
+            listener(event)
+
+
+def load_rules(path: str) -> List[Rule]:
+    """Rules from a JSON list of objects with Rule's fields."""
+    with open(path) as file:
+        items: List[Dict[str, Union[str, float, bool]]] = json.load(file)
+    try:
+        return [Rule(**item) for item in items]
+    except TypeError as e:
+        raise ValueError(f"{path}: {e}") from e
+
+
+class AlarmCSVWriter(session_log.LogWriter):
+    """One CSV row per alarm event, appended to ``path``."""
+
+    EXTENSION = ".csv"
+    HEADER = ("timestamp", "board", "key", "rule", "severity", "state", "value")
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        new_file = not os.path.exists(path)
+        self._file = open(path, mode="a", newline="")
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(self.HEADER)
+
+    def write(self, events: Sequence[AlarmEvent]) -> None:
+        self._writer.writerows(
+            (
+                f"{event.timestamp:.6f}",
+                event.board_id,
+                event.key,
+                event.rule.name,
+                event.rule.severity,
+                "active" if event.active else "cleared",
+                f"{event.value:g}",
+            )
+            for event in events
+        )
+
+
+class AlarmLog:
+    """AlarmEngine listener appending events to a CSV file.
+
+    Events go through a BackgroundLogWriter, so the alarm thread never waits
+    for the disk; each one is flushed as soon as it is written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = session_log.BackgroundLogWriter(
+            [AlarmCSVWriter(path)], flush_samples=1
+        )
+
+    def __call__(self, event: AlarmEvent) -> None:
+        self.writer.submit([event], count=1)
+
+    def close(self) -> None:
+        self.writer.close()
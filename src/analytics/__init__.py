@@ -0,0 +1,416 @@
+import math
+import struct
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import can_utils as cu
+import frame_schema
+
+
+class SpreadStats(NamedTuple):
+    """Statistics across the sensors of one kind (cells or thermistors)."""
+
+    count: int
+    mean: float
+    std: float
+    low: float
+    high: float
+    spread: float
+    z_scores: np.ndarray
+    outliers: List[int]
+
+
+class PackStats(NamedTuple):
+    timestamp: float
+    current: float
+    voltages: np.ndarray
+    temperatures: np.ndarray
+    cells: SpreadStats
+    thermistors: SpreadStats
+    # Per cell, over the rolling window; NaN where it cannot be estimated.
+    dv_dt: np.ndarray
+    resistance: np.ndarray
+
+
+def last_seen(values: np.ndarray) -> Optional[int]:
+    """Highest sensor ID with a reading, to size views to the pack."""
+    seen = np.flatnonzero(~np.isnan(values))
+    return int(seen[-1]) if seen.size else None
+
+
+def finite_range(values: np.ndarray) -> Tuple[float, float]:
+    """(min, max) over the readings present, NaN when there are none."""
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return float("nan"), float("nan")
+    return float(finite.min()), float(finite.max())
+
+
+def finite_mean(values: np.ndarray) -> float:
+    finite = values[np.isfinite(values)]
+    return float(finite.mean()) if finite.size else float("nan")
+
+
+def _spread(values: np.ndarray, outlier_z: float) -> SpreadStats:
+    seen = ~np.isnan(values)
+    count = int(seen.sum())
+    if not count:
+        nan = float("nan")
+        return SpreadStats(0, nan, nan, nan, nan, nan, np.full_like(values, nan), [])
+    present = values[seen]
+    mean = float(present.mean())
+    std = float(present.std())
+    low, high = float(present.min()), float(present.max())
+    z_scores = (values - mean) / std if std > 0 else np.where(seen, 0.0, np.nan)
+    outliers = np.flatnonzero(np.abs(np.nan_to_num(z_scores)) > outlier_z)
+    return SpreadStats(
+        count, mean, std, low, high, high - low, z_scores, outliers.tolist()
+    )
+
+
+def _slopes(ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """Least-squares slope of every column of ``ys`` against ``xs``."""
+    dx = xs - xs.mean()
+    variance = float(dx @ dx)
+    if variance <= 0:
+        return np.full(ys.shape[1], np.nan)
+    return dx @ (ys - ys.mean(axis=0)) / variance
+
+
+class PackAnalytics:
+    """Pack-level view of the cell and thermistor readings of one board.
+
+    The latest reading of every cell and thermistor lives in a vector indexed
+    by its ID. Cell voltages and pack current are also recorded as rows in a
+    rolling window of ``window`` seconds of sample time, one row per
+    ``resolution`` seconds holding the readings at the last sample in it, so
+    the window does not depend on how often ``update`` is called. All
+    statistics are computed on those arrays in bulk rather than per signal:
+    spread and z-score outliers from the latest vectors, dV/dt and internal
+    resistance (dV/dI, ohms, positive current charging) as per-cell
+    regressions over the window.
+    """
+
+    def __init__(
+        self,
+        window: float = 30.0,
+        resolution: float = 0.25,
+        outlier_z: float = 3.0,
+        min_current_swing: float = 1.0,
+    ):
+        self.window = window
+        self.resolution = resolution
+        self.capacity = math.ceil(window / resolution) + 1
+        self.outlier_z = outlier_z
+        self.min_current_swing = min_current_swing
+        self._cell_index: Dict[str, int] = {
+            key: index for index, key in enumerate(cu.CANParser.CELL_KEYS)
+        }
+        self._thrm_index: Dict[str, int] = {
+            key: index for index, key in enumerate(cu.CANParser.THRM_KEYS)
+        }
+        self.clear()
+
+    def clear(self) -> None:
+        cells = len(cu.CANParser.CELL_KEYS)
+        self.voltages = np.full(cells, np.nan)
+        self.temperatures = np.full(len(cu.CANParser.THRM_KEYS), np.nan)
+        self.current = float("nan")
+        self.timestamp = float("nan")
+        self._history_voltages = np.full((self.capacity, cells), np.nan)
+        self._history_currents = np.full(self.capacity, np.nan)
+        self._history_times = np.full(self.capacity, np.nan)
+        self._rows = 0
+        self._last_bin: Optional[float] = None
+
+    def update(self, new_samples: Mapping[str, cu.RingSnapshot]) -> bool:
+        """Fold in the samples returned by CANReceiver.read_since.
+
+        Returns True when any cell voltage or the pack current changed.
+        """
+        current_column = len(self.voltages)
+        times: List[float] = []
+        columns: List[int] = []
+        values: List[float] = []
+        for key, samples in new_samples.items():
+            if not samples.values:
+                continue
+            column = self._cell_index.get(key)
+            if column is None:
+                if key != cu.CANParser.KEY_BATTERY_CURRENT:
+                    index = self._thrm_index.get(key)
+                    if index is not None:
+                        self.temperatures[index] = samples.values[-1]
+                    continue
+                column = current_column
+            times += samples.timestamps
+            values += samples.values
+            columns += [column] * len(samples.values)
+        if not times:
+            return False
+        self._record(np.array(times), np.array(columns), np.array(values, dtype=float))
+        return True
+
+    def _record(
+        self, times: np.ndarray, columns: np.ndarray, values: np.ndarray
+    ) -> None:
+        """Apply readings in time order, adding one window row per time bin."""
+        order = np.argsort(times, kind="stable")
+        times, columns, values = times[order], columns[order], values[order]
+        bins = np.floor(times / self.resolution)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        ends = np.r_[starts[1:], times.size]
+        # Row 0 is the state before these readings, row i the state at the
+        # end of bin i; the last column is the current.
+        current_column = len(self.voltages)
+        rows = np.full((starts.size + 1, current_column + 1), np.nan)
+        rows[0, :current_column] = self.voltages
+        rows[0, current_column] = self.current
+        row_of = np.repeat(np.arange(1, starts.size + 1), ends - starts)
+        # The last reading of each column in each bin; what a bin does not
+        # update carries forward from the row before.
+        cells = row_of * (current_column + 1) + columns
+        _, last = np.unique(cells[::-1], return_index=True)
+        last = cells.size - 1 - last
+        rows[row_of[last], columns[last]] = values[last]
+        source = np.where(np.isnan(rows), 0, np.arange(len(rows))[:, None])
+        rows = rows[np.maximum.accumulate(source, axis=0), np.arange(rows.shape[1])]
+        rows = rows[1:]
+        self.voltages = rows[-1, :current_column].copy()
+        self.current = float(rows[-1, current_column])
+        self.timestamp = float(np.fmax(self.timestamp, times[-1]))
+
+        if bins[0] == self._last_bin:
+            self._rows -= 1  # the first bin continues the last row
+        self._last_bin = bins[-1]
+        keep = min(len(rows), self.capacity)
+        slots = (self._rows + np.arange(len(rows) - keep, len(rows))) % self.capacity
+        self._history_voltages[slots] = rows[-keep:, :current_column]
+        self._history_currents[slots] = rows[-keep:, current_column]
+        self._history_times[slots] = times[ends[-keep:] - 1]
+        self._rows += len(rows)
+
+    def stats(self) -> PackStats:
+        rows = min(self._rows, self.capacity)
+        times = self._history_times[:rows]
+        recent = times >= self.timestamp - self.window
+        voltages = self._history_voltages[:rows][recent]
+        currents = self._history_currents[:rows][recent]
+        times = times[recent]
+        rows = len(times)
+        nan = np.full_like(self.voltages, np.nan)
+
+        dv_dt = nan
+        resistance = nan
+        if rows >= 3:
+            dv_dt = _slopes(voltages, times)
+            valid = ~np.isnan(currents)
+            if valid.sum() >= 3 and np.ptp(currents[valid]) >= self.min_current_swing:
+                resistance = _slopes(voltages[valid], currents[valid])
+
+        return PackStats(
+            timestamp=self.timestamp,
+            current=self.current,
+            voltages=self.voltages.copy(),
+            temperatures=self.temperatures.copy(),
+            cells=_spread(self.voltages, self.outlier_z),
+            thermistors=_spread(self.temperatures, self.outlier_z),
+            dv_dt=dv_dt,
+            resistance=resistance,
+        )
+
+
+class PackedColumns(NamedTuple):
+    """Readings decoded from packed frames (e.g. 0x44xx/0x45xx), one row per
+    reading; ``ids`` index the schema's Packed.keys."""
+
+    timestamps: np.ndarray
+    boards: np.ndarray
+    ids: np.ndarray
+    values: np.ndarray
+
+    def by_sensor(self) -> Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]]:
+        """{(board, sensor ID): (timestamps, values)}, each in arrival order."""
+        order = np.lexsort((self.ids, self.boards))
+        boards, ids = self.boards[order], self.ids[order]
+        starts = np.flatnonzero(
+            np.r_[True, (boards[1:] != boards[:-1]) | (ids[1:] != ids[:-1])]
+        )
+        ends = np.r_[starts[1:], order.size]
+        return {
+            (int(boards[start]), int(ids[start])): (
+                self.timestamps[order[start:end]],
+                self.values[order[start:end]],
+            )
+            for start, end in zip(starts, ends)
+        }
+
+
+class SignalColumns(NamedTuple):
+    """One fixed-layout signal decoded from many frames, one row per frame."""
+
+    timestamps: np.ndarray
+    boards: np.ndarray
+    values: np.ndarray
+
+
+class FrameArrays(NamedTuple):
+    timestamps: np.ndarray
+    arbitration_ids: np.ndarray
+    payloads: np.ndarray  # (n, 8) uint8, zero padded
+    lengths: np.ndarray
+
+
+def frame_arrays(messages: Iterable) -> FrameArrays:
+    """Collect python-can messages (e.g. from can.LogReader) into arrays."""
+    timestamps = []
+    arbitration_ids = []
+    lengths = []
+    payloads = bytearray()
+    for message in messages:
+        if message.is_error_frame or message.is_remote_frame:
+            continue
+        data = bytes(message.data[:8])
+        timestamps.append(message.timestamp)
+        arbitration_ids.append(message.arbitration_id)
+        lengths.append(len(data))
+        payloads += data.ljust(8, b"\x00")
+    return FrameArrays(
+        np.array(timestamps, dtype=np.float64),
+        np.array(arbitration_ids, dtype=np.uint32),
+        np.frombuffer(bytes(payloads), dtype=np.uint8).reshape(-1, 8),
+        np.array(lengths, dtype=np.uint8),
+    )
+
+
+def _last_per_id(ids: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Mask keeping only the last valid word per ID within each frame.
+
+    Matches CANParser, whose per-frame dict lets a repeated ID overwrite.
+    """
+    keep = valid.copy()
+    words = ids.shape[1]
+    for earlier in range(words - 1):
+        for later in range(earlier + 1, words):
+            keep[:, earlier] &= (ids[:, earlier] != ids[:, later]) | ~valid[:, later]
+    return keep
+
+
+def _select(frames: FrameArrays, base_id: int, board_ids: cu.BoardIds) -> np.ndarray:
+    arbitration_ids = frames.arbitration_ids
+    selected = (arbitration_ids & ~np.uint32(cu.BOARD_ID_MASK)) == base_id
+    board_ids = cu.normalize_board_ids(board_ids)
+    if board_ids is not None:
+        selected &= np.isin(arbitration_ids & cu.BOARD_ID_MASK, board_ids)
+    return np.flatnonzero(selected)
+
+
+def _columns(
+    frames: FrameArrays,
+    rows: np.ndarray,
+    ids: np.ndarray,
+    keep: np.ndarray,
+    values: np.ndarray,
+) -> PackedColumns:
+    counts = keep.sum(axis=1)
+    boards = (frames.arbitration_ids[rows] & cu.BOARD_ID_MASK).astype(np.uint8)
+    if keep.all():  # no short or repeated words: skip the boolean gathers
+        ids, values = ids.ravel(), values.ravel()
+    else:
+        ids, values = ids[keep], values[keep]
+    return PackedColumns(
+        np.repeat(frames.timestamps[rows], counts),
+        np.repeat(boards, counts),
+        ids.astype(np.uint8),
+        values,
+    )
+
+
+def _decode_packed(
+    frames: FrameArrays, message: frame_schema.Message, board_ids: cu.BoardIds
+) -> PackedColumns:
+    packed = message.packed
+    dtype = np.dtype(packed.code)
+    words = frames.payloads.view(dtype)
+    rows = _select(frames, message.base_id, board_ids)
+    lengths = frames.lengths[rows]
+    if message.repeat:
+        whole = lengths % dtype.itemsize == 0
+        rows, lengths = rows[whole], lengths[whole]
+        words = words[rows]
+        valid = (
+            np.arange(words.shape[1])[None, :] < (lengths // dtype.itemsize)[:, None]
+        )
+    else:
+        size = struct.calcsize(message.format)
+        rows = rows[lengths >= size]
+        words = words[rows, : size // dtype.itemsize]
+        valid = np.ones(words.shape, dtype=bool)
+    ids = words >> packed.id_shift
+    keep = _last_per_id(ids, valid)
+    values = np.array(packed.values)[words & ((1 << packed.id_shift) - 1)]
+    return _columns(frames, rows, ids, keep, values)
+
+
+def decode_packed(
+    frames: FrameArrays,
+    board_ids: cu.BoardIds = None,
+    schema: Optional[frame_schema.Schema] = None,
+) -> Tuple[PackedColumns, ...]:
+    """Decode every packed frame at once, one PackedColumns per packed frame
+    type of ``schema`` in its order: (cells, thermistors) for the built-in one.
+
+    Uses the lookup tables CANParser's decoders use, so the values are the
+    same as parse_frame's frame by frame.
+    """
+    schema = schema or frame_schema.default_schema()
+    return tuple(
+        _decode_packed(frames, message, board_ids)
+        for message in schema.messages.values()
+        if message.packed
+    )
+
+
+def _round(values: np.ndarray, digits: int) -> np.ndarray:
+    """np.round, with Python's round for values within float error of half a
+    unit, where the two disagree (round() decides on the exact binary value)."""
+    rounded = np.round(values, digits)
+    scaled = values * 10.0**digits
+    near = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near.any():
+        rounded[near] = [round(value, digits) for value in values[near].tolist()]
+    return rounded
+
+
+def decode_fields(
+    frames: FrameArrays,
+    board_ids: cu.BoardIds = None,
+    schema: Optional[frame_schema.Schema] = None,
+) -> Dict[str, SignalColumns]:
+    """Decode every fixed-layout field of ``schema`` at once, by signal name.
+
+    The values are the same as parse_frame's frame by frame.
+    """
+    schema = schema or frame_schema.default_schema()
+    columns: Dict[str, SignalColumns] = {}
+    for message in schema.messages.values():
+        if message.packed:
+            continue
+        rows = _select(frames, message.base_id, board_ids)
+        rows = rows[frames.lengths[rows] >= struct.calcsize(message.format)]
+        timestamps = frames.timestamps[rows]
+        boards = (frames.arbitration_ids[rows] & cu.BOARD_ID_MASK).astype(np.uint8)
+        payloads = frames.payloads[rows]
+        for field in message.fields:
+            dtype = np.dtype(field.code)
+            end = field.start + dtype.itemsize
+            values = payloads[:, field.start : end].copy().view(dtype)[:, 0]
+            if field.scale is not None:
+                values = values * field.scale
+            if field.offset:
+                values = values + field.offset
+            if field.digits is not None:
+                values = _round(values, field.digits)
+            columns[field.name] = SignalColumns(timestamps, boards, values)
+    return columns
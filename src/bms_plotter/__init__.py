@@ -1,16 +1,31 @@
 import asyncio
-import csv
 import datetime
+import glob
 import os
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
 import flet as ft
 
 import can_utils as cu
+import frame_schema
 import layout
+import metrics
+
+if TYPE_CHECKING:
+    # Imported on first use (listening, logging, the Pack page) to keep the
+    # window's start-up to flet and the parser; python-can and numpy load then.
+    import alarms
+    import analytics
+    import capture
+    import fanout
+    import replay
+    import session_log
 
 
 class BatteryManagementApp:
+    # Recent alarm events listed on the Diagnostics page.
+    ALARM_ROWS = 50
+
     def __init__(self, page: ft.Page):
         self.page = page
         self.page.window.prevent_close = True
@@ -19,31 +34,130 @@ class BatteryManagementApp:
         self.items_mainpage: List[layout.Sheet] = []
         self.can_receiver: Optional[cu.CANReceiver] = None
 
+        # Slowest chart refresh, in seconds, however slow page.update() gets.
         self.sampling_rate = 2.0
-        self.last_chart_update_time = 0.0
 
         self.bus_name = "can0"
         self.bus_baudrate = 500000
-        self.device_id = 0x01
-        self.last_written_timestamp = None
+        self.device_ids: Optional[List[int]] = [0x01]
+        self.selected_board: Optional[int] = None
+        self.schema_file = ""
+        self.replay_file = ""
+        self.replay_speed = 1.0
+        self.replayer: Optional["replay.Replayer"] = None
+        self.capture: Optional["capture.MultiChannelCapture"] = None
+        # View another instance's stream instead of a bus (host:port or a Unix
+        # socket path), and/or publish this one's to other viewers.
+        self.fanout_source = ""
+        self.fanout_prefixes: List[str] = []
+        self.fanout_address = ""
+        self.fanout_client: Optional["fanout.FanoutClient"] = None
+        self.fanout_server: Optional["fanout.FanoutServer"] = None
+        # Alarm rules are checked by the receiver as samples are stored; the
+        # UI only shows the events (see render_alarms).
+        self.alarm_rules_file = ""
+        self.alarm_log: Optional["alarms.AlarmLog"] = None
+        # Stores samples injected by replay/capture; bus frames are stored by
+        # the receiver's own callbacks on this loop.
+        self.consumer_task: Optional[asyncio.Task] = None
+        self.reset_cursors()
+        self.log_cursors: Dict[int, cu.Cursor] = {}
+        # Points per chart sent to the client, roughly its width in pixels.
+        self.chart_points = 400
+        self.chart_series: Dict[str, layout.MinMaxSeries] = {}
+        self.chart_origin: Optional[float] = None
         self.stop_event = asyncio.Event()
 
-        self.start_time = datetime.datetime.now().timestamp()
+        self.start_time = self.log_start_time = datetime.datetime.now().timestamp()
         self.latest_data = {}
+        self.value_cards: Dict[str, layout.ValueCard] = {}
+        # Keys whose card or chart changed but has not been drawn yet, because
+        # its page was hidden or no frame has been rendered since.
+        self.stale_values: Set[str] = set()
+        self.stale_charts: Set[str] = set()
+        self.renderer = layout.RenderScheduler(page)
+        self.pack: Optional["analytics.PackAnalytics"] = None
+        self.pack_stale = False
         self.log_directory = "logs"
-        if not os.path.exists(self.log_directory):
-            os.makedirs(self.log_directory)
-        start_time_str = datetime.datetime.fromtimestamp(self.start_time).strftime(
-            "%Y-%m-%d-%H-%M-%S"
-        )
-        self.file_name = os.path.join(self.log_directory, f"{start_time_str}.csv")
+        self.log_formats = ["csv", "bmslog"]
+        self.log_writers: Dict[int, "session_log.BackgroundLogWriter"] = {}
+        self.session_reader: Optional["session_log.IndexedLogReader"] = None
+        self.session_charts: Dict[str, ft.LineChart] = {}
+        # A zoom window with at most this many samples per signal is drawn
+        # from the log itself, wider ones from the index summaries.
+        self.session_detail_samples = 20000
+        self.stage_seconds: Dict[str, metrics.Histogram] = {
+            stage: metrics.REGISTRY.histogram(
+                "bms_ui_stage_seconds", "Time spent per UI stage", stage=stage
+            )
+            for stage in (
+                "update_chart",
+                "update_log",
+                "update_table",
+                "update_pack",
+                "render",
+                "page_update",
+            )
+        }
+        self.schedulers = self.create_schedulers()
+        self.metrics_file = ""
+        self.metrics_interval = 10.0
+        self.metrics_exporter: Optional[metrics.PeriodicExporter] = None
         self.init_ui()
 
-    def close(self, e):
+    def create_schedulers(self) -> Dict[str, layout.AdaptiveScheduler]:
+        # Rendering, the value table and logging each run on their own
+        # cadence; see layout.AdaptiveScheduler.
+        schedulers = {
+            "render": layout.AdaptiveScheduler(
+                self.render_step, min_interval=0.05, max_interval=self.sampling_rate
+            ),
+            "table": layout.AdaptiveScheduler(
+                self.table_step, min_interval=0.1, max_interval=1.0
+            ),
+            "log": layout.AdaptiveScheduler(
+                self.log_step, min_interval=0.1, max_interval=1.0
+            ),
+            "diagnostics": layout.AdaptiveScheduler(
+                self.diagnostics_step, min_interval=0.25, max_interval=2.0
+            ),
+        }
+        for name, scheduler in schedulers.items():
+            metrics.REGISTRY.gauge(
+                "bms_ui_refresh_hz",
+                "Measured runs per second of each UI scheduler",
+                lambda scheduler=scheduler: scheduler.rate,
+                scheduler=name,
+            )
+        return schedulers
+
+    def reset_cursors(self):
+        """Read the selected board's buffers from the start again."""
+        self.chart_cursor: cu.Cursor = {}
+        self.table_cursor: cu.Cursor = {}
+        self.pack_cursor: cu.Cursor = {}
+
+    async def close(self, e):
         if e.data == "close":
             print("Close")
+            if self.replayer:
+                self.replayer.stop()
+            if self.capture:
+                self.capture.stop()
+            if self.fanout_client:
+                self.fanout_client.stop()
+            if self.fanout_server:
+                await self.fanout_server.stop()
             if self.can_receiver:
-                self.can_receiver.stop_receiving()
+                self.can_receiver.close()
+            if self.consumer_task:
+                self.consumer_task.cancel()
+            if self.alarm_log:
+                self.alarm_log.close()
+            for log_writer in self.log_writers.values():
+                log_writer.close()
+            if self.metrics_exporter:
+                self.metrics_exporter.stop()
             self.stop_event.set()
             self.page.window.destroy()
 
@@ -55,6 +169,17 @@ class BatteryManagementApp:
         self.content_setting = self.create_setting_page()
         self.content_detail = self.create_detail_page()
         self.content_general = self.create_general_page()
+        self.content_pack = self.create_pack_page()
+        self.content_sessions = self.create_sessions_page()
+        self.content_diagnostics = self.create_diagnostics_page()
+        self.pages = [
+            self.content_general,
+            self.content_detail,
+            self.content_pack,
+            self.content_sessions,
+            self.content_diagnostics,
+            self.content_setting,
+        ]
 
         self.main_container.content = self.content_general
 
@@ -96,6 +221,15 @@ class BatteryManagementApp:
                 ft.NavigationRailDestination(
                     icon=ft.icons.SPACE_DASHBOARD_OUTLINED, label="Detail"
                 ),
+                ft.NavigationRailDestination(
+                    icon=ft.icons.GRID_VIEW_OUTLINED, label="Pack"
+                ),
+                ft.NavigationRailDestination(
+                    icon=ft.icons.HISTORY_OUTLINED, label="Sessions"
+                ),
+                ft.NavigationRailDestination(
+                    icon=ft.icons.MONITOR_HEART_OUTLINED, label="Diagnostics"
+                ),
                 ft.NavigationRailDestination(
                     icon=ft.icons.SETTINGS_OUTLINED, label="Setting"
                 ),
@@ -103,9 +237,24 @@ class BatteryManagementApp:
         )
 
     def create_control_panel(self) -> ft.Container:
+        self.board_selector = ft.Dropdown(
+            label="Board",
+            options=[],
+            width=120,
+            dense=True,
+            on_change=self.select_board,
+        )
+        self.alarm_text = ft.Text(
+            "", color=ft.colors.RED_400, weight=ft.FontWeight.BOLD
+        )
+        # Problems the user should know about, e.g. a failing log writer.
+        self.status_text = ft.Text("", color=ft.colors.AMBER_400)
         return ft.Container(
             content=ft.Row(
                 [
+                    self.alarm_text,
+                    self.status_text,
+                    self.board_selector,
                     ft.OutlinedButton(
                         "Notify FULL",
                         icon="battery_charging_full",
@@ -144,11 +293,46 @@ class BatteryManagementApp:
         )
 
     async def update_task(self):
-        while not self.stop_event.is_set():
-            u1 = self.update_chart()
-            u2 = self.update_csv()
-            await asyncio.gather(u1, u2)
-            await asyncio.sleep(1.0)
+        await asyncio.gather(
+            *(scheduler.run(self.stop_event) for scheduler in self.schedulers.values())
+        )
+
+    async def render_step(self) -> bool:
+        """Charts and Pack; paced by how long page.update() takes, backing off
+        while no samples arrive and nothing is redrawn."""
+        stage_seconds = self.stage_seconds
+        with stage_seconds["update_chart"].time():
+            found_work = await self.update_chart()
+        with stage_seconds["update_pack"].time():
+            found_work = await self.update_pack() or found_work
+        with stage_seconds["render"].time():
+            self.render_charts()
+            self.render_pack()
+        with stage_seconds["page_update"].time():
+            return self.renderer.flush() or found_work
+
+    async def diagnostics_step(self) -> bool:
+        """The alarm and metrics tables; backs off while nothing changes."""
+        changed = self.render_alarms()
+        changed = self.render_diagnostics() or changed
+        self.renderer.flush()
+        return changed
+
+    async def table_step(self) -> bool:
+        with self.stage_seconds["update_table"].time():
+            changed = await self.update_table()
+        self.render_table()
+        self.renderer.flush()
+        return changed
+
+    async def log_step(self) -> bool:
+        """Hand new samples to the log writers; runs at the data rate."""
+        with self.stage_seconds["update_log"].time():
+            logged = await self.update_log()
+        self.update_metrics_export()
+        if self.capture and self.capture.error:
+            self.show_status(self.capture.error)
+        return logged
 
     def create_detail_page(self) -> ft.Control:
         self.items_mainpage.append(
@@ -207,9 +391,142 @@ class BatteryManagementApp:
             scroll=True,
         )
 
+    def create_pack_page(self) -> ft.Control:
+        self.pack_texts: Dict[str, ft.Text] = {
+            label: ft.Text("-", size=20, weight="bold")
+            for label in (
+                "Cells",
+                "Mean V",
+                "Spread mV",
+                "Std mV",
+                "Outliers",
+                "Max |dV/dt| mV/s",
+                "Mean IR mOhm",
+                "Temp spread",
+                "Hot spots",
+            )
+        }
+        self.cell_heatmap = layout.Heatmap("Cell voltage (V)")
+        self.zscore_heatmap = layout.Heatmap("Cell z-score")
+        self.resistance_heatmap = layout.Heatmap("Cell IR (mOhm)")
+        self.thrm_heatmap = layout.Heatmap("Thermistor temperature")
+        return ft.Column(
+            spacing=10,
+            expand=True,
+            scroll=True,
+            controls=[
+                ft.Row(
+                    [
+                        ft.Column([ft.Text(label, color="yellow"), text])
+                        for label, text in self.pack_texts.items()
+                    ],
+                    wrap=True,
+                    spacing=20,
+                ),
+                ft.Row(
+                    [
+                        self.cell_heatmap,
+                        self.zscore_heatmap,
+                        self.resistance_heatmap,
+                        self.thrm_heatmap,
+                    ],
+                    wrap=True,
+                    spacing=30,
+                    vertical_alignment=ft.CrossAxisAlignment.START,
+                ),
+            ],
+        )
+
+    def create_sessions_page(self) -> ft.Control:
+        self.session_selector = ft.Dropdown(
+            label="Session log",
+            options=[],
+            expand=True,
+            dense=True,
+            on_change=self.open_session,
+        )
+        self.session_signals = ft.TextField(
+            label="Signals (comma separated, a prefix like cell_id_ matches all)",
+            value=", ".join(
+                [
+                    cu.CANParser.KEY_BATTERY_VOLTAGE,
+                    cu.CANParser.KEY_BATTERY_CURRENT,
+                    cu.CANParser.KEY_SOC,
+                    cu.CANParser.KEY_MIN_CELL_VOLTAGE,
+                    cu.CANParser.KEY_MAX_CELL_VOLTAGE,
+                ]
+            ),
+            on_submit=self.zoom_session,
+        )
+        self.session_range = ft.RangeSlider(
+            start_value=0,
+            end_value=1,
+            min=0,
+            max=1,
+            disabled=True,
+            expand=True,
+            on_change_end=self.zoom_session,
+        )
+        self.session_info = ft.Text("")
+        self.session_graphs = self.create_graphs([], self.session_charts)
+        return ft.Column(
+            spacing=5,
+            expand=True,
+            scroll=True,
+            controls=[
+                ft.Row(
+                    [
+                        self.session_selector,
+                        ft.IconButton(ft.icons.REFRESH, on_click=self.list_sessions),
+                    ]
+                ),
+                self.session_signals,
+                ft.Row([self.session_range]),
+                self.session_info,
+                layout.Sheet("Session", None, self.session_graphs),
+            ],
+        )
+
+    def create_diagnostics_page(self) -> ft.Control:
+        self.diagnostics_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text(label), numeric=index > 1)
+                for index, label in enumerate(
+                    ["Metric", "Labels", "Value / count", "p50", "p95", "max"]
+                )
+            ],
+            rows=[],
+        )
+        self.alarms_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text(label), numeric=label == "Value")
+                for label in ("Time", "Board", "Signal", "Rule", "State", "Value")
+            ],
+            rows=[],
+        )
+        # Cell texts by metric, and the engine and newest event the alarm
+        # rows come from, so a refresh only touches what changed.
+        self.diagnostics_cells: Dict[Tuple[str, metrics.Labels], List[ft.Text]] = {}
+        self.alarms_shown: Optional["alarms.AlarmEngine"] = None
+        self.newest_alarm: Optional["alarms.AlarmEvent"] = None
+        return ft.Column(
+            spacing=5,
+            expand=True,
+            scroll=True,
+            controls=[
+                ft.Text("Alarms", weight=ft.FontWeight.BOLD),
+                self.alarms_table,
+                ft.Text("Metrics", weight=ft.FontWeight.BOLD),
+                self.diagnostics_table,
+            ],
+        )
+
     def handle_chart_visibility(self, e: ft.ControlEvent, key: str):
         if key in self.line_charts:
             self.line_charts[key].visible = e.control.value
+            self.render_charts()
+            self.renderer.mark(self.line_charts[key])
+            self.renderer.flush()
 
     def update_visibility_checkboxes(self):
         checkboxes = [
@@ -229,9 +546,8 @@ class BatteryManagementApp:
         for control in self.content_setting.controls:
             if isinstance(control, ft.Card):
                 control.content = checkbox_grid
+                self.renderer.mark(control)
                 break
-        print(self.line_charts)
-        self.page.update()
 
     def create_setting_page(self) -> ft.Control:
         return ft.Column(
@@ -240,7 +556,7 @@ class BatteryManagementApp:
             scroll=True,
             controls=[
                 ft.TextField(
-                    label="CAN bus Name",
+                    label="CAN bus Name (comma separated = one process per bus)",
                     value=self.bus_name,
                     on_change=lambda e: setattr(self, "bus_name", e.control.value),
                 ),
@@ -252,17 +568,75 @@ class BatteryManagementApp:
                     ),
                 ),
                 ft.TextField(
-                    label="BMS Can Device ID (decimal)",
-                    value=str(self.device_id),
+                    label="BMS Can Device IDs (decimal, comma separated, empty = all)",
+                    value=", ".join(
+                        str(board_id) for board_id in self.device_ids or []
+                    ),
                     on_change=lambda e: setattr(
-                        self, "device_id", int(e.control.value)
+                        self, "device_ids", parse_board_ids(e.control.value)
                     ),
                 ),
                 ft.TextField(
-                    label="Sampling Rate (seconds)",
+                    label="Slowest Chart Refresh (seconds)",
                     value=str(self.sampling_rate),
+                    on_change=self.set_sampling_rate,
+                ),
+                ft.TextField(
+                    label="Replay File (session log or candump/ASC/BLF, empty = live)",
+                    value=self.replay_file,
+                    on_change=lambda e: setattr(self, "replay_file", e.control.value),
+                ),
+                ft.TextField(
+                    label="Replay Speed (x real time, 0 = as fast as possible)",
+                    value=str(self.replay_speed),
+                    on_change=lambda e: setattr(
+                        self, "replay_speed", float(e.control.value)
+                    ),
+                ),
+                ft.TextField(
+                    label="View Fan-out Server (host:port or socket path, empty = bus)",
+                    value=self.fanout_source,
+                    on_change=lambda e: setattr(self, "fanout_source", e.control.value),
+                ),
+                ft.TextField(
+                    label="Fan-out Subscription (signal prefixes, e.g. cell_id_, "
+                    "empty = all)",
+                    value=", ".join(self.fanout_prefixes),
+                    on_change=lambda e: setattr(
+                        self,
+                        "fanout_prefixes",
+                        [p.strip() for p in e.control.value.split(",") if p.strip()],
+                    ),
+                ),
+                ft.TextField(
+                    label="Serve Viewers On (host:port or socket path, empty = off)",
+                    value=self.fanout_address,
+                    on_change=lambda e: setattr(
+                        self, "fanout_address", e.control.value
+                    ),
+                ),
+                ft.TextField(
+                    label="Frame Schema File (JSON, empty = built-in layout)",
+                    value=self.schema_file,
+                    on_change=lambda e: setattr(self, "schema_file", e.control.value),
+                ),
+                ft.TextField(
+                    label="Alarm Rules File (JSON, empty = built-in limits)",
+                    value=self.alarm_rules_file,
+                    on_change=lambda e: setattr(
+                        self, "alarm_rules_file", e.control.value
+                    ),
+                ),
+                ft.TextField(
+                    label="Metrics File (.json, or .prom for Prometheus; empty = off)",
+                    value=self.metrics_file,
+                    on_change=lambda e: setattr(self, "metrics_file", e.control.value),
+                ),
+                ft.TextField(
+                    label="Metrics Export Interval (seconds)",
+                    value=str(self.metrics_interval),
                     on_change=lambda e: setattr(
-                        self, "sampling_rate", float(e.control.value)
+                        self, "metrics_interval", float(e.control.value)
                     ),
                 ),
                 ft.Card(
@@ -274,12 +648,15 @@ class BatteryManagementApp:
             ],
         )
 
-    def create_graphs(self, chart_keys: List[str]) -> ft.Control:
+    def create_graphs(
+        self, chart_keys: List[str], charts: Optional[Dict[str, ft.LineChart]] = None
+    ) -> ft.GridView:
+        charts = self.line_charts if charts is None else charts
         controls = []
         for key in chart_keys:
-            if key not in self.line_charts:
-                self.line_charts[key] = self.create_chart(key)
-            controls.append(self.line_charts[key])
+            if key not in charts:
+                charts[key] = self.create_chart(key)
+            controls.append(charts[key])
         return ft.GridView(
             auto_scroll=True,
             runs_count=1,
@@ -319,175 +696,660 @@ class BatteryManagementApp:
         return chart
 
     def handle_navigation(self, e: ft.ControlEvent):
-        page_num = e.control.selected_index
-        if page_num == 0:
-            self.main_container.content = self.content_general
-        elif page_num == 1:
-            self.main_container.content = self.content_detail
-        elif page_num == 2:
-            self.main_container.content = self.content_setting
-        self.page.update()
+        self.main_container.content = self.pages[e.control.selected_index]
+        if self.main_container.content is self.content_sessions:
+            self.list_sessions(e)
+        self.render_charts()
+        self.render_table()
+        self.render_pack()
+        self.render_diagnostics()
+        self.render_alarms()
+        self.renderer.mark(self.main_container)
+        self.renderer.flush()
 
-    def callback_full_recharge(self, e: ft.ControlEvent):
+    async def callback_full_recharge(self, e: ft.ControlEvent):
         if self.can_receiver:
-            asyncio.run(self.can_receiver.notice_full_recharge())
+            await self.can_receiver.notice_full_recharge(self.selected_board)
 
-    def start_listen(self, e: ft.ControlEvent):
+    async def select_board(self, e: ft.ControlEvent):
+        self.selected_board = int(e.control.value)
+        self.reset_cursors()
+        self.latest_data = {}
+        if self.pack:
+            self.pack.clear()
+        self.value_cards.clear()
+        self.stale_values.clear()
+        self.data_grid_view.controls.clear()
+        self.clear_data(e)
+
+    def update_board_selector(self):
+        board_ids = self.can_receiver.board_ids
+        if len(board_ids) == len(self.board_selector.options):
+            return
+        self.board_selector.options = [
+            ft.dropdown.Option(str(board_id)) for board_id in board_ids
+        ]
+        if self.selected_board is None and board_ids:
+            self.selected_board = self.can_receiver.primary_board
+        self.board_selector.value = str(self.selected_board)
+        self.renderer.mark(self.board_selector)
+
+    async def start_listen(self, e: ft.ControlEvent):
         self.start_time = datetime.datetime.now().timestamp()
         if not self.can_receiver:
-            self.can_receiver = cu.CANReceiver(
-                channel=self.bus_name,
+            import analytics
+
+            # Each listening session logs to files of its own.
+            self.log_start_time = self.start_time
+
+            if self.fanout_source:
+                import fanout
+
+                self.can_receiver = cu.CANReceiver(
+                    channel=self.fanout_source, bms_id=self.device_ids
+                )
+                self.fanout_client = fanout.FanoutClient(
+                    self.can_receiver, self.fanout_source, self.fanout_prefixes
+                )
+                try:
+                    await self.fanout_client.start()
+                except (OSError, ValueError) as error:
+                    self.show_status(f"Fan-out connect error: {error}")
+                    self.fanout_client = None
+                    self.can_receiver = None
+                    return
+            elif self.replay_file:
+                import replay
+
+                self.can_receiver = cu.CANReceiver(
+                    channel="replay", bms_id=self.device_ids, interface="virtual"
+                )
+                self.replayer = replay.Replayer(
+                    self.replay_file, self.can_receiver, speed=self.replay_speed
+                )
+            elif "," in self.bus_name:
+                # Boards of the Nth bus show up as N * 256 + board ID.
+                self.can_receiver = cu.CANReceiver(
+                    channel=self.bus_name, bms_id=self.device_ids
+                )
+                self.capture = self.create_capture()
+            else:
+                self.can_receiver = cu.CANReceiver(
+                    channel=self.bus_name,
+                    bitrate=self.bus_baudrate,
+                    bms_id=self.device_ids,
+                )
+            self.configure_receiver()
+            self.reset_cursors()
+            self.log_cursors = {}
+            self.pack = analytics.PackAnalytics()
+            self.selected_board = None
+            self.board_selector.options = []
+            if self.capture:
+                self.capture.start()
+            elif not self.fanout_client:
+                self.can_receiver.start_receiving()
+            if self.replayer:
+                self.replayer.start()
+            if self.fanout_address and not self.fanout_client:
+                import fanout
+
+                self.fanout_server = fanout.FanoutServer(
+                    self.can_receiver, self.fanout_address
+                )
+                try:
+                    await self.fanout_server.start()
+                except OSError as error:
+                    self.show_status(f"Fan-out serve error: {error}")
+                    self.fanout_server = None
+            self.consumer_task = asyncio.create_task(
+                self.can_receiver.process_messages(self.stop_event)
+            )
+
+    def create_capture(self) -> "capture.MultiChannelCapture":
+        """One process per comma-separated bus, decoding with the schema from
+        Settings like the receiver does."""
+        import capture
+
+        configs = [
+            capture.ChannelConfig(
+                channel.strip(),
                 bitrate=self.bus_baudrate,
-                bms_id=self.device_id,
+                bms_id=self.device_ids,
+                schema_path=self.schema_file,
             )
-            self.can_receiver.start_receiving()
-            asyncio.run(self.can_receiver.process_messages(self.stop_event))
+            for channel in self.bus_name.split(",")
+            if channel.strip()
+        ]
+        try:
+            return capture.MultiChannelCapture(self.can_receiver, configs)
+        except (OSError, ValueError) as error:
+            self.show_status(f"Frame schema error, using the built-in layout: {error}")
+            configs = [config._replace(schema_path="") for config in configs]
+            return capture.MultiChannelCapture(self.can_receiver, configs)
 
-    def stop_listen(self, e: ft.ControlEvent):
+    async def stop_listen(self, e: ft.ControlEvent):
         self.clear_data(e)
+        if self.fanout_client:
+            self.fanout_client.stop()
+            self.fanout_client = None
+        if self.fanout_server:
+            await self.fanout_server.stop()
+            self.fanout_server = None
+        if self.replayer:
+            self.replayer.stop()
+            self.replayer = None
+        if self.capture:
+            self.capture.stop()
+            self.capture = None
         if self.can_receiver:
-            self.can_receiver.stop_receiving()
+            self.can_receiver.close()
+            await self.update_log()  # what arrived since the last log step
             self.can_receiver = None
+        if self.consumer_task:
+            self.consumer_task.cancel()
+            self.consumer_task = None
+        # After the receiver, which finishes its alarm checks first.
+        if self.alarm_log:
+            self.alarm_log.close()
+            self.alarm_log = None
+        for log_writer in self.log_writers.values():
+            log_writer.close()
+        self.log_writers.clear()
 
-    async def update_chart(self):
-        if not self.can_receiver:
-            return
+    def configure_receiver(self):
+        """Apply the frame schema and alarm rules from Settings."""
+        if self.schema_file:
+            try:
+                self.can_receiver.use_schema(frame_schema.load(self.schema_file))
+            except (OSError, ValueError) as error:
+                self.show_status(
+                    f"Frame schema error, using the built-in layout: {error}"
+                )
+        self.can_receiver.alarms = self.create_alarm_engine()
 
-        current_time = datetime.datetime.now().timestamp() - self.start_time
+    def create_alarm_engine(self) -> "alarms.AlarmEngine":
+        import alarms
 
-        if current_time - self.last_chart_update_time < self.sampling_rate:
+        rules = alarms.DEFAULT_RULES
+        if self.alarm_rules_file:
+            try:
+                rules = alarms.load_rules(self.alarm_rules_file)
+            except (OSError, ValueError) as error:
+                self.show_status(f"Alarm rules error, using built-in limits: {error}")
+        engine = alarms.AlarmEngine(rules)
+        start_time_str = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        self.alarm_log = alarms.AlarmLog(
+            os.path.join(self.log_directory, f"{start_time_str}-alarms.csv")
+        )
+        # Listeners run on the engine's thread; the banner is updated on this
+        # loop and drawn with the next flush.
+        loop = asyncio.get_running_loop()
+        engine.listeners += [
+            self.alarm_log,
+            lambda event: loop.call_soon_threadsafe(self.on_alarm, event),
+        ]
+        return engine
+
+    def on_alarm(self, event: "alarms.AlarmEvent"):
+        print(event.describe())
+        if not self.can_receiver or not self.can_receiver.alarms:
             return
+        active = list(self.can_receiver.alarms.active.values())
+        if active:
+            latest = max(active, key=lambda event: event.timestamp)
+            more = f" (+{len(active) - 1} more)" if len(active) > 1 else ""
+            self.alarm_text.value = latest.describe() + more
+        else:
+            self.alarm_text.value = ""
+        self.renderer.mark(self.alarm_text)
 
-        self.last_chart_update_time = current_time
+    def render_alarms(self) -> bool:
+        """Add new alarm events to the top of the Diagnostics table; False if
+        there were none or the page is not shown."""
+        if self.main_container.content is not self.content_diagnostics:
+            return False
+        engine = self.can_receiver.alarms if self.can_receiver else None
+        if engine is None:
+            return False
+        if engine is not self.alarms_shown:
+            self.alarms_shown, self.newest_alarm = engine, None
+            self.alarms_table.rows = []
+        new_events = []
+        for event in reversed(list(engine.events)):
+            if event is self.newest_alarm or len(new_events) == self.ALARM_ROWS:
+                break
+            new_events.append(event)
+        if not new_events:
+            return False
+        self.newest_alarm = new_events[0]
+        rows = [
+            ft.DataRow(
+                cells=[
+                    ft.DataCell(ft.Text(text))
+                    for text in (
+                        datetime.datetime.fromtimestamp(event.timestamp).strftime(
+                            "%H:%M:%S.%f"
+                        )[:-3],
+                        str(event.board_id),
+                        event.key,
+                        f"{event.rule.name} ({event.rule.severity})",
+                        "active" if event.active else "cleared",
+                        f"{event.value:g}",
+                    )
+                ]
+            )
+            for event in new_events
+        ]
+        self.alarms_table.rows = (rows + self.alarms_table.rows)[: self.ALARM_ROWS]
+        self.renderer.mark(self.alarms_table)
+        return True
 
-        data_points = await self.can_receiver.get_data_points()
+    def set_sampling_rate(self, e: ft.ControlEvent):
+        self.sampling_rate = float(e.control.value)
+        self.schedulers["render"].max_interval = self.sampling_rate
 
-        if not data_points:
-            return
+    async def update_chart(self) -> bool:
+        if not self.can_receiver:
+            return False
 
-        for key, data in data_points.items():
-            if key in self.line_charts:
-                if not self.line_charts[key].data_series:
-                    self.line_charts[key].data_series.append(
-                        ft.LineChartData(data_points=[])
-                    )
-                self.line_charts[key].data_series[0].data_points.append(
-                    ft.LineChartDataPoint(x=current_time, y=data[-1][1])
-                )
-                self.line_charts[key].min_x = -1
-                self.line_charts[key].max_x = max(current_time + 1, 10)
-                values = [point[1] for point in data]
-                self.line_charts[key].min_y = min(values) - 1
-                self.line_charts[key].max_y = max(values) * 1.1
-            else:
-                self.line_charts[key] = self.create_chart(key)
+        new_samples, self.chart_cursor = await self.can_receiver.read_since(
+            self.chart_cursor, self.selected_board
+        )
+
+        if not new_samples:
+            return False
+
+        if self.chart_origin is None:
+            self.chart_origin = min(
+                samples.timestamps[0] for samples in new_samples.values()
+            )
+        origin = self.chart_origin
+
+        for key, samples in new_samples.items():
+            if key not in self.line_charts:
+                chart = self.line_charts[key] = self.create_chart(key)
                 self.update_visibility_checkboxes()
                 for item in self.items_mainpage:
-                    item.update_content(key, self.line_charts[key])
+                    item.update_content(key, chart)
+                    if chart in item.content.controls:
+                        self.renderer.mark(item.content)
+            series = self.chart_series.get(key)
+            if series is None:
+                series = self.chart_series[key] = layout.MinMaxSeries(self.chart_points)
+            series.extend(
+                [timestamp - origin for timestamp in samples.timestamps],
+                samples.values,
+            )
+            self.stale_charts.add(key)
+        return True
 
-        self.page.update()
+    def render_charts(self):
+        """Push pending series changes into the charts that are on screen."""
+        if self.main_container.content is not self.content_detail:
+            return
+        for key in list(self.stale_charts):
+            chart = self.line_charts[key]
+            series = self.chart_series.get(key)
+            if not chart.visible:
+                continue
+            self.stale_charts.discard(key)
+            if series is None:
+                continue
+            if not chart.data_series:
+                chart.data_series.append(ft.LineChartData(data_points=[]))
+            start, points = series.changes()
+            data_points = chart.data_series[0].data_points
+            del data_points[start:]
+            data_points.extend(ft.LineChartDataPoint(x=x, y=y) for x, y in points)
+            chart.min_x = -1
+            chart.max_x = max(series.last_x + 1, 10)
+            chart.min_y = series.low - 1
+            chart.max_y = series.high * 1.1
+            self.renderer.mark(chart)
 
-    async def update_csv(self):
+    async def update_log(self) -> bool:
         if not self.can_receiver:
-            return
+            return False
 
-        data_points = await self.can_receiver.get_data_points()
-        if not data_points:
+        import session_log
+
+        logged = False
+        for board_id in self.can_receiver.board_ids:
+            cursor = self.log_cursors.get(board_id)
+            new_samples, cursor = await self.can_receiver.read_since(cursor, board_id)
+            self.log_cursors[board_id] = cursor
+            if not new_samples:
+                continue
+
+            new_data = {
+                key: list(zip(samples.timestamps, samples.values))
+                for key, samples in new_samples.items()
+            }
+            log_writer = self.log_writers.get(board_id)
+            if log_writer is None:
+                log_writer = self.log_writers[board_id] = (
+                    session_log.BackgroundLogWriter(self.open_log_writers(board_id))
+                )
+            if not log_writer.submit(new_data):
+                self.show_status(f"Log writer falling behind: {log_writer.stats()}")
+            if log_writer.error:
+                self.show_status(log_writer.error)
+            logged = True
+        return logged
+
+    def show_status(self, message: str):
+        if self.status_text.value != message:
+            self.status_text.value = message
+            self.renderer.mark(self.status_text)
+
+    def open_log_writers(self, board_id: int) -> List["session_log.LogWriter"]:
+        import session_log
+
+        start_time_str = datetime.datetime.fromtimestamp(self.log_start_time).strftime(
+            "%Y-%m-%d-%H-%M-%S"
+        )
+        basename = os.path.join(self.log_directory, f"{start_time_str}-bms{board_id}")
+        return [
+            session_log.create_writer(log_format, basename)
+            for log_format in self.log_formats
+        ]
+
+    async def update_table(self) -> bool:
+        if not self.can_receiver:
+            return False
+
+        self.update_board_selector()
+        new_samples, self.table_cursor = await self.can_receiver.read_since(
+            self.table_cursor, self.selected_board
+        )
+        if not new_samples:
+            return False
+
+        for key, samples in new_samples.items():
+            self.latest_data[key] = samples.values[-1]
+            self.stale_values.add(key)
+        return True
+
+    def render_table(self):
+        """Refresh the value cards that changed, if the table is on screen."""
+        if self.main_container.content is not self.content_general:
             return
+        for key in self.stale_values:
+            value = self.latest_data[key]
+            card = self.value_cards.get(key)
+            if card is None:
+                card = self.value_cards[key] = layout.ValueCard(key, value)
+                self.data_grid_view.controls.append(card)
+                self.renderer.mark(self.data_grid_view)
+            elif card.set_value(value):
+                self.renderer.mark(card.value_text)
+        self.stale_values.clear()
 
-        new_data = {}
-        for key, key_data in data_points.items():
-            new_data[key] = [
-                (timestamp, value)
-                for timestamp, value in key_data
-                if self.last_written_timestamp is None
-                or timestamp > self.last_written_timestamp
-            ]
+    async def update_pack(self) -> bool:
+        if not self.can_receiver or not self.pack:
+            return False
 
-        if not any(new_data.values()):
+        new_samples, self.pack_cursor = await self.can_receiver.read_since(
+            self.pack_cursor, self.selected_board
+        )
+        if not new_samples:
+            return False
+        self.pack.update(new_samples)
+        self.pack_stale = True
+        return True
+
+    def render_pack(self):
+        """Recompute the pack statistics and redraw the Pack page if shown."""
+        if self.main_container.content is not self.content_pack or not self.pack_stale:
             return
+        import analytics
 
-        for key, key_data in new_data.items():
-            if key_data:
-                latest_data_point = key_data[-1][1]
-                self.latest_data[key] = latest_data_point
+        self.pack_stale = False
+        stats = self.pack.stats()
+        cells = analytics.last_seen(stats.voltages)
+        thermistors = analytics.last_seen(stats.temperatures)
+        cell_count = 0 if cells is None else cells + 1
+        thrm_count = 0 if thermistors is None else thermistors + 1
+        resistance = stats.resistance[:cell_count] * 1e3
 
-        self.update_data_table()
+        changed: List[ft.Control] = []
+        for heatmap, values, (low, high) in (
+            (
+                self.cell_heatmap,
+                stats.voltages[:cell_count],
+                (stats.cells.low, stats.cells.high),
+            ),
+            (
+                self.zscore_heatmap,
+                stats.cells.z_scores[:cell_count],
+                (-self.pack.outlier_z, self.pack.outlier_z),
+            ),
+            (self.resistance_heatmap, resistance, analytics.finite_range(resistance)),
+            (
+                self.thrm_heatmap,
+                stats.temperatures[:thrm_count],
+                (stats.thermistors.low, stats.thermistors.high),
+            ),
+        ):
+            if heatmap.resize(len(values)):
+                changed.append(heatmap.grid)
+            changed += heatmap.set_values(values.tolist(), low, high)
 
-        file_exists = os.path.exists(self.file_name)
-        if not file_exists:
-            headers = ["timestamp"] + list(data_points.keys())
-            with open(self.file_name, mode="w", newline="") as csv_file:
-                csv_writer = csv.writer(csv_file)
-                csv_writer.writerow(headers)
+        dv_dt = analytics.finite_range(stats.dv_dt[:cell_count] * 1e3)
+        texts = {
+            "Cells": str(stats.cells.count),
+            "Mean V": f"{stats.cells.mean:.3f}",
+            "Spread mV": f"{stats.cells.spread * 1e3:.0f}",
+            "Std mV": f"{stats.cells.std * 1e3:.1f}",
+            "Outliers": ", ".join(map(str, stats.cells.outliers)) or "none",
+            "Max |dV/dt| mV/s": f"{max(abs(dv_dt[0]), abs(dv_dt[1])):.2f}",
+            "Mean IR mOhm": f"{analytics.finite_mean(resistance):.2f}",
+            "Temp spread": f"{stats.thermistors.spread:.0f}",
+            "Hot spots": ", ".join(map(str, stats.thermistors.outliers)) or "none",
+        }
+        for label, value in texts.items():
+            text = self.pack_texts[label]
+            if text.value != value:
+                text.value = value
+                changed.append(text)
+        for control in changed:
+            self.renderer.mark(control)
 
-        with open(self.file_name, mode="a", newline="") as csv_file:
-            csv_writer = csv.writer(csv_file)
-            all_new_timestamps = sorted(
-                set(t for key_data in new_data.values() for t, _ in key_data)
-            )
+    def list_sessions(self, e: ft.ControlEvent):
+        import session_log
 
-            for timestamp in all_new_timestamps:
-                row = [timestamp]
-                for key in data_points.keys():
-                    value = next((v for t, v in new_data[key] if t == timestamp), "")
-                    row.append(value)
-                csv_writer.writerow(row)
-        self.last_written_timestamp = max(all_new_timestamps)
+        paths = sorted(
+            glob.glob(
+                os.path.join(
+                    self.log_directory, "*" + session_log.ColumnarLogWriter.EXTENSION
+                )
+            ),
+            reverse=True,
+        )
+        options = [
+            ft.dropdown.Option(key=path, text=os.path.basename(path)) for path in paths
+        ]
+        if [option.key for option in options] != [
+            option.key for option in self.session_selector.options
+        ]:
+            self.session_selector.options = options
+            self.renderer.mark(self.session_selector)
+        if self.session_reader and self.session_reader.refresh():
+            self.session_range.max = self.session_duration()
+            self.renderer.mark(self.session_range)
+        self.renderer.flush()
 
-    def update_data_table(self):
-        grid_controls = []
+    def session_duration(self) -> float:
+        return max(self.session_reader.end - self.session_reader.start, 1.0)
 
-        for key, value in self.latest_data.items():
-            grid_controls.append(
-                ft.Card(
-                    content=ft.Container(
-                        content=ft.Column(
-                            [
-                                ft.Text(
-                                    key,
-                                    size=24,
-                                    color="yellow",
-                                    weight="bold",
-                                    text_align=ft.TextAlign.CENTER,
-                                ),
-                                ft.Text(
-                                    str(value),
-                                    size=36,
-                                    color="white",
-                                    weight="bold",
-                                    text_align=ft.TextAlign.CENTER,
-                                ),
-                            ],
-                            spacing=1,
-                            alignment=ft.MainAxisAlignment.CENTER,
-                            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                        ),
-                        padding=1,
-                        bgcolor=ft.colors.BLACK,
-                        border_radius=12,
-                        alignment=ft.alignment.center,
+    def open_session(self, e: ft.ControlEvent):
+        import session_log
+
+        try:
+            self.session_reader = session_log.IndexedLogReader(e.control.value)
+        except (OSError, ValueError) as error:
+            self.show_status(f"Session open error: {error}")
+            self.session_reader = None
+            self.session_info.value = str(error)
+            self.session_range.disabled = True
+            self.renderer.mark(self.session_info)
+            self.renderer.mark(self.session_range)
+            self.renderer.flush()
+            return
+        if self.session_reader.start is None:
+            self.session_reader = None
+            self.session_info.value = "Empty session log"
+            self.session_range.disabled = True
+            self.renderer.mark(self.session_info)
+            self.renderer.mark(self.session_range)
+            self.renderer.flush()
+            return
+        self.session_range.disabled = False
+        self.session_range.max = self.session_duration()
+        self.session_range.start_value = 0
+        self.session_range.end_value = self.session_range.max
+        self.zoom_session(e)
+
+    def session_keys(self) -> List[str]:
+        patterns = [
+            pattern.strip()
+            for pattern in (self.session_signals.value or "").split(",")
+            if pattern.strip()
+        ]
+        return [
+            key
+            for key in self.session_reader.keys
+            if any(key.startswith(pattern) for pattern in patterns)
+        ]
+
+    def zoom_session(self, e: ft.ControlEvent):
+        """Draw the selected window of the open session: raw samples when it is
+        small enough, otherwise the min/max summaries from the index."""
+        reader = self.session_reader
+        if reader is None:
+            return
+        origin = reader.start
+        start = origin + self.session_range.start_value
+        end = origin + self.session_range.end_value
+        keys = self.session_keys()
+        overview = reader.overview(start, end, keys, self.chart_points // 2)
+        samples = max((sum(summary.count) for summary in overview.values()), default=0)
+        detail = samples <= self.session_detail_samples
+        columns = reader.read(start, end, keys) if detail and overview else {}
+
+        graphs = self.session_graphs
+        graphs.controls = []
+        for key in keys:
+            series = layout.MinMaxSeries(self.chart_points)
+            if detail and key in columns:
+                timestamps, values = columns[key]
+                series.extend([timestamp - origin for timestamp in timestamps], values)
+            elif key in overview:
+                summary = overview[key]
+                xs: List[float] = []
+                ys: List[float] = []
+                for bucket in zip(
+                    summary.start, summary.end, summary.low, summary.high
+                ):
+                    xs += (bucket[0] - origin, bucket[1] - origin)
+                    ys += bucket[2:]
+                series.extend(xs, ys)
+            if not len(series):
+                continue
+            chart = self.session_charts.get(key)
+            if chart is None:
+                chart = self.session_charts[key] = self.create_chart(key)
+            chart.data_series = [
+                ft.LineChartData(
+                    data_points=[
+                        ft.LineChartDataPoint(x=x, y=y) for x, y in series.points()
+                    ]
+                )
+            ]
+            chart.min_x = series.first_x
+            chart.max_x = max(series.last_x, series.first_x + 1)
+            chart.min_y = series.low - 1
+            chart.max_y = series.high * 1.1
+            graphs.controls.append(chart)
+
+        self.session_info.value = (
+            f"{os.path.basename(reader.path)}: {self.session_duration() / 3600:.2f} h,"
+            f" {len(reader.blocks)} chunks, showing {start - origin:.0f}-"
+            f"{end - origin:.0f} s from {'samples' if detail else 'summaries'}"
+        )
+        for control in (self.session_range, self.session_info, graphs):
+            self.renderer.mark(control)
+        self.renderer.flush()
+
+    def render_diagnostics(self) -> bool:
+        """Update the metrics table cells that changed; False if none did or
+        the page is not shown."""
+        if self.main_container.content is not self.content_diagnostics:
+            return False
+        changed = False
+        for name, labels, metric in metrics.REGISTRY.collect():
+            if isinstance(metric, metrics.Histogram):
+                scale, unit = (1e3, " ms") if name.endswith("_seconds") else (1, "")
+                values = [
+                    str(metric.count),
+                    *(
+                        f"{value * scale:.3f}{unit}" if metric.count else "-"
+                        for value in (
+                            metric.quantile(0.5),
+                            metric.quantile(0.95),
+                            metric.max,
+                        )
                     ),
-                    height=125,
-                    width=150,
-                    elevation=4,
+                ]
+            else:
+                values = [f"{metric.value:,}", "", "", ""]
+            cells = self.diagnostics_cells.get((name, labels))
+            if cells is None:
+                label_text = ", ".join(f"{key}={value}" for key, value in labels)
+                cells = self.diagnostics_cells[name, labels] = [
+                    ft.Text(text) for text in (name, label_text, *values)
+                ]
+                self.diagnostics_table.rows.append(
+                    ft.DataRow(cells=[ft.DataCell(cell) for cell in cells])
                 )
-            )
+                self.renderer.mark(self.diagnostics_table)
+                changed = True
+                continue
+            for cell, value in zip(cells[2:], values):
+                if cell.value != value:
+                    cell.value = value
+                    self.renderer.mark(cell)
+                    changed = True
+        return changed
 
-        self.data_grid_view.controls = grid_controls
+    def update_metrics_export(self):
+        """Start, retarget or stop the periodic metrics file per the settings."""
+        exporter = self.metrics_exporter
+        if exporter and (
+            exporter.path != self.metrics_file
+            or exporter.interval != self.metrics_interval
+        ):
+            exporter.stop()
+            exporter = self.metrics_exporter = None
+        if exporter is None and self.metrics_file:
+            exporter = self.metrics_exporter = metrics.PeriodicExporter(
+                self.metrics_file, self.metrics_interval
+            )
+            exporter.start()
 
     def save_next_csv(self, e: ft.ControlEvent):
         self.clear_data(e)
         self.start_time = datetime.datetime.now().timestamp()
-        start_time_str = datetime.datetime.fromtimestamp(self.start_time).strftime(
-            "%Y-%m-%d-%H-%M-%S"
-        )
-        self.file_name = os.path.join(self.log_directory, f"{start_time_str}.csv")
-        self.last_written_timestamp = None
+        self.log_start_time = self.start_time
+        for board_id, log_writer in self.log_writers.items():
+            log_writer.rotate(self.open_log_writers(board_id))
 
     def clear_data(self, e: ft.ControlEvent):
         # self.can_receiver.reset_data_points()
-        self.last_chart_update_time = 0
+        self.chart_series.clear()
+        self.chart_origin = None
+        self.stale_charts.clear()
         for chart in self.line_charts.values():
             if chart.data_series:
                 chart.data_series.clear()
@@ -495,10 +1357,17 @@ class BatteryManagementApp:
         self.page.update()
 
 
-def main(page: ft.Page):
+def parse_board_ids(text: str) -> Optional[List[int]]:
+    board_ids = [int(part) for part in text.replace(",", " ").split()]
+    return board_ids or None
+
+
+async def run_app(page: ft.Page):
+    # The refresh schedulers, the CAN receiver and the async handlers that
+    # start and stop it all run on flet's event loop.
     app = BatteryManagementApp(page)
-    asyncio.run(app.update_task())
+    await app.update_task()
 
 
-ft.app(main)
-# ft.app_async(main)
+def main() -> None:
+    ft.app(run_app)
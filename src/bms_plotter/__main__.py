@@ -0,0 +1,3 @@
+from bms_plotter import main
+
+main()
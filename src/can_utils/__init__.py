@@ -1,61 +1,354 @@
 import asyncio
-import math
-import queue
-import struct
+import sys
 import threading
 import time
-from collections import defaultdict
-from typing import Dict, List, Optional, Tuple, Union
+from array import array
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import can
+import frame_schema
+import metrics
+
+if TYPE_CHECKING:
+    # python-can and its interface backends are only imported once a bus is
+    # opened, so decoding and storage stay cheap to import.
+    import can
+
+    import alarms
+
+
+class RingSnapshot(NamedTuple):
+    seq: int
+    timestamps: array
+    values: array
+
+
+Cursor = Dict[str, int]
+Frame = Tuple[float, int, Dict[str, Union[int, float]]]
+BoardIds = Union[int, Iterable[int], None]
+BOARD_ID_MASK = 0xFF
+
+
+def normalize_board_ids(board_ids: BoardIds) -> Optional[List[int]]:
+    """Turn one ID or an iterable into a sorted list; None or empty = every board."""
+    if board_ids is None:
+        return None
+    if isinstance(board_ids, int):
+        return [board_ids]
+    return sorted(set(board_ids)) or None
+
+
+class RingBuffer:
+    """Fixed-capacity time series backed by preallocated arrays.
+
+    ``seq`` counts every sample ever appended and is never reset, so readers
+    can tell whether a buffer changed since they last looked at it.
+    """
+
+    def __init__(self, capacity: int, typecode: str = "d"):
+        self.capacity: int = capacity
+        self.timestamps: array = array("d", bytes(8 * capacity))
+        self.values: array = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self.seq: int = 0
+        self._head: int = 0
+        self._size: int = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, value: Union[int, float]) -> None:
+        head = self._head
+        self.timestamps[head] = timestamp
+        self.values[head] = value
+        head += 1
+        self._head = 0 if head == self.capacity else head
+        if self._size < self.capacity:
+            self._size += 1
+        self.seq += 1
+
+    def extend(self, timestamps: array, values: array) -> None:
+        """Append whole columns, as slice copies rather than per sample."""
+        count = len(timestamps)
+        self.seq += count
+        head = self._head
+        if count > self.capacity:
+            head = (head + count - self.capacity) % self.capacity
+            timestamps = timestamps[-self.capacity :]
+            values = values[-self.capacity :]
+            count = self.capacity
+        first = min(count, self.capacity - head)
+        self.timestamps[head : head + first] = timestamps[:first]
+        self.values[head : head + first] = values[:first]
+        rest = count - first
+        if rest:
+            self.timestamps[:rest] = timestamps[first:]
+            self.values[:rest] = values[first:]
+        head += count
+        self._head = head % self.capacity
+        self._size = min(self._size + count, self.capacity)
+
+    def clear(self) -> None:
+        self._head = 0
+        self._size = 0
+
+    def snapshot(self) -> RingSnapshot:
+        return self._tail(self._size)
+
+    def read_since(self, seq: int) -> RingSnapshot:
+        """Samples appended after ``seq``, limited to what is still buffered."""
+        return self._tail(max(0, min(self.seq - seq, self._size)))
+
+    def _tail(self, count: int) -> RingSnapshot:
+        start = (self._head - count) % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            return RingSnapshot(
+                self.seq, self.timestamps[start:end], self.values[start:end]
+            )
+        return RingSnapshot(
+            self.seq,
+            self.timestamps[start:] + self.timestamps[: self._head],
+            self.values[start:] + self.values[: self._head],
+        )
+
+    def items(self) -> List[Tuple[float, Union[int, float]]]:
+        snapshot = self.snapshot()
+        return list(zip(snapshot.timestamps, snapshot.values))
+
+
+class FrameClock:
+    """Receive time of a frame as epoch seconds.
+
+    Uses the kernel or hardware timestamp python-can reports, shifted onto
+    the wall clock when the device counts from its own epoch: a first
+    timestamp further than ``skew_limit`` seconds from wall time fixes the
+    offset. Frames without a timestamp get the wall time.
+    """
+
+    def __init__(self, skew_limit: float):
+        self.skew_limit = skew_limit
+        self.offset: Optional[float] = None
+
+    def reset(self) -> None:
+        self.offset = None
+
+    def __call__(self, message: "can.Message") -> float:
+        if not message.timestamp:
+            return time.time()
+        if self.offset is None:
+            offset = time.time() - message.timestamp
+            self.offset = offset if abs(offset) > self.skew_limit else 0.0
+        return message.timestamp + self.offset
+
+
+_RECEIVE_LATENCY = metrics.REGISTRY.histogram(
+    "bms_can_receive_latency_seconds",
+    "Age of the first frame of each burst when it is decoded",
+)
+_HANDOFF_LATENCY = metrics.REGISTRY.histogram(
+    "bms_can_handoff_seconds",
+    "Time from a thread injecting frames to process_messages waking",
+)
+_STORED_FRAMES = metrics.REGISTRY.histogram(
+    "bms_can_stored_frames",
+    "Frames stored per wake-up of the event loop",
+    metrics.SIZE_BUCKETS,
+)
 
 
 class CANReceiver:
+    BATCH_SIZE = 256
+    # Every Nth frame is parsed through parse_frame_timed.
+    PARSE_SAMPLE_EVERY = 64
+    # recv() timeout of the can.Notifier thread for buses without a file
+    # descriptor; bounds how long stop_receiving() waits for it.
+    RECV_TIMEOUT = 0.1
+    # Device clocks further than this from wall time are treated as running
+    # from an arbitrary epoch (e.g. adapter power-on) and re-anchored.
+    CLOCK_SKEW_LIMIT = 60.0
+
     def __init__(
         self,
         channel: str = "can0",
         bitrate: int = 500000,
         max_data_points: int = 1000,
-        bms_id: int = 0x01,
+        bms_id: BoardIds = 0x01,
+        interface: str = "socketcan",
     ):
+        # bms_id may name one board, several, or None for every board on the
+        # bus; all of them are decoded in a single pass and stored per board.
         self.parser: CANParser = CANParser(bms_id)
-        self.bms_id = bms_id
+        self.bms_ids: Optional[List[int]] = normalize_board_ids(bms_id)
+        self.bms_id: Optional[int] = self.bms_ids[0] if self.bms_ids else None
         self.channel: str = channel
+        self.interface: str = interface
         self.bitrate: int = bitrate
         self.max_data_points: int = max_data_points
-        self.data_points: Dict[str, List[Tuple[float, Union[int, float]]]] = (
-            defaultdict(list)
-        )
+        self.boards: Dict[int, Dict[str, RingBuffer]] = {}
         self.data_lock: threading.Lock = threading.Lock()
         self._is_running: bool = False
-        self.message_queue = queue.Queue()
+        self.frames_received: int = 0
+        # Decoded frames injected from other threads (replay, capture) and
+        # handed to process_messages. deque.append/popleft are atomic, so the
+        # hand-off itself needs no lock; the consumer is woken at most once per
+        # batch via call_soon_threadsafe. Frames read from the bus skip this.
+        self._pending: Deque[Frame] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._data_ready: Optional[asyncio.Event] = None
+        self._wakeup_pending: bool = False
         self._bus_lock: threading.Lock = threading.Lock()
-        self._bus: Optional[can.interface.Bus] = None
+        self._bus: Optional["can.BusABC"] = None
+        # Set while receiving: the loop reading the bus and either the file
+        # descriptor it watches or the Notifier feeding the reader task.
+        self._bus_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader_fd: Optional[int] = None
+        self._notifier: Optional["can.Notifier"] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._clock = FrameClock(self.CLOCK_SKEW_LIMIT)
+        self._queued_at = 0.0
+        # Checked against every stored sample, whichever path it came in on.
+        self.alarms: Optional["alarms.AlarmEngine"] = None
+        registry = metrics.REGISTRY
+        frames_received = registry.counter(
+            "bms_can_frames_received_total",
+            "Frames read from the bus",
+            lambda: self.frames_received,
+            channel=channel,
+        )
+        pending_frames = registry.gauge(
+            "bms_can_pending_frames",
+            "Decoded frames waiting for process_messages",
+            lambda: len(self._pending),
+            channel=channel,
+        )
+        # Both read this receiver until close() releases them.
+        self._function_metrics = [
+            (metric, metric.function) for metric in (frames_received, pending_frames)
+        ]
+        self._ignored_frames = registry.counter(
+            "bms_can_frames_ignored_total",
+            "Frames with an ID the parser does not decode or a malformed payload",
+            channel=channel,
+        )
+        self._receive_errors = registry.counter(
+            "bms_can_receive_errors_total",
+            "python-can errors while receiving",
+            channel=channel,
+        )
 
-    def _get_bus(self) -> can.interface.Bus:
+    def _get_bus(self) -> "can.BusABC":
         """Get or initialize the shared bus instance."""
+        import can
+
         if self._bus is None:
             with self._bus_lock:
                 self._bus = can.interface.Bus(
-                    bustype="socketcan", channel=self.channel, bitrate=self.bitrate
+                    interface=self.interface,
+                    channel=self.channel,
+                    bitrate=self.bitrate,
+                    can_filters=self.parser.can_filters(),
                 )
         return self._bus
 
+    @property
+    def data_points(self) -> Dict[str, RingBuffer]:
+        """Signal buffers of the primary board."""
+        return self.boards.get(self.primary_board, {})
+
+    @property
+    def primary_board(self) -> int:
+        if self.bms_id is not None:
+            return self.bms_id
+        return min(self.boards, default=0)
+
+    @property
+    def board_ids(self) -> List[int]:
+        with self.data_lock:
+            return sorted(self.boards)
+
+    def _board(self, board_id: Optional[int]) -> Dict[str, RingBuffer]:
+        return self.boards.get(self.primary_board if board_id is None else board_id, {})
+
     def start_receiving(self) -> None:
-        if not self._is_running:
-            self._is_running = True
-            self.receiver_thread = threading.Thread(target=self._receive_data)
-            self.receiver_thread.start()
+        """Read the bus on the running event loop; call from a coroutine.
 
-    def stop_receiving(self) -> None:
+        A bus with a file descriptor (socketcan) is watched with
+        ``loop.add_reader`` and drained in the callback, so frames are decoded
+        and stored on the loop without any thread. Other interfaces go through
+        a ``can.Notifier`` whose thread hands messages to an
+        ``AsyncBufferedReader`` drained by a task on the same loop.
+        """
         if self._is_running:
-            self._is_running = False
-            self.receiver_thread.join()
-            self._close_bus()
+            return
+        import can
+
+        loop = asyncio.get_running_loop()
+        bus = self._get_bus()
+        self._clock.reset()
+        self._bus_loop = loop
+        try:
+            fileno = bus.fileno()
+        except NotImplementedError:
+            fileno = -1
+        if fileno >= 0:
+            loop.add_reader(fileno, self._read_bus, bus)
+            self._reader_fd = fileno
+        else:
+            reader = can.AsyncBufferedReader()
+            self._notifier = can.Notifier(
+                bus, [reader], timeout=self.RECV_TIMEOUT, loop=loop
+            )
+            self._reader_task = loop.create_task(self._read_buffered(reader))
+        self._is_running = True
+
+    @property
+    def is_reading(self) -> bool:
+        """Whether the bus is being read: False once stopped, or once the
+        reader task has ended."""
+        task = self._reader_task
+        return self._is_running and (task is None or not task.done())
+
+    def stop_receiving(self) -> None:
+        """Stop reading the bus; call on the loop start_receiving ran on."""
+        if not self._is_running:
+            return
+        self._is_running = False
+        if self._reader_fd is not None:
+            self._bus_loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._notifier is not None:
+            self._notifier.stop(timeout=2 * self.RECV_TIMEOUT)
+            self._notifier = None
+        self._bus_loop = None
+        self._close_bus()
+
+    def close(self) -> None:
+        """Stop receiving, finish the queued alarm checks and release the
+        metrics that read this receiver."""
+        self.stop_receiving()
+        if self.alarms:
+            self.alarms.close()
+        for metric, function in self._function_metrics:
+            metric.release(function)
 
     def reset_data_points(self) -> None:
         with self.data_lock:
-            self.data_points.clear()
+            for board in self.boards.values():
+                for buffer in board.values():
+                    buffer.clear()
 
     def _close_bus(self) -> None:
         if self._bus:
@@ -63,45 +356,207 @@ class CANReceiver:
                 self._bus.shutdown()
                 self._bus = None
 
-    def _receive_data(self) -> None:
-        while self._is_running:
+    def _read_bus(self, bus: "can.BusABC") -> None:
+        """add_reader callback: decode what the socket has buffered."""
+        import can
+
+        messages = []
+        try:
+            message = bus.recv(0)
+            while message is not None:
+                messages.append(message)
+                if len(messages) >= self.BATCH_SIZE:
+                    break  # the fd stays readable; the loop calls back
+                message = bus.recv(0)
+        except can.CanError as e:
+            self._receive_errors.inc()
+            print(f"CAN receive error: {e}")
+        if messages:
+            self._decode(messages)
+
+    async def _read_buffered(self, reader: "can.AsyncBufferedReader") -> None:
+        buffer = reader.buffer
+        while True:
+            messages = [await buffer.get()]
+            while not buffer.empty() and len(messages) < self.BATCH_SIZE:
+                messages.append(buffer.get_nowait())
+            self._decode(messages)
+            if len(messages) >= self.BATCH_SIZE:
+                await asyncio.sleep(0)  # let the UI run between full batches
+
+    def _decode(self, messages: List["can.Message"]) -> None:
+        """Decode a burst of messages and store it; runs on the event loop."""
+        parse = self.parser.parse_frame
+        parse_timed = self.parser.parse_frame_timed
+        sample_every = self.PARSE_SAMPLE_EVERY
+        timestamp = self._clock
+        if messages[0].timestamp:
+            _RECEIVE_LATENCY.observe(time.time() - timestamp(messages[0]))
+        frames: List[Frame] = []
+        for message in messages:
+            self.frames_received += 1
             try:
-                bus = self._get_bus()
-                message: Optional[can.Message] = bus.recv(1.0)  # 1-second timeout
-                if message:
-                    timestamp = int(time.time())
-                    data = self.parser.parse_message(message)
-                    if data:
-                        for key, value in data.items():
-                            self.message_queue.put((timestamp, key, value))
-            except can.CanError as e:
-                print(f"CAN receive error: {e}")
+                if self.frames_received % sample_every:
+                    parsed = parse(message)
+                else:
+                    parsed = parse_timed(message)
+            except Exception:
+                # A payload the schema cannot decode is ignored like an
+                # unknown ID rather than losing the rest of the burst.
+                continue
+            if parsed:
+                frames.append((timestamp(message), *parsed))
+        if len(frames) < len(messages):
+            self._ignored_frames.inc(len(messages) - len(frames))
+        self._store(frames)
+
+    def use_schema(self, schema: frame_schema.Schema) -> None:
+        """Decode frames with ``schema``; call before start_receiving, which
+        takes the bus filters from it."""
+        self.parser = CANParser(self.bms_ids, schema)
+
+    def inject(
+        self,
+        timestamp: float,
+        data: Dict[str, Union[int, float]],
+        board_id: Optional[int] = None,
+    ) -> None:
+        """Queue already decoded samples as if they had arrived on the bus."""
+        if board_id is None:
+            board_id = self.primary_board
+        self._pending.append((timestamp, board_id, data))
+        self._notify()
+
+    @property
+    def pending_frames(self) -> int:
+        return len(self._pending)
+
+    def _notify(self) -> None:
+        loop = self._loop
+        if loop is not None and not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._queued_at = time.perf_counter()
+            try:
+                loop.call_soon_threadsafe(self._data_ready.set)
+            except RuntimeError:
+                pass  # consumer loop already closed
 
     async def process_messages(self, stop_event) -> None:
-        while not stop_event.is_set():
-            timestamp, key, value = await self._get_message_from_queue()
-            if timestamp is not None:
-                with self.data_lock:
-                    self.data_points[key].append((timestamp, value))
-                    if len(self.data_points[key]) > self.max_data_points:
-                        self.data_points[key].pop(0)
-
-    async def _get_message_from_queue(self):
-        if not self.message_queue.empty():
-            return self.message_queue.get(1)
-        else:
-            return None, None, None
+        self._data_ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        # The first wake-up stores what was injected before the loop started.
+        self._wakeup_pending = True
+        self._queued_at = time.perf_counter()
+        self._data_ready.set()
+        try:
+            while not stop_event.is_set():
+                try:
+                    # The timeout only bounds how long a stop request can go
+                    # unnoticed; data arrival wakes the loop immediately.
+                    await asyncio.wait_for(self._data_ready.wait(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                self._data_ready.clear()
+                self._wakeup_pending = False
+                _HANDOFF_LATENCY.observe(time.perf_counter() - self._queued_at)
+                self._store(self._drain())
+        finally:
+            self._loop = None
+
+    def _drain(self) -> List[Frame]:
+        popleft = self._pending.popleft
+        return [popleft() for _ in range(len(self._pending))]
 
-    async def get_data_points(self) -> Dict[str, List[Tuple[float, Union[int, float]]]]:
+    def _store(self, frames: List[Frame]) -> None:
+        if not frames:
+            return
+        _STORED_FRAMES.observe(len(frames))
+        boards = self.boards
         with self.data_lock:
-            return {key: points[:] for key, points in self.data_points.items()}
+            for timestamp, board_id, data in frames:
+                data_points = boards.get(board_id)
+                if data_points is None:
+                    data_points = boards[board_id] = {}
+                for key, value in data.items():
+                    buffer = data_points.get(key)
+                    if buffer is None:
+                        buffer = data_points[key] = RingBuffer(
+                            self.max_data_points,
+                            "q" if isinstance(value, int) else "d",
+                        )
+                    buffer.append(timestamp, value)
+        if self.alarms:
+            self.alarms.submit(frames)
 
-    async def notice_full_recharge(self):
+    def store_columns(
+        self, board_id: int, columns: Dict[str, Tuple[array, array]]
+    ) -> None:
+        """Store samples decoded elsewhere (e.g. a fan-out server) as columns."""
+        with self.data_lock:
+            data_points = self.boards.get(board_id)
+            if data_points is None:
+                data_points = self.boards[board_id] = {}
+            for key, (timestamps, values) in columns.items():
+                buffer = data_points.get(key)
+                if buffer is None:
+                    buffer = data_points[key] = RingBuffer(
+                        self.max_data_points, values.typecode
+                    )
+                buffer.extend(timestamps, values)
+        if self.alarms:
+            self.alarms.submit_columns(board_id, columns)
+
+    async def get_data_points(
+        self, board_id: Optional[int] = None
+    ) -> Dict[str, List[Tuple[float, Union[int, float]]]]:
+        with self.data_lock:
+            return {
+                key: buffer.items()
+                for key, buffer in self._board(board_id).items()
+                if len(buffer)
+            }
+
+    async def get_snapshots(
+        self, board_id: Optional[int] = None
+    ) -> Dict[str, RingSnapshot]:
+        with self.data_lock:
+            return {
+                key: buffer.snapshot()
+                for key, buffer in self._board(board_id).items()
+                if len(buffer)
+            }
+
+    async def read_since(
+        self, cursor: Optional[Cursor] = None, board_id: Optional[int] = None
+    ) -> Tuple[Dict[str, RingSnapshot], Cursor]:
+        """Return the samples stored after ``cursor`` and the cursor to pass next.
+
+        Each consumer keeps its own cursor, so the cost of a call depends on
+        how much arrived since the previous one, not on the stored history.
+        """
+        cursor = cursor or {}
+        new_samples: Dict[str, RingSnapshot] = {}
+        next_cursor: Cursor = {}
+        with self.data_lock:
+            for key, buffer in self._board(board_id).items():
+                seq = cursor.get(key, 0)
+                if buffer.seq != seq:
+                    samples = buffer.read_since(seq)
+                    if samples.values:
+                        new_samples[key] = samples
+                next_cursor[key] = buffer.seq
+        return new_samples, next_cursor
+
+    async def notice_full_recharge(self, board_id: Optional[int] = None):
+        if board_id is None:
+            board_id = self.primary_board
         if self._is_running:
+            import can
+
             try:
                 bus = self._get_bus()
                 message = can.Message(
-                    arbitration_id=0x4600 + self.bms_id,
+                    arbitration_id=0x4600 + board_id,
                     data=[],
                     is_extended_id=True,
                 )
@@ -110,6 +565,14 @@ class CANReceiver:
                 print(f"CAN send error: {e}")
 
 
+_CELL_ID_LIMIT = 1 << 7
+_THRM_ID_LIMIT = 1 << 6
+
+
+def _intern_keys(prefix: str, count: int) -> Tuple[str, ...]:
+    return tuple(sys.intern(f"{prefix}{i}") for i in range(count))
+
+
 class CANParser:
     BATTERY_VOLTAGE_CURRENT_ID = 0x4000
     CELL_VOLTAGE_ID = 0x4100
@@ -131,85 +594,87 @@ class CANParser:
     KEY_CELL = "cell_id_"
     KEY_TEMP = "thrm_id_"
 
-    def __init__(self, board_id: int):
-        self.board_id = board_id
-
-    def parse_message(self, message) -> Optional[Dict[str, Union[int, float]]]:
-        message_id = message.arbitration_id
-        if message_id == self.BATTERY_VOLTAGE_CURRENT_ID + self.board_id:
-            return self._parse_battery_voltage_current(message.data)
-        elif message_id == self.CELL_VOLTAGE_ID + self.board_id:
-            return self._parse_cell_voltage(message.data)
-        elif message_id == self.SOC_DUTY_ID + self.board_id:
-            return self._parse_soc_duty(message.data)
-        elif message_id == self.TEMP_ID + self.board_id:
-            return self._parse_temp(message.data)
-        elif message_id == self.EACH_CELL_VOLTAGE_ID + self.board_id:
-            return self._parse_each_cell_voltage(message.data)
-        elif message_id == self.EACH_TEMPERATURE_ID + self.board_id:
-            return self._parse_each_temperature(message.data)
-        return None
+    # Signal names of the built-in schema, which the UI and capture refer
+    # to. Packed cell/thermistor words carry at most 7/6 id bits.
+    CELL_KEYS: Tuple[str, ...] = _intern_keys(KEY_CELL, _CELL_ID_LIMIT)
+    THRM_KEYS: Tuple[str, ...] = _intern_keys(KEY_TEMP, _THRM_ID_LIMIT)
 
-    def _parse_battery_voltage_current(
-        self, data: bytes
-    ) -> Dict[str, Union[int, float]]:
-        battery_voltage, battery_current = struct.unpack("<I i", data[:8])
-        return {
-            self.KEY_BATTERY_VOLTAGE: round(battery_voltage * 100e-6, 2),
-            self.KEY_BATTERY_CURRENT: round(battery_current * 1e-3, 2),
+    def __init__(
+        self, board_id: BoardIds, schema: Optional[frame_schema.Schema] = None
+    ):
+        # A single ID, several IDs, or None to decode every board (ID & 0xFF).
+        self.board_ids: Optional[List[int]] = normalize_board_ids(board_id)
+        self.board_id: Optional[int] = self.board_ids[0] if self.board_ids else None
+        # Frame layouts come from a schema compiled to one decoder per frame
+        # type (see frame_schema); the built-in one describes the BMS firmware.
+        self.schema: frame_schema.Schema = schema or frame_schema.default_schema()
+        self._handlers: Dict[int, frame_schema.Decoder] = self._build_dispatch_table(
+            range(BOARD_ID_MASK + 1) if self.board_ids is None else self.board_ids
+        )
+        self._parse_seconds: Dict[int, metrics.Histogram] = {
+            base_id: metrics.REGISTRY.histogram(
+                "bms_can_parse_seconds",
+                "Time to decode one frame, sampled every PARSE_SAMPLE_EVERY frames",
+                frame_id=f"0x{base_id:04X}",
+            )
+            for base_id in self.schema.base_ids
         }
 
-    def _parse_cell_voltage(self, data: bytes) -> Dict[str, Union[int, float]]:
-        min_cell_voltage, max_cell_voltage = struct.unpack("<I I", data[:8])
+    def _build_dispatch_table(
+        self, board_ids: Iterable[int]
+    ) -> Dict[int, frame_schema.Decoder]:
         return {
-            self.KEY_MIN_CELL_VOLTAGE: round(min_cell_voltage * 100e-6, 2),
-            self.KEY_MAX_CELL_VOLTAGE: round(max_cell_voltage * 100e-6, 2),
+            base_id + board_id: decoder
+            for board_id in board_ids
+            for base_id, decoder in self.schema.decoders.items()
         }
 
-    def _parse_soc_duty(self, data: bytes) -> Dict[str, Union[int, float]]:
-        _, remain, soc, _, duty, _ = struct.unpack("<H H B B B B", data[:8])
-        return {self.KEY_REMAIN: remain, self.KEY_SOC: soc, self.KEY_DUTY: duty}
+    def parse_message(self, message) -> Optional[Dict[str, Union[int, float]]]:
+        handler = self._handlers.get(message.arbitration_id)
+        if handler is None:
+            return None
+        return handler(message.data)
 
-    def _parse_temp(self, data: bytes) -> Dict[str, Union[int, float]]:
-        battery_average, battery_max, pcb_average, pcb_max = struct.unpack(
-            "<h h h h", data[:8]
-        )
-        return {
-            self.KEY_BATTERY_AVERAGE_TEMP: round(battery_average, 2),
-            self.KEY_BATTERY_MAX_TEMP: round(battery_max, 2),
-            self.KEY_PCB_AVERAGE_TEMP: round(pcb_average, 2),
-            self.KEY_PCB_MAX_TEMP: round(pcb_max, 2),
-        }
+    def parse_frame(
+        self, message
+    ) -> Optional[Tuple[int, Dict[str, Union[int, float]]]]:
+        """Like parse_message, but also returns the sending board's ID; None
+        as well when the payload is too short to decode."""
+        arbitration_id = message.arbitration_id
+        handler = self._handlers.get(arbitration_id)
+        if handler is None:
+            return None
+        data = handler(message.data)
+        if not data:
+            return None
+        return arbitration_id & BOARD_ID_MASK, data
+
+    def parse_frame_timed(
+        self, message
+    ) -> Optional[Tuple[int, Dict[str, Union[int, float]]]]:
+        """parse_frame, recording its duration per frame type."""
+        start = time.perf_counter()
+        parsed = self.parse_frame(message)
+        elapsed = time.perf_counter() - start
+        if parsed:
+            self._parse_seconds[message.arbitration_id & ~BOARD_ID_MASK].observe(
+                elapsed
+            )
+        return parsed
+
+    def can_filters(self) -> List[Dict[str, Union[int, bool]]]:
+        """Receive filters matching exactly the frames this parser decodes.
 
-    def _parse_cell_message(self, data: int) -> Dict[str, Union[int, float]]:
-        cell_id = (data & 0xFE00) >> 9
-        cell_voltage = data & 0x1FF
-        return {f"cell_id_{cell_id}": round(cell_voltage * 10e-3, 2)}
-
-    def _parse_each_cell_voltage(self, data: bytes) -> Dict[str, Union[int, float]]:
-        cell1, cell2, cell3, cell4 = struct.unpack("<H H H H", data[:8])
-        result = {}
-        result.update(self._parse_cell_message(cell1))
-        result.update(self._parse_cell_message(cell2))
-        result.update(self._parse_cell_message(cell3))
-        result.update(self._parse_cell_message(cell4))
-        return result
-
-    def _parse_thrm_message(self, data: int) -> Dict[str, Union[int, float]]:
-        thrm_id = (data & 0xFC00) >> 10
-        compressed_temp = data & 0x03FF
-        sign_bit = (compressed_temp & 0x0200) >> 9
-        abs_temperature = compressed_temp & 0x01FF
-        temperature = -abs_temperature if sign_bit == 1 else abs_temperature
-        return {f"thrm_id_{thrm_id}": round(temperature, 2)}
-
-    def _parse_each_temperature(self, data: bytes) -> Dict[str, Union[int, float]]:
-        result = {}
-        if len(data) % 2 != 0:
-            return result
-
-        for i in range(0, len(data), 2):
-            (thrm,) = struct.unpack("<H", data[i : i + 2])
-            result.update(self._parse_thrm_message(thrm))
-
-        return result
+        With socketcan these are installed in the kernel, so traffic for
+        other IDs is never copied into Python.
+        """
+        if self.board_ids is None:
+            return [
+                {"can_id": base_id, "can_mask": 0x1FFFFF00, "extended": True}
+                for base_id in self.schema.base_ids
+            ]
+        return [
+            {"can_id": base_id + board_id, "can_mask": 0x1FFFFFFF, "extended": True}
+            for board_id in self.board_ids
+            for base_id in self.schema.base_ids
+        ]
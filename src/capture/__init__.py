@@ -0,0 +1,381 @@
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import can_utils as cu
+import frame_schema
+import metrics
+
+# Boards seen on channel N are stored as N * CHANNEL_STRIDE + board ID, so the
+# same board ID on two buses stays two boards.
+CHANNEL_STRIDE = 0x100
+
+
+class ChannelConfig(NamedTuple):
+    """One bus to capture. ``schema_path`` is a JSON frame schema to decode
+    with instead of the built-in layout. Interface "synthetic" needs no
+    hardware: frames come from replay.SyntheticBus at ``frame_rate`` frames/s
+    (0 = as fast as the process can decode)."""
+
+    channel: str
+    interface: str = "socketcan"
+    bitrate: int = 500000
+    bms_id: cu.BoardIds = None
+    schema_path: str = ""
+    frame_rate: float = 0.0
+
+
+def load_schema(config: ChannelConfig) -> frame_schema.Schema:
+    if config.schema_path:
+        return frame_schema.load(config.schema_path)
+    return frame_schema.default_schema()
+
+
+def signal_keys(schema: frame_schema.Schema) -> Tuple[str, ...]:
+    """Every signal ``schema`` can produce, in a fixed order that the channel
+    process and the capture agree on; ring records carry the index instead
+    of the key string."""
+    keys: List[str] = []
+    for message in schema.messages.values():
+        keys += (field.name for field in message.fields)
+        if message.packed:
+            keys += message.packed.keys
+    return tuple(keys)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        # Only the creating process may unlink the segment.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedRing:
+    """Single-producer single-consumer ring of decoded samples in shared memory.
+
+    Layout: a 128-byte header (write, frame and drop counters and the
+    capacity on one cache line, the read counter on the next) followed by
+    ``capacity`` fixed-size records. Counters only ever grow and each side
+    writes just its own, so no lock is needed. A full ring drops new samples
+    and counts them rather than stalling the bus reader. Pass ``name`` to
+    attach to a ring created by another process.
+    """
+
+    RECORD = struct.Struct("<d d H B ? 4x")  # timestamp, value, key, board, is_int
+    _COUNTER = struct.Struct("<Q")
+    _WRITE = 0
+    _FRAMES = 8
+    _DROPPED = 16
+    _CAPACITY = 24
+    _READ = 64
+    HEADER_SIZE = 128
+
+    def __init__(self, capacity: int = 65536, name: Optional[str] = None):
+        if name is None:
+            size = self.HEADER_SIZE + capacity * self.RECORD.size
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[: self.HEADER_SIZE] = bytes(self.HEADER_SIZE)
+            self._set(self._CAPACITY, capacity)
+            self._owner = True
+        else:
+            self.shm = _attach(name)
+            capacity = self._get(self._CAPACITY)
+            self._owner = False
+        self.capacity = capacity
+        self.name = self.shm.name
+        self._records = self.shm.buf[
+            self.HEADER_SIZE : self.HEADER_SIZE + capacity * self.RECORD.size
+        ]
+
+    def _get(self, offset: int) -> int:
+        return self._COUNTER.unpack_from(self.shm.buf, offset)[0]
+
+    def _set(self, offset: int, value: int) -> None:
+        self._COUNTER.pack_into(self.shm.buf, offset, value)
+
+    @property
+    def frames(self) -> int:
+        return self._get(self._FRAMES)
+
+    @property
+    def dropped(self) -> int:
+        return self._get(self._DROPPED)
+
+    def __len__(self) -> int:
+        return self._get(self._WRITE) - self._get(self._READ)
+
+    def write(self, records: bytes, frames: int = 0) -> int:
+        """Append packed records (producer side); returns how many fit."""
+        size = self.RECORD.size
+        write = self._get(self._WRITE)
+        free = self.capacity - (write - self._get(self._READ))
+        count = min(len(records) // size, free)
+        if count < len(records) // size:
+            self._set(self._DROPPED, self.dropped + len(records) // size - count)
+        if count:
+            start = (write % self.capacity) * size
+            length = count * size
+            first = min(length, len(self._records) - start)
+            self._records[start : start + first] = records[:first]
+            if first < length:
+                self._records[: length - first] = records[first:length]
+            self._set(self._WRITE, write + count)
+        if frames:
+            self._set(self._FRAMES, self.frames + frames)
+        return count
+
+    def read(self, limit: int = 65536) -> bytes:
+        """Take up to ``limit`` packed records (consumer side)."""
+        size = self.RECORD.size
+        read = self._get(self._READ)
+        count = min(self._get(self._WRITE) - read, limit)
+        if count <= 0:
+            return b""
+        start = (read % self.capacity) * size
+        length = count * size
+        first = min(length, len(self._records) - start)
+        data = bytes(self._records[start : start + first])
+        if first < length:
+            data += bytes(self._records[: length - first])
+        self._set(self._READ, read + count)
+        return data
+
+    def close(self) -> None:
+        self._records.release()
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _open_bus(config: ChannelConfig, parser: cu.CANParser):
+    if config.interface == "synthetic":
+        import replay
+
+        return replay.SyntheticBus(config.bms_id, config.frame_rate)
+    import can
+
+    return can.interface.Bus(
+        interface=config.interface,
+        channel=config.channel,
+        bitrate=config.bitrate,
+        can_filters=parser.can_filters(),
+    )
+
+
+def _capture(
+    config: ChannelConfig, ring_name: str, stop_event, errors, batch_size: int
+) -> None:
+    """Body of a channel process: receive, decode and publish to the ring.
+
+    Whatever ends it early, such as a bus that cannot be opened, is put on
+    ``errors`` for the capture to report.
+    """
+    import can
+
+    ring = SharedRing(name=ring_name)
+    bus = None
+    try:
+        schema = load_schema(config)
+        parser = cu.CANParser(config.bms_id, schema)
+        parse = parser.parse_frame
+        # Stamped like CANReceiver does, so channels agree with a single bus.
+        timestamp_of = cu.FrameClock(cu.CANReceiver.CLOCK_SKEW_LIMIT)
+        pack = ring.RECORD.pack
+        index = {key: i for i, key in enumerate(signal_keys(schema))}
+        bus = _open_bus(config, parser)
+        while not stop_event.is_set():
+            try:
+                message = bus.recv(0.5)
+                frames = 0
+                records = []
+                while message is not None:
+                    frames += 1
+                    parsed = parse(message)
+                    if parsed:
+                        board_id, data = parsed
+                        timestamp = timestamp_of(message)
+                        for key, value in data.items():
+                            records.append(
+                                pack(
+                                    timestamp,
+                                    value,
+                                    index[key],
+                                    board_id,
+                                    isinstance(value, int),
+                                )
+                            )
+                    if frames >= batch_size:
+                        break
+                    message = bus.recv(0)
+                if frames:
+                    ring.write(b"".join(records), frames)
+            except can.CanError as e:
+                print(f"CAN receive error ({config.channel}): {e}")
+    except Exception as e:
+        errors.put(f"Capture error ({config.channel}): {e}")
+    finally:
+        if bus:
+            bus.shutdown()
+        ring.close()
+
+
+class MultiChannelCapture:
+    """Receive and decode several CAN channels in one process each.
+
+    Each channel process publishes samples to its own SharedRing; a thread
+    here drains the rings and injects the samples into ``receiver``, so the
+    rest of the app reads them exactly like single-channel data. Boards are
+    namespaced per channel (see CHANNEL_STRIDE). Each channel's schema is
+    loaded here too, so a bad one raises ValueError or OSError right away. A
+    channel process that stops on an error leaves its message in ``error``.
+    """
+
+    BATCH_SIZE = 256
+
+    def __init__(
+        self,
+        receiver: cu.CANReceiver,
+        channels: List[ChannelConfig],
+        ring_capacity: int = 65536,
+        poll_interval: float = 0.002,
+    ):
+        self.receiver = receiver
+        self.channels = channels
+        self.ring_capacity = ring_capacity
+        self.poll_interval = poll_interval
+        self.samples = 0
+        self.error: Optional[str] = None
+        self._keys = [signal_keys(load_schema(config)) for config in channels]
+        self._errors: multiprocessing.Queue = multiprocessing.Queue()
+        # Totals of rings already closed, so stats() survives stop().
+        self._closed = {"frames": 0, "dropped_samples": 0}
+        self.rings: List[SharedRing] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._stop_event = multiprocessing.Event()
+        self._is_running = False
+        self._thread: Optional[threading.Thread] = None
+        # Reads this capture while it runs; stop() releases it.
+        self._dropped_samples = metrics.REGISTRY.counter(
+            "bms_capture_dropped_samples_total",
+            "Samples dropped because a channel's shared-memory ring was full",
+        )
+        self._dropped_function = lambda: self.stats()["dropped_samples"]
+
+    def start(self) -> None:
+        if self._is_running:
+            return
+        self._is_running = True
+        self._stop_event.clear()
+        self._dropped_samples.function = self._dropped_function
+        for config in self.channels:
+            ring = SharedRing(self.ring_capacity)
+            process = multiprocessing.Process(
+                target=_capture,
+                args=(
+                    config,
+                    ring.name,
+                    self._stop_event,
+                    self._errors,
+                    self.BATCH_SIZE,
+                ),
+                name=f"capture-{config.channel}",
+                daemon=True,
+            )
+            process.start()
+            self.rings.append(ring)
+            self._processes.append(process)
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._is_running:
+            return
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._is_running = False
+        if self._thread:
+            self._thread.join()
+        for ring in self.rings:
+            self._closed["frames"] += ring.frames
+            self._closed["dropped_samples"] += ring.dropped
+            ring.close()
+        self.rings.clear()
+        self._processes.clear()
+        self._dropped_samples.release(self._dropped_function)
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "frames": self._closed["frames"] + sum(ring.frames for ring in self.rings),
+            "samples": self.samples,
+            "dropped_samples": self._closed["dropped_samples"]
+            + sum(ring.dropped for ring in self.rings),
+            "pending_samples": sum(len(ring) for ring in self.rings),
+        }
+
+    def _drain(self) -> None:
+        while self._is_running:
+            idle = True
+            for channel_index, ring in enumerate(self.rings):
+                data = ring.read()
+                if data:
+                    idle = False
+                    self._inject(channel_index, data)
+            if idle:
+                self._check_errors()
+                time.sleep(self.poll_interval)
+        for channel_index, ring in enumerate(self.rings):
+            self._inject(channel_index, ring.read(ring.capacity))
+        self._check_errors()
+
+    def _check_errors(self) -> None:
+        while True:
+            try:
+                self.error = self._errors.get_nowait()
+            except queue.Empty:
+                return
+            print(self.error)
+
+    def _inject(self, channel_index: int, data: bytes) -> None:
+        inject = self.receiver.inject
+        board_base = channel_index * CHANNEL_STRIDE
+        keys = self._keys[channel_index]
+        for (timestamp, board_id), samples in _group(data):
+            inject(
+                timestamp,
+                {keys[key]: value for key, value in samples},
+                board_base + board_id,
+            )
+        self.samples += len(data) // SharedRing.RECORD.size
+
+
+def _group(
+    data: bytes,
+) -> Iterator[Tuple[Tuple[float, int], List[Tuple[int, float]]]]:
+    """Regroup records into frames: consecutive samples sharing time and board."""
+    current: Optional[Tuple[float, int]] = None
+    samples: List[Tuple[int, float]] = []
+    for timestamp, value, key, board_id, is_int in SharedRing.RECORD.iter_unpack(data):
+        if (timestamp, board_id) != current:
+            if samples:
+                yield current, samples
+            current = (timestamp, board_id)
+            samples = []
+        samples.append((key, int(value) if is_int else value))
+    if samples:
+        yield current, samples
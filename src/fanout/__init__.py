@@ -0,0 +1,406 @@
+import asyncio
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import can_utils as cu
+import metrics
+
+# Stream format, after the server's MAGIC: messages of a _HEADER (type,
+# payload length) and a payload. Keys are sent once as (id, name) pairs in
+# MSG_KEYS; sample payloads are blocks of _BLOCK (board ID, key ID, array
+# typecode, count) followed by count float64 timestamps and count values,
+# little-endian. MSG_LATEST carries the same blocks, one sample per signal,
+# for a new subscription or a client that fell behind.
+MAGIC = b"BMSFAN\x00\x01"
+MSG_SUBSCRIBE = 1
+MSG_KEYS = 2
+MSG_SAMPLES = 3
+MSG_LATEST = 4
+_HEADER = struct.Struct("<BI")
+_KEY = struct.Struct("<HB")
+_BLOCK = struct.Struct("<HHcI")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+Block = Tuple[int, str, bytes]  # board ID, key, encoded block
+
+_CLIENTS = metrics.REGISTRY.gauge(
+    "bms_fanout_clients", "Viewers connected to the fan-out server"
+)
+_SENT_BYTES = metrics.REGISTRY.counter(
+    "bms_fanout_sent_bytes_total", "Bytes written to fan-out clients"
+)
+_DROPPED_SAMPLES = metrics.REGISTRY.counter(
+    "bms_fanout_dropped_samples_total",
+    "Samples a slow fan-out client skipped, keeping only the latest value",
+)
+
+
+def split_address(address: str) -> Tuple[Optional[str], Union[int, str]]:
+    """TCP for "host:port" or ":port" (localhost), else a Unix socket path."""
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return None, address
+
+
+def _message(kind: int, payload: bytes) -> bytes:
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+def _little_endian(column: array) -> bytes:
+    if _BIG_ENDIAN:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _encode_block(board_id: int, key_id: int, timestamps: array, values: array):
+    return (
+        _BLOCK.pack(board_id, key_id, values.typecode.encode(), len(timestamps))
+        + _little_endian(timestamps)
+        + _little_endian(values)
+    )
+
+
+def _encode_keys(keys: Iterable[Tuple[int, str]]) -> bytes:
+    payload = bytearray()
+    for key_id, key in keys:
+        name = key.encode()
+        payload += _KEY.pack(key_id, len(name)) + name
+    return _message(MSG_KEYS, bytes(payload))
+
+
+def decode_keys(payload: bytes) -> Dict[int, str]:
+    keys = {}
+    offset = 0
+    while offset < len(payload):
+        key_id, length = _KEY.unpack_from(payload, offset)
+        offset += _KEY.size
+        keys[key_id] = payload[offset : offset + length].decode()
+        offset += length
+    return keys
+
+
+def decode_blocks(
+    payload: bytes, keys: Dict[int, str]
+) -> Dict[int, Dict[str, Tuple[array, array]]]:
+    """Samples by board and key, as (timestamps, values) arrays."""
+    boards: Dict[int, Dict[str, Tuple[array, array]]] = {}
+    offset = 0
+    while offset < len(payload):
+        board_id, key_id, typecode, count = _BLOCK.unpack_from(payload, offset)
+        offset += _BLOCK.size
+        timestamps = array("d")
+        values = array(typecode.decode())
+        timestamps.frombytes(payload[offset : offset + 8 * count])
+        offset += 8 * count
+        end = offset + values.itemsize * count
+        values.frombytes(payload[offset:end])
+        offset = end
+        if _BIG_ENDIAN:
+            timestamps.byteswap()
+            values.byteswap()
+        boards.setdefault(board_id, {})[keys[key_id]] = (timestamps, values)
+    return boards
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    kind, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return kind, await reader.readexactly(length)
+
+
+class Subscriber:
+    """One connected viewer: its prefixes and the latest values it missed."""
+
+    def __init__(self, writer: asyncio.StreamWriter, high_water: int):
+        self.writer = writer
+        self.high_water = high_water
+        self.prefixes: Tuple[str, ...] = ()
+        # (board ID, key) -> single-sample block, filled while congested.
+        self.latest: Dict[Tuple[int, str], bytes] = {}
+        # (board ID, key) -> ring sequence number of the sample the
+        # subscription snapshot sent; the next publish starts after it.
+        self.snapshot_seqs: Dict[Tuple[int, str], int] = {}
+        self.dropped = 0
+        self._matches: Dict[str, bool] = {}
+
+    def subscribe(self, prefixes: Tuple[str, ...]) -> None:
+        self.prefixes = prefixes
+        self._matches.clear()
+        self.latest.clear()
+        self.snapshot_seqs.clear()
+
+    def wants(self, key: str) -> bool:
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = self._matches[key] = not self.prefixes or key.startswith(
+                self.prefixes
+            )
+        return matches
+
+    @property
+    def congested(self) -> bool:
+        return self.writer.transport.get_write_buffer_size() > self.high_water
+
+    def send(self, data: bytes) -> None:
+        self.writer.write(data)
+        _SENT_BYTES.inc(len(data))
+
+
+class FanoutServer:
+    """Publish the samples stored in ``receiver`` to any number of viewers.
+
+    Every ``interval`` the new samples of each board are read once and each
+    signal is encoded once; viewers subscribed to the same prefixes share the
+    same message bytes, so a viewer costs little more than a socket write.
+    A viewer whose socket buffer passes HIGH_WATER is sent nothing but the
+    latest value of each signal once it has caught up.
+    """
+
+    HIGH_WATER = 256 * 1024
+
+    def __init__(self, receiver: cu.CANReceiver, address: str, interval: float = 0.05):
+        self.receiver = receiver
+        self.address = address
+        self.interval = interval
+        self.subscribers: List[Subscriber] = []
+        self.key_ids: Dict[str, int] = {}
+        self._new_keys: List[Tuple[int, str]] = []
+        self._cursors: Dict[int, cu.Cursor] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+        # Bound to _CLIENTS while serving; stop() releases it.
+        self._clients_function = lambda: len(self.subscribers)
+
+    async def start(self) -> None:
+        host, port = split_address(self.address)
+        if host is None:
+            self._server = await asyncio.start_unix_server(self._serve, port)
+        else:
+            self._server = await asyncio.start_server(self._serve, host, port)
+        self._task = asyncio.create_task(self._publish())
+        _CLIENTS.function = self._clients_function
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._server:
+            self._server.close()
+            # abort, not close: a stalled viewer would never drain its buffer.
+            for subscriber in self.subscribers:
+                subscriber.writer.transport.abort()
+            self.subscribers.clear()
+            await self._server.wait_closed()
+            self._server = None
+        _CLIENTS.release(self._clients_function)
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        subscriber = Subscriber(writer, self.HIGH_WATER)
+        subscriber.send(MAGIC)
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == MSG_SUBSCRIBE:
+                    prefixes = tuple(filter(None, payload.decode().split("\n")))
+                    subscriber.subscribe(prefixes)
+                    await self._send_latest(subscriber)
+                    # Published to from the first subscription on.
+                    if subscriber not in self.subscribers:
+                        self.subscribers.append(subscriber)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            writer.close()
+
+    async def _send_latest(self, subscriber: Subscriber) -> None:
+        """Send the current value of every subscribed signal."""
+        blocks = []
+        for board_id in self.receiver.board_ids:
+            snapshots = await self.receiver.get_snapshots(board_id)
+            for key, snapshot in snapshots.items():
+                if subscriber.wants(key):
+                    blocks.append(
+                        self._encode(
+                            board_id, key, snapshot.timestamps, snapshot.values, 1
+                        )
+                    )
+                    subscriber.snapshot_seqs[board_id, key] = snapshot.seq
+        self._send_new_keys()
+        keys = _encode_keys((key_id, key) for key, key_id in self.key_ids.items())
+        subscriber.send(keys + _message(MSG_LATEST, b"".join(blocks)))
+
+    def _encode(
+        self,
+        board_id: int,
+        key: str,
+        timestamps: array,
+        values: array,
+        last: int = 0,
+    ) -> bytes:
+        """Encode the samples, or only the ``last`` few."""
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.key_ids)
+            self._new_keys.append((key_id, key))
+        if last:
+            timestamps, values = timestamps[-last:], values[-last:]
+        return _encode_block(board_id, key_id, timestamps, values)
+
+    def _send_new_keys(self) -> None:
+        if self._new_keys:
+            message = _encode_keys(self._new_keys)
+            self._new_keys = []
+            for subscriber in self.subscribers:
+                subscriber.send(message)
+
+    async def _publish(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.subscribers:
+                await self.publish()
+
+    async def publish(self) -> None:
+        """Read what arrived since the last call and send it to every viewer."""
+        new_samples: List[Tuple[int, str, cu.RingSnapshot]] = []
+        for board_id in self.receiver.board_ids:
+            samples, self._cursors[board_id] = await self.receiver.read_since(
+                self._cursors.get(board_id), board_id
+            )
+            new_samples += [
+                (board_id, key, snapshot) for key, snapshot in samples.items()
+            ]
+        if not new_samples:
+            return
+        blocks: List[Block] = [
+            (
+                board_id,
+                key,
+                self._encode(board_id, key, snapshot.timestamps, snapshot.values),
+            )
+            for board_id, key, snapshot in new_samples
+        ]
+        self._send_new_keys()
+
+        messages: Dict[Tuple[str, ...], bytes] = {}
+        for subscriber in list(self.subscribers):
+            if subscriber.writer.is_closing():
+                self.subscribers.remove(subscriber)
+            elif subscriber.congested:
+                self._skip(subscriber, new_samples)
+            else:
+                if subscriber.latest:
+                    caught_up = b"".join(subscriber.latest.values())
+                    subscriber.latest.clear()
+                    subscriber.send(_message(MSG_LATEST, caught_up))
+                if subscriber.snapshot_seqs:
+                    subscriber.send(self._after_snapshot(subscriber, new_samples))
+                    continue
+                message = messages.get(subscriber.prefixes)
+                if message is None:
+                    message = messages[subscriber.prefixes] = _message(
+                        MSG_SAMPLES,
+                        b"".join(
+                            block for _, key, block in blocks if subscriber.wants(key)
+                        ),
+                    )
+                subscriber.send(message)
+
+    def _after_snapshot(
+        self,
+        subscriber: Subscriber,
+        new_samples: List[Tuple[int, str, cu.RingSnapshot]],
+    ) -> bytes:
+        """The first samples message after a subscription, leaving out what
+        its snapshot already sent."""
+        seqs = subscriber.snapshot_seqs
+        subscriber.snapshot_seqs = {}
+        blocks = []
+        for board_id, key, snapshot in new_samples:
+            count = snapshot.seq - seqs.get((board_id, key), 0)
+            if subscriber.wants(key) and count > 0:
+                blocks.append(
+                    self._encode(
+                        board_id, key, snapshot.timestamps, snapshot.values, count
+                    )
+                )
+        return _message(MSG_SAMPLES, b"".join(blocks))
+
+    def _skip(
+        self,
+        subscriber: Subscriber,
+        new_samples: List[Tuple[int, str, cu.RingSnapshot]],
+    ) -> None:
+        """Keep only the latest value of each signal for a congested viewer."""
+        seqs = subscriber.snapshot_seqs
+        subscriber.snapshot_seqs = {}
+        for board_id, key, snapshot in new_samples:
+            if subscriber.wants(key) and snapshot.seq > seqs.get((board_id, key), 0):
+                subscriber.latest[board_id, key] = self._encode(
+                    board_id, key, snapshot.timestamps, snapshot.values, 1
+                )
+                subscriber.dropped += len(snapshot.timestamps)
+                _DROPPED_SAMPLES.inc(len(snapshot.timestamps))
+
+
+class FanoutClient:
+    """Fill a local CANReceiver from a FanoutServer instead of a CAN bus.
+
+    Only signals starting with one of ``prefixes`` are sent (all if empty).
+    """
+
+    def __init__(
+        self, receiver: cu.CANReceiver, address: str, prefixes: Iterable[str] = ()
+    ):
+        self.receiver = receiver
+        self.address = address
+        self.prefixes = tuple(prefixes)
+        self.samples = 0
+        self.keys: Dict[int, str] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        host, port = split_address(self.address)
+        if host is None:
+            reader, self._writer = await asyncio.open_unix_connection(port)
+        else:
+            reader, self._writer = await asyncio.open_connection(host, port)
+        if await reader.readexactly(len(MAGIC)) != MAGIC:
+            self._writer.close()
+            raise ValueError(f"{self.address} is not a BMS fan-out server")
+        self.subscribe(self.prefixes)
+        self._task = asyncio.create_task(self._receive(reader))
+
+    def subscribe(self, prefixes: Iterable[str]) -> None:
+        self.prefixes = tuple(prefixes)
+        if self._writer:
+            payload = "\n".join(self.prefixes).encode()
+            self._writer.write(_message(MSG_SUBSCRIBE, payload))
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    async def _receive(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == MSG_KEYS:
+                    self.keys.update(decode_keys(payload))
+                elif kind in (MSG_SAMPLES, MSG_LATEST):
+                    for board_id, columns in decode_blocks(payload, self.keys).items():
+                        self.receiver.store_columns(board_id, columns)
+                        self.samples += sum(len(t) for t, _ in columns.values())
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Fan-out connection to {self.address} closed: {e}")
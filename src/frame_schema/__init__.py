@@ -0,0 +1,310 @@
+import functools
+import json
+import os
+import re
+import struct
+import sys
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+Value = Union[int, float]
+# None when the payload is too short for the frame's layout.
+Decoder = Callable[[bytes], Optional[Dict[str, Value]]]
+
+# The frame layout of the BMS firmware; a schema file describes the same
+# thing for another revision.
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bms.json")
+
+# The low byte of a frame ID is the sending board, so schemas name base IDs.
+_BOARD_ID_MASK = 0xFF
+_ITEM = re.compile(r"\s*(\d*)([xbBhHiIqQefd])")
+_WORD_CODES = "BHIQ"
+# Packed words index at most this many sensors and carry readings of at most
+# this many bits, so both can be looked up in tables built once.
+_MAX_PACKED_IDS = 256
+_MAX_VALUE_BITS = 16
+_SIGNED = ("unsigned", "sign_magnitude", "twos_complement")
+
+
+class Field(NamedTuple):
+    """A value at a fixed byte position: ``raw * scale + offset``, rounded to
+    ``digits`` decimals when given."""
+
+    name: str
+    start: int
+    code: str  # struct code with byte order, e.g. "<I"
+    scale: Optional[float] = None
+    offset: float = 0.0
+    digits: Optional[int] = None
+
+
+class Packed(NamedTuple):
+    """Words that each carry a sensor ID above bit ``id_shift`` and its raw
+    reading below it, decoded by table lookup."""
+
+    prefix: str
+    code: str
+    id_shift: int
+    keys: Tuple[str, ...]  # by sensor ID
+    values: Tuple[Value, ...]  # by raw reading
+
+
+class Message(NamedTuple):
+    name: str
+    base_id: int
+    format: str
+    fields: Tuple[Field, ...]
+    packed: Optional[Packed]
+    # With a packed word format, the payload is any number of those words.
+    repeat: bool
+    decode: Decoder
+
+
+class Schema:
+    """A frame schema compiled to one decoder per base frame ID.
+
+    A decoder takes a payload and returns {key: value}, like the methods
+    CANParser used to hand-write; batch decoding (analytics.decode_packed,
+    analytics.decode_fields) reads the same compiled fields and tables.
+    """
+
+    def __init__(self, messages: Iterable[Message], path: str = ""):
+        self.path = path
+        self.messages: Dict[int, Message] = {
+            message.base_id: message for message in messages
+        }
+        self.decoders: Dict[int, Decoder] = {
+            base_id: message.decode for base_id, message in self.messages.items()
+        }
+
+    @property
+    def base_ids(self) -> Tuple[int, ...]:
+        return tuple(self.messages)
+
+    def __repr__(self) -> str:
+        return f"Schema({self.path or len(self.messages)!r})"
+
+
+def _convert(
+    raw: Value, scale: Optional[float], offset: float, digits: Optional[int]
+) -> Value:
+    value = raw if scale is None else raw * scale
+    if offset:
+        value += offset
+    return value if digits is None else round(value, digits)
+
+
+def _expression(
+    raw: str, scale: Optional[float], offset: float, digits: Optional[int]
+) -> str:
+    """Source computing what _convert does; floats are written with repr,
+    which reads back as the same float."""
+    text = raw if scale is None else f"{raw} * {scale!r}"
+    if offset:
+        text = f"{text} + {offset!r}"
+    return text if digits is None else f"round({text}, {digits})"
+
+
+def _build(name: str, source: str, names: Dict[str, object]) -> Decoder:
+    """Compile ``source`` (defining ``decode``) with ``names`` bound as
+    closure variables, which read faster than globals."""
+    body = "".join(f"    {line}\n" for line in source.splitlines())
+    factory = f"def factory({', '.join(names)}):\n{body}    return decode\n"
+    namespace: Dict[str, object] = {}
+    exec(compile(factory, f"<schema {name}>", "exec"), namespace)
+    decode = namespace["factory"](**names)
+    decode.__name__ = decode.__qualname__ = f"decode_{name}"
+    return decode
+
+
+def _items(fmt: str) -> List[Tuple[int, str]]:
+    """(byte position, struct code with byte order) of each non-pad item."""
+    order, body = fmt[:1], fmt[1:]
+    if order not in ("<", ">"):
+        raise ValueError(f"format {fmt!r} must start with < or >")
+    items = []
+    position = end = 0
+    for match in _ITEM.finditer(body):
+        if match.start() != end:
+            break
+        end = match.end()
+        count, code = int(match.group(1) or 1), match.group(2)
+        if code == "x":
+            position += count
+            continue
+        size = struct.calcsize(order + code)
+        for _ in range(count):
+            items.append((position, order + code))
+            position += size
+    if body[end:].strip():
+        raise ValueError(f"unsupported format {fmt!r}")
+    return items
+
+
+def _scaling(spec: Dict) -> Tuple[Optional[float], float, Optional[int]]:
+    """(scale, offset, digits) of a field or packed entry."""
+    scale = spec.get("scale")
+    digits = spec.get("round")
+    if digits is not None and (type(digits) is not int or digits < 0):
+        raise ValueError(f"round must be a whole number of decimals, not {digits!r}")
+    return (
+        None if scale is None else float(scale),
+        float(spec.get("offset", 0.0)),
+        digits,
+    )
+
+
+def _field(spec: Union[str, Dict], item: Tuple[int, str]) -> Field:
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    return Field(sys.intern(spec["name"]), *item, *_scaling(spec))
+
+
+def _field_decoder(
+    name: str, unpack: struct.Struct, fields: Tuple[Field, ...]
+) -> Decoder:
+    names: Dict[str, object] = {"unpack_from": unpack.unpack_from}
+    raw = ", ".join(f"v{index}" for index in range(len(fields)))
+    entries = []
+    for index, field in enumerate(fields):
+        names[f"k{index}"] = field.name
+        value = _expression(f"v{index}", field.scale, field.offset, field.digits)
+        entries.append(f"k{index}: {value}")
+    source = (
+        "def decode(data):\n"
+        f"    if len(data) < {unpack.size}:\n"
+        "        return None\n"
+        f"    ({raw},) = unpack_from(data)\n"
+        f"    return {{{', '.join(entries)}}}\n"
+    )
+    return _build(name, source, names)
+
+
+def _packed(spec: Dict, items: List[Tuple[int, str]]) -> Packed:
+    code = items[0][1]
+    size = struct.calcsize(code)
+    if code[1] not in _WORD_CODES or items != [
+        (index * size, code) for index in range(len(items))
+    ]:
+        raise ValueError("packed words must be unpadded, same-size unsigned integers")
+    id_shift = int(spec["id_shift"])
+    id_bits = size * 8 - id_shift
+    if not (0 < id_shift <= _MAX_VALUE_BITS and 0 < 1 << id_bits <= _MAX_PACKED_IDS):
+        raise ValueError(f"id_shift {id_shift} leaves too many ID or value bits")
+    signed = spec.get("signed") or "unsigned"
+    if signed not in _SIGNED:
+        raise ValueError(f"signed must be one of {', '.join(_SIGNED)}")
+    sign = 1 << (id_shift - 1)
+    values = []
+    for raw in range(1 << id_shift):
+        if signed == "sign_magnitude" and raw & sign:
+            raw = -(raw & (sign - 1))
+        elif signed == "twos_complement" and raw & sign:
+            raw -= 1 << id_shift
+        values.append(raw)
+    scaling = _scaling(spec)
+    return Packed(
+        spec["prefix"],
+        code,
+        id_shift,
+        tuple(sys.intern(f"{spec['prefix']}{i}") for i in range(1 << id_bits)),
+        tuple(_convert(raw, *scaling) for raw in values),
+    )
+
+
+def _packed_decoder(
+    name: str, unpack: struct.Struct, words: int, packed: Packed, repeat: bool
+) -> Decoder:
+    names = {"keys": packed.keys, "values": packed.values}
+    shift, mask = packed.id_shift, (1 << packed.id_shift) - 1
+    if repeat:
+        names["iter_unpack"] = unpack.iter_unpack
+        source = (
+            "def decode(data):\n"
+            f"    if len(data) % {unpack.size}:\n"
+            "        return {}\n"
+            f"    return {{keys[w >> {shift}]: values[w & {mask}]"
+            " for (w,) in iter_unpack(data)}\n"
+        )
+    else:
+        names["unpack_from"] = unpack.unpack_from
+        raw = ", ".join(f"w{index}" for index in range(words))
+        entries = ", ".join(
+            f"keys[w{index} >> {shift}]: values[w{index} & {mask}]"
+            for index in range(words)
+        )
+        source = (
+            "def decode(data):\n"
+            f"    if len(data) < {unpack.size}:\n"
+            "        return None\n"
+            f"    ({raw},) = unpack_from(data)\n"
+            f"    return {{{entries}}}\n"
+        )
+    return _build(name, source, names)
+
+
+def _message(spec: Dict) -> Message:
+    name = spec["name"]
+    base_id = spec["id"]
+    base_id = int(base_id, 0) if isinstance(base_id, str) else int(base_id)
+    if base_id & _BOARD_ID_MASK:
+        raise ValueError(f"id 0x{base_id:X} must leave the board ID byte zero")
+    fmt = spec["format"]
+    unpack = struct.Struct(fmt)
+    items = _items(fmt)
+    repeat = bool(spec.get("repeat", False))
+    if not items:
+        raise ValueError("format has no values")
+    if "packed" in spec:
+        if repeat and len(items) != 1:
+            raise ValueError("a repeated packed format must be a single word")
+        packed = _packed(spec["packed"], items)
+        decode = _packed_decoder(name, unpack, len(items), packed, repeat)
+        return Message(name, base_id, fmt, (), packed, repeat, decode)
+    if repeat:
+        raise ValueError("only packed words can repeat")
+    if len(spec["fields"]) != len(items):
+        raise ValueError(f"{len(spec['fields'])} fields for {len(items)} values")
+    fields = tuple(_field(field, item) for field, item in zip(spec["fields"], items))
+    decode = _field_decoder(name, unpack, fields)
+    return Message(name, base_id, fmt, fields, None, False, decode)
+
+
+def compile_schema(spec: Dict, path: str = "") -> Schema:
+    """Compile a schema (the parsed JSON of a schema file) into decoders.
+
+    Raises ValueError naming the message when an entry is malformed.
+    """
+    messages = []
+    names: Dict[str, str] = {}
+    for item in spec.get("messages", []):
+        label = f"{path or 'schema'}: message {item.get('name', len(messages))}"
+        try:
+            message = _message(item)
+        except (KeyError, TypeError, ValueError, struct.error) as e:
+            raise ValueError(f"{label}: {e}") from e
+        if any(other.base_id == message.base_id for other in messages):
+            raise ValueError(f"{label}: id 0x{message.base_id:X} is used twice")
+        for field in message.fields:
+            if field.name in names:
+                raise ValueError(
+                    f"{label}: {field.name} is also in {names[field.name]}"
+                )
+            names[field.name] = message.name
+        messages.append(message)
+    return Schema(messages, path)
+
+
+def load(path: str) -> Schema:
+    """Read and compile a JSON schema file."""
+    with open(path) as file:
+        try:
+            spec = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from e
+    return compile_schema(spec, path)
+
+
+@functools.cache
+def default_schema() -> Schema:
+    """The built-in BMS layout (SCHEMA_PATH), compiled on first use."""
+    return load(SCHEMA_PATH)
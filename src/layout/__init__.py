@@ -1,5 +1,12 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
 import flet as ft
 
+Point = Tuple[float, float]
+
 
 class Sheet(ft.Card):
     def __init__(self, title: str, filter_str: str, content: ft.GridView):
@@ -33,3 +40,295 @@ class Sheet(ft.Card):
 
     def build(self):
         return self.card
+
+
+class ValueCard(ft.Card):
+    """Tile showing the latest value of one signal.
+
+    The tile is built once; later updates only touch ``value_text``.
+    """
+
+    def __init__(self, key: str, value: Union[int, float]):
+        self.value_text = ft.Text(
+            str(value),
+            size=36,
+            color="white",
+            weight="bold",
+            text_align=ft.TextAlign.CENTER,
+        )
+        super().__init__(
+            content=ft.Container(
+                content=ft.Column(
+                    [
+                        ft.Text(
+                            key,
+                            size=24,
+                            color="yellow",
+                            weight="bold",
+                            text_align=ft.TextAlign.CENTER,
+                        ),
+                        self.value_text,
+                    ],
+                    spacing=1,
+                    alignment=ft.MainAxisAlignment.CENTER,
+                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                ),
+                padding=1,
+                bgcolor=ft.colors.BLACK,
+                border_radius=12,
+                alignment=ft.alignment.center,
+            ),
+            height=125,
+            width=150,
+            elevation=4,
+        )
+
+    def set_value(self, value: Union[int, float]) -> bool:
+        text = str(value)
+        if text == self.value_text.value:
+            return False
+        self.value_text.value = text
+        return True
+
+
+class Heatmap(ft.Column):
+    """Grid of small tiles, one per sensor, coloured by value.
+
+    Values are quantized to the palette, so a tile is only re-sent when its
+    colour actually changes. ``set_values`` returns the tiles that did.
+    """
+
+    PALETTE = (
+        "#313695",
+        "#4575b4",
+        "#74add1",
+        "#abd9e9",
+        "#fee090",
+        "#fdae61",
+        "#f46d43",
+        "#d73027",
+        "#a50026",
+    )
+    EMPTY = "#303030"
+
+    def __init__(self, title: str, tile_size: int = 28, columns: int = 16):
+        self.tile_size = tile_size
+        self.columns = columns
+        self.tiles: List[ft.Container] = []
+        self._levels: List[int] = []
+        self.range_text = ft.Text("", size=12)
+        self.grid = ft.Row(wrap=True, spacing=2, run_spacing=2, controls=[])
+        super().__init__(
+            controls=[
+                ft.Row([ft.Text(title, weight="bold"), self.range_text]),
+                self.grid,
+            ],
+            width=columns * (tile_size + 2),
+        )
+
+    def resize(self, count: int) -> bool:
+        if count == len(self.tiles):
+            return False
+        while len(self.tiles) < count:
+            self.tiles.append(
+                ft.Container(
+                    width=self.tile_size,
+                    height=self.tile_size,
+                    bgcolor=self.EMPTY,
+                    border_radius=3,
+                    tooltip=str(len(self.tiles)),
+                )
+            )
+            self._levels.append(-1)
+        del self.tiles[count:], self._levels[count:]
+        self.grid.controls = list(self.tiles)
+        return True
+
+    def set_values(
+        self, values: Sequence[float], low: float, high: float
+    ) -> List[ft.Control]:
+        span = high - low
+        top = len(self.PALETTE) - 1
+        changed: List[ft.Control] = []
+        for index, (tile, value) in enumerate(zip(self.tiles, values)):
+            if math.isnan(value):  # no reading yet
+                level = -1
+            elif span > 0:
+                level = min(top, max(0, round((value - low) / span * top)))
+            else:
+                level = top // 2
+            if level != self._levels[index]:
+                self._levels[index] = level
+                tile.bgcolor = self.EMPTY if level < 0 else self.PALETTE[level]
+                tile.tooltip = f"{index}: {value:.3g}"
+                changed.append(tile)
+        self.range_text.value = f"{low:.3g} .. {high:.3g}"
+        changed.append(self.range_text)
+        return changed
+
+
+class RenderScheduler:
+    """Collects the controls changed since the last frame.
+
+    ``flush`` sends only those in a single page.update(*controls) instead of
+    diffing the whole page. Controls not mounted yet are skipped.
+    """
+
+    def __init__(self, page: ft.Page):
+        self.page = page
+        self._dirty: Dict[int, ft.Control] = {}
+
+    def mark(self, control: ft.Control) -> None:
+        self._dirty[id(control)] = control
+
+    def flush(self) -> bool:
+        """Send the marked controls in one update; False if there were none."""
+        controls = [c for c in self._dirty.values() if c.page is not None]
+        self._dirty.clear()
+        if controls:
+            self.page.update(*controls)
+        return bool(controls)
+
+
+class AdaptiveScheduler:
+    """Runs an async ``step`` over and over on its own cadence.
+
+    The period after each run is the run's duration divided by ``load``, kept
+    within [min_interval, max_interval]: a step that gets slow (a heavy
+    page.update(), say) runs less often, one that gets cheap runs more often.
+    A step that returns False found nothing to do, and the period doubles
+    toward ``max_interval`` until it finds work again. ``rate`` is the
+    measured number of runs per second.
+    """
+
+    def __init__(
+        self,
+        step: Callable[[], Awaitable[Optional[bool]]],
+        min_interval: float = 0.05,
+        max_interval: float = 1.0,
+        load: float = 0.25,
+    ):
+        self.step = step
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.load = load
+        self.interval = min_interval
+        self.duration = 0.0
+        self.rate = 0.0
+        self.runs = 0
+        self._last_start: Optional[float] = None
+
+    def next_interval(self, found_work: Optional[bool]) -> float:
+        if found_work is False:
+            interval = 2 * self.interval
+        else:
+            interval = self.duration / self.load
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            if self._last_start is not None and start > self._last_start:
+                self.rate += 0.2 * (1.0 / (start - self._last_start) - self.rate)
+            self._last_start = start
+            found_work = await self.step()
+            self.duration = time.perf_counter() - start
+            self.runs += 1
+            self.interval = self.next_interval(found_work)
+            await asyncio.sleep(max(self.interval - self.duration, 0.0))
+
+
+class MinMaxSeries:
+    """Incrementally downsampled series for a LineChart.
+
+    Samples are grouped into at most ``max_points // 2`` buckets of equal x
+    span and each bucket is drawn as its minimum and maximum, so spikes
+    survive at any zoom level. When the buckets run out the span doubles and
+    neighbours are merged, so the point count stays bounded however long the
+    session runs. The y range is tracked as samples arrive.
+    """
+
+    def __init__(self, max_points: int = 400):
+        self.max_buckets = max(1, max_points // 2)
+        self.clear()
+
+    def clear(self) -> None:
+        self.span = 0.0
+        self.low: Optional[float] = None
+        self.high: Optional[float] = None
+        self.first_x: Optional[float] = None
+        self.last_x: Optional[float] = None
+        # [bucket id, min x, min y, max x, max y]
+        self._buckets: List[List[float]] = []
+        self._dirty = 0
+
+    def __len__(self) -> int:
+        return 2 * len(self._buckets)
+
+    def extend(self, xs: Sequence[float], ys: Sequence[float]) -> None:
+        buckets = self._buckets
+        for x, y in zip(xs, ys):
+            if self.low is None:
+                self.low = self.high = y
+                self.first_x = x
+            elif y < self.low:
+                self.low = y
+            elif y > self.high:
+                self.high = y
+            self.last_x = x
+
+            bucket_id = x // self.span if self.span else len(buckets)
+            if buckets and bucket_id <= buckets[-1][0]:
+                bucket = buckets[-1]
+                if y < bucket[2]:
+                    bucket[1], bucket[2] = x, y
+                elif y > bucket[4]:
+                    bucket[3], bucket[4] = x, y
+                self._dirty = min(self._dirty, len(buckets) - 1)
+                continue
+            buckets.append([bucket_id, x, y, x, y])
+            self._dirty = min(self._dirty, len(buckets) - 1)
+            if len(buckets) > self.max_buckets:
+                self._merge()
+                buckets = self._buckets
+
+    def _merge(self) -> None:
+        buckets = self._buckets
+        width = buckets[-1][3] - buckets[0][1]
+        self.span = max(2 * self.span, 2 * width / self.max_buckets) or 1.0
+        merged: List[List[float]] = []
+        for bucket in buckets:
+            bucket_id = min(bucket[1], bucket[3]) // self.span
+            if merged and bucket_id <= merged[-1][0]:
+                target = merged[-1]
+                if bucket[2] < target[2]:
+                    target[1], target[2] = bucket[1], bucket[2]
+                if bucket[4] > target[4]:
+                    target[3], target[4] = bucket[3], bucket[4]
+            else:
+                bucket[0] = bucket_id
+                merged.append(bucket)
+        self._buckets = merged
+        self._dirty = 0
+
+    def points(self) -> List[Point]:
+        return self._points(0)
+
+    def changes(self) -> Tuple[int, List[Point]]:
+        """Points changed since the previous call, as (first index, points).
+
+        Points before the index are unchanged, so a chart only has to replace
+        its tail.
+        """
+        start = self._dirty
+        self._dirty = len(self._buckets)
+        return 2 * start, self._points(start)
+
+    def _points(self, start: int) -> List[Point]:
+        points: List[Point] = []
+        for _, min_x, min_y, max_x, max_y in self._buckets[start:]:
+            if min_x <= max_x:
+                points += ((min_x, min_y), (max_x, max_y))
+            else:
+                points += ((max_x, max_y), (min_x, min_y))
+        return points
@@ -0,0 +1,327 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+Labels = Tuple[Tuple[str, str], ...]
+Number = Union[int, float]
+
+# Upper bounds in seconds, for things that take microseconds (parsing a
+# frame) up to seconds (a slow page update).
+TIME_BUCKETS: Tuple[float, ...] = (
+    1e-6,
+    2.5e-6,
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+SIZE_BUCKETS: Tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Counter:
+    """Monotonically increasing count, or one read from ``function``."""
+
+    TYPE = "counter"
+
+    def __init__(self, function: Optional[Callable[[], Number]] = None):
+        self.function = function
+        self._value: Number = 0
+
+    def inc(self, amount: Number = 1) -> None:
+        self._value += amount
+
+    @property
+    def value(self) -> Number:
+        return self.function() if self.function else self._value
+
+    def release(self, function: Callable[[], Number]) -> None:
+        """Keep the last value of ``function`` and stop calling it, so the
+        registry no longer holds on to whatever it reads. A no-op if another
+        function has been bound since."""
+        if self.function is function:
+            self._value = function()
+            self.function = None
+
+    def to_dict(self) -> Dict[str, Number]:
+        return {"value": self.value}
+
+
+class Gauge(Counter):
+    """A value that goes up and down: set it, or let ``function`` report it."""
+
+    TYPE = "gauge"
+
+    def set(self, value: Number) -> None:
+        self._value = value
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, plus their sum and maximum.
+
+    ``observe`` is a bisect and a few additions, cheap enough for per-batch
+    and sampled per-frame use.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, buckets: Sequence[float] = TIME_BUCKETS):
+        self.bounds: List[float] = sorted(buckets)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimate from the buckets, interpolating linearly inside one."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.bounds[index - 1] if index else 0.0
+                high = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total = 0
+        buckets = []
+        for bound, count in zip([*self.bounds, math.inf], self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def to_dict(self) -> Dict[str, Number]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Timer:
+    """``with histogram.time():`` observes the block's duration in seconds."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Registry:
+    """Named metrics, each name optionally split by labels.
+
+    Asking for the same name and labels twice returns the same metric, so
+    modules can look their metrics up at import time and keep a reference.
+    """
+
+    def __init__(self):
+        self.help: Dict[str, str] = {}
+        self.metrics: Dict[str, Dict[Labels, Metric]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, help_text: str, factory, labels: Dict[str, str]):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self.metrics.setdefault(name, {})
+            self.help.setdefault(name, help_text)
+            metric = family.get(key)
+            if metric is None:
+                metric = family[key] = factory()
+            return metric
+
+    def counter(
+        self,
+        name: str,
+        help_text: str,
+        function: Optional[Callable[[], Number]] = None,
+        **labels: str,
+    ) -> Counter:
+        metric = self._get(name, help_text, Counter, labels)
+        if function is not None:
+            metric.function = function
+        return metric
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        function: Optional[Callable[[], Number]] = None,
+        **labels: str,
+    ) -> Gauge:
+        metric = self._get(name, help_text, Gauge, labels)
+        if function is not None:
+            metric.function = function
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float] = TIME_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        return self._get(name, help_text, lambda: Histogram(buckets), labels)
+
+    def collect(self) -> List[Tuple[str, Labels, Metric]]:
+        with self._lock:
+            return [
+                (name, labels, metric)
+                for name, family in sorted(self.metrics.items())
+                for labels, metric in family.items()
+            ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "timestamp": time.time(),
+                "metrics": [
+                    {
+                        "name": name,
+                        "type": metric.TYPE,
+                        "labels": dict(labels),
+                        **_finite(metric.to_dict()),
+                    }
+                    for name, labels, metric in self.collect()
+                ],
+            },
+            indent=1,
+        )
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines: List[str] = []
+        declared = set()
+        for name, labels, metric in self.collect():
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {metric.TYPE}")
+            if isinstance(metric, Histogram):
+                for bound, count in metric.cumulative():
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    bucket_labels = _format_labels((*labels, ("le", le)))
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum!r}")
+                lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {metric.value!r}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write a snapshot, as Prometheus text for ".prom"/".txt", else JSON.
+
+        The file is replaced atomically, so a collector never reads half of it.
+        """
+        if path.endswith((".prom", ".txt")):
+            text = self.to_prometheus()
+        else:
+            text = self.to_json()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary = path + ".tmp"
+        with open(temporary, mode="w") as file:
+            file.write(text)
+        os.replace(temporary, path)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _finite(values: Dict[str, Number]) -> Dict[str, Optional[Number]]:
+    # JSON has no NaN; an empty histogram's quantiles become null.
+    return {
+        key: None if isinstance(value, float) and math.isnan(value) else value
+        for key, value in values.items()
+    }
+
+
+class PeriodicExporter:
+    """Write ``registry`` to ``path`` every ``interval`` seconds on a thread."""
+
+    def __init__(self, path: str, interval: float = 10.0, registry=None):
+        self.path = path
+        self.interval = interval
+        self.registry: Registry = registry or REGISTRY
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="metrics-exporter", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+            self._write()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(max(self.interval, 0.1)):
+            self._write()
+
+    def _write(self) -> None:
+        try:
+            self.registry.write(self.path)
+        except OSError as e:
+            print(f"Metrics export error ({self.path}): {e}")
+
+
+# The process-wide registry the other packages report to.
+REGISTRY = Registry()
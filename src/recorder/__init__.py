@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import datetime
+import math
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+import alarms
+import can_utils as cu
+import frame_schema
+import metrics
+import session_log
+
+_DRAIN_SECONDS = metrics.REGISTRY.histogram(
+    "bms_recorder_drain_seconds", "Time to move one drain interval into the logs"
+)
+_OVERRUN_SAMPLES = metrics.REGISTRY.counter(
+    "bms_recorder_overrun_samples_total",
+    "Samples overwritten in the ring buffers before the recorder drained them",
+)
+
+# Rings hold this many drain intervals, so a late drain loses nothing.
+DRAIN_MARGIN = 4
+MIN_RING_CAPACITY = 256
+
+
+def ring_capacity(drain_interval: float, sample_rate: float) -> int:
+    """Samples per signal a ring needs to last DRAIN_MARGIN drain intervals
+    at ``sample_rate`` samples/s."""
+    return max(
+        MIN_RING_CAPACITY, math.ceil(sample_rate * drain_interval * DRAIN_MARGIN)
+    )
+
+
+class Recorder:
+    """Decode a CAN bus and write every BMS board to session logs, headless.
+
+    Samples are taken out of the receiver's ring buffers with one cursor per
+    board every ``drain_interval`` seconds and handed to one
+    BackgroundLogWriter per board, so the ring only has to hold a few drain
+    intervals (see ring_capacity). Samples the ring overwrote before a drain
+    are counted in ``overrun_samples``.
+    """
+
+    def __init__(
+        self,
+        receiver: cu.CANReceiver,
+        log_directory: str = "logs",
+        log_formats: Optional[List[str]] = None,
+        drain_interval: float = 0.5,
+        serve: str = "",
+    ):
+        self.receiver = receiver
+        self.log_directory = log_directory
+        self.log_formats = log_formats or ["bmslog"]
+        self.drain_interval = drain_interval
+        # Also publish the decoded stream on this address (see fanout).
+        self.serve = serve
+        self.start_time = time.time()
+        self.log_writers: Dict[int, session_log.BackgroundLogWriter] = {}
+        self.cursors: Dict[int, cu.Cursor] = {}
+        self.overrun_samples = 0
+        self.stop_event = asyncio.Event()
+
+    def log_basename(self, suffix: str) -> str:
+        start_time_str = datetime.datetime.fromtimestamp(self.start_time).strftime(
+            "%Y-%m-%d-%H-%M-%S"
+        )
+        return os.path.join(self.log_directory, f"{start_time_str}-{suffix}")
+
+    def open_log_writers(self, board_id: int) -> List[session_log.LogWriter]:
+        basename = self.log_basename(f"bms{board_id}")
+        return [
+            session_log.create_writer(log_format, basename)
+            for log_format in self.log_formats
+        ]
+
+    async def drain(self) -> None:
+        for board_id in self.receiver.board_ids:
+            cursor = self.cursors.get(board_id) or {}
+            new_samples, self.cursors[board_id] = await self.receiver.read_since(
+                cursor, board_id
+            )
+            if not new_samples:
+                continue
+            overrun = sum(
+                samples.seq - cursor.get(key, 0) - len(samples.timestamps)
+                for key, samples in new_samples.items()
+            )
+            if overrun:
+                self.overrun_samples += overrun
+                _OVERRUN_SAMPLES.inc(overrun)
+
+            log_writer = self.log_writers.get(board_id)
+            if log_writer is None:
+                log_writer = self.log_writers[board_id] = (
+                    session_log.BackgroundLogWriter(self.open_log_writers(board_id))
+                )
+            log_writer.submit(
+                {
+                    key: list(zip(samples.timestamps, samples.values))
+                    for key, samples in new_samples.items()
+                }
+            )
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def stats(self) -> Dict[str, int]:
+        totals = {
+            "frames": self.receiver.frames_received,
+            "boards": len(self.log_writers),
+            "overrun_samples": self.overrun_samples,
+        }
+        for log_writer in self.log_writers.values():
+            for key, value in log_writer.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    async def run(self, duration: float = 0.0, status_interval: float = 0.0) -> None:
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # e.g. Windows; Ctrl+C still raises KeyboardInterrupt
+
+        consumer = asyncio.create_task(self.receiver.process_messages(self.stop_event))
+        alarm_log = None
+        server = None
+        started = last_status = time.monotonic()
+        last_frames = 0
+        try:
+            # Inside the try, so a bus or port that cannot be opened still
+            # shuts down what was started.
+            self.receiver.start_receiving()
+            if self.receiver.alarms:
+                alarm_log = alarms.AlarmLog(self.log_basename("alarms.csv"))
+                self.receiver.alarms.listeners += [
+                    alarm_log,
+                    lambda event: print(event.describe(), file=sys.stderr, flush=True),
+                ]
+            if self.serve:
+                import fanout
+
+                server = fanout.FanoutServer(self.receiver, self.serve)
+                await server.start()
+            while not self.stop_event.is_set():
+                try:
+                    await asyncio.wait_for(
+                        self.stop_event.wait(), timeout=self.drain_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                with _DRAIN_SECONDS.time():
+                    await self.drain()
+
+                now = time.monotonic()
+                if duration > 0 and now - started >= duration:
+                    self.stop()
+                if status_interval > 0 and now - last_status >= status_interval:
+                    stats = self.stats()
+                    frame_rate = (stats["frames"] - last_frames) / (now - last_status)
+                    last_frames, last_status = stats["frames"], now
+                    print(
+                        f"{now - started:8.0f} s  {stats['frames']:,} frames"
+                        f"  {frame_rate:,.0f} frames/s  {stats['boards']} board(s)"
+                        f"  {stats.get('written_samples', 0):,} samples written"
+                        f"  {stats.get('dropped_samples', 0):,} dropped"
+                        f"  {stats['overrun_samples']:,} overrun"
+                        f"  {stats.get('write_errors', 0):,} write errors",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+        finally:
+            self.stop()
+            if server:
+                await server.stop()
+            self.receiver.stop_receiving()
+            await consumer
+            self.receiver.close()
+            await self.drain()
+            for log_writer in self.log_writers.values():
+                log_writer.close()
+            if alarm_log:
+                alarm_log.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argparser = argparse.ArgumentParser(
+        description="Record BMS data from a CAN bus to session logs without the GUI."
+    )
+    argparser.add_argument("--channel", default="can0")
+    argparser.add_argument("--interface", default="socketcan")
+    argparser.add_argument("--bitrate", type=int, default=500000)
+    argparser.add_argument(
+        "--bms-id",
+        type=int,
+        nargs="*",
+        default=[0x01],
+        help="board IDs to record, none given = every board",
+    )
+    argparser.add_argument("--log-directory", default="logs")
+    argparser.add_argument(
+        "--format",
+        nargs="+",
+        choices=sorted(session_log.WRITERS),
+        default=["bmslog"],
+        dest="log_formats",
+    )
+    argparser.add_argument(
+        "--max-data-points",
+        type=int,
+        default=0,
+        help="ring buffer size per signal, 0 = sized from --sample-rate",
+    )
+    argparser.add_argument("--drain-interval", type=float, default=0.5)
+    argparser.add_argument(
+        "--sample-rate",
+        type=float,
+        default=200.0,
+        help="highest expected samples/s of one signal, sizes the ring buffers",
+    )
+    argparser.add_argument(
+        "--duration", type=float, default=0.0, help="seconds, 0 = until stopped"
+    )
+    argparser.add_argument(
+        "--alarm-rules",
+        default="",
+        metavar="PATH",
+        help="JSON list of alarm rules (see alarms.Rule), default built-in limits",
+    )
+    argparser.add_argument(
+        "--schema",
+        default="",
+        metavar="PATH",
+        help="JSON frame schema to decode with instead of the built-in layout",
+    )
+    argparser.add_argument(
+        "--serve",
+        default="",
+        metavar="ADDRESS",
+        help="publish samples to viewers on host:port or a Unix socket path",
+    )
+    argparser.add_argument(
+        "--metrics-file",
+        default="",
+        help="write metrics here periodically, .prom = Prometheus text, else JSON",
+    )
+    argparser.add_argument("--metrics-interval", type=float, default=10.0)
+    argparser.add_argument(
+        "--status",
+        type=float,
+        default=0.0,
+        help="print a status line every N seconds, 0 = quiet",
+    )
+    args = argparser.parse_args(argv)
+
+    receiver = cu.CANReceiver(
+        channel=args.channel,
+        bitrate=args.bitrate,
+        max_data_points=args.max_data_points
+        or ring_capacity(args.drain_interval, args.sample_rate),
+        bms_id=args.bms_id,
+        interface=args.interface,
+    )
+    if args.schema:
+        receiver.use_schema(frame_schema.load(args.schema))
+    receiver.alarms = alarms.AlarmEngine(
+        alarms.load_rules(args.alarm_rules)
+        if args.alarm_rules
+        else alarms.DEFAULT_RULES
+    )
+    recorder = Recorder(
+        receiver,
+        log_directory=args.log_directory,
+        log_formats=args.log_formats,
+        drain_interval=args.drain_interval,
+        serve=args.serve,
+    )
+    exporter = None
+    if args.metrics_file:
+        exporter = metrics.PeriodicExporter(args.metrics_file, args.metrics_interval)
+        exporter.start()
+    try:
+        asyncio.run(recorder.run(duration=args.duration, status_interval=args.status))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exporter:
+            exporter.stop()
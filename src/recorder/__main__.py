@@ -0,0 +1,3 @@
+from recorder import main
+
+main()
@@ -0,0 +1,473 @@
+import argparse
+import asyncio
+import csv
+import heapq
+import random
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import can
+
+import can_utils as cu
+import frame_schema
+import session_log
+
+Event = Tuple[float, Union[can.Message, Dict[str, Union[int, float]]]]
+
+# The CLI stops waiting for the receiver after this long without progress.
+STALL_TIMEOUT = 2.0
+
+
+def _parse_value(text: str) -> Union[int, float]:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _is_session_csv(path: str) -> bool:
+    with open(path, newline="") as csv_file:
+        header = next(csv.reader(csv_file), [])
+    # python-can's own CSV logs describe frames, not signals.
+    return bool(header) and header[0] == "timestamp" and "arbitration_id" not in header
+
+
+def _iter_session_csv(path: str) -> Iterator[Event]:
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        for row in reader:
+            if row and row[0] == "timestamp":
+                header = row  # written by versions that added columns in place
+                continue
+            data = {
+                key: _parse_value(value)
+                for key, value in zip(header[1:], row[1:])
+                if value
+            }
+            if data:
+                yield float(row[0]), data
+
+
+def _iter_column(key: str, timestamps, values) -> Iterator[Tuple[float, str, float]]:
+    if values.typecode == "f":
+        # Undo float32 storage noise (3.7200000286 -> 3.72).
+        values = [round(value, 6) for value in values]
+    for timestamp, value in zip(timestamps, values):
+        yield timestamp, key, value
+
+
+def _iter_session_log(path: str) -> Iterator[Event]:
+    for chunk in session_log.iter_chunks(path):
+        samples = heapq.merge(
+            *(_iter_column(key, *columns) for key, columns in chunk.items())
+        )
+        data: Dict[str, Union[int, float]] = {}
+        current: Optional[float] = None
+        for timestamp, key, value in samples:
+            if timestamp != current and data:
+                yield current, data
+                data = {}
+            current = timestamp
+            data[key] = value
+        if data:
+            yield current, data
+
+
+def _iter_frames(path: str) -> Iterator[Event]:
+    for message in can.LogReader(path):
+        if not (message.is_error_frame or message.is_remote_frame):
+            yield message.timestamp, message
+
+
+def iter_events(path: str) -> Iterator[Event]:
+    """Yield (timestamp, frame-or-samples) from any supported recording.
+
+    Our own session logs (.bmslog and signal CSVs) yield decoded sample dicts;
+    everything python-can's LogReader understands (candump .log, .asc, .blf,
+    frame CSVs, ...) yields raw frames.
+    """
+    if path.endswith(session_log.ColumnarLogWriter.EXTENSION):
+        return _iter_session_log(path)
+    if path.endswith(session_log.CSVLogWriter.EXTENSION) and _is_session_csv(path):
+        return _iter_session_csv(path)
+    return _iter_frames(path)
+
+
+class Replayer:
+    """Feed a recording into a CANReceiver at ``speed`` times real time.
+
+    A speed of 0 or less replays as fast as possible. Raw frames go out on
+    the receiver's own bus when it listens on a ``virtual`` interface, so the
+    whole receive path is exercised; otherwise they are parsed here and
+    injected. Decoded session logs are always injected. Frames keep their
+    recorded timestamps either way.
+    """
+
+    # How long stop() waits for the thread; pacing waits end at once, so
+    # only a bus send or file read can still be in progress.
+    STOP_TIMEOUT = 1.0
+
+    def __init__(self, path: str, receiver: cu.CANReceiver, speed: float = 1.0):
+        self.path = path
+        self.receiver = receiver
+        self.speed = speed
+        self.frames = 0
+        # Frames put on the bus that pass the receiver's filters, i.e. what
+        # its frames_received will count.
+        self.matched_frames = 0
+        self.samples = 0
+        self.elapsed = 0.0
+        self._is_running = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        if not self._is_running:
+            self._is_running = True
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._replay, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._is_running = False
+        self._stop_event.set()
+        self.join(self.STOP_TIMEOUT)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def _send(
+        self,
+        bus: can.BusABC,
+        filters: List[Tuple[int, int, bool]],
+        message: can.Message,
+    ) -> None:
+        bus.send(message)
+        arbitration_id = message.arbitration_id
+        if any(
+            arbitration_id & mask == can_id and message.is_extended_id == extended
+            for can_id, mask, extended in filters
+        ):
+            self.matched_frames += 1
+
+    def _replay(self) -> None:
+        bus: Optional[can.BusABC] = None
+        if self.receiver.interface == "virtual":
+            bus = can.Bus(
+                interface="virtual",
+                channel=self.receiver.channel,
+                preserve_timestamps=True,
+            )
+            filters = [
+                (f["can_id"] & f["can_mask"], f["can_mask"], f["extended"])
+                for f in self.receiver.parser.can_filters()
+            ]
+        parser = self.receiver.parser
+        first_timestamp: Optional[float] = None
+        start = time.monotonic()
+        try:
+            for timestamp, event in iter_events(self.path):
+                if not self._is_running:
+                    break
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                if self.speed > 0:
+                    delay = (
+                        start
+                        + (timestamp - first_timestamp) / self.speed
+                        - time.monotonic()
+                    )
+                    if delay > 0 and self._stop_event.wait(delay):
+                        break
+
+                if isinstance(event, can.Message):
+                    self.frames += 1
+                    if bus:
+                        self._send(bus, filters, event)
+                        continue
+                    parsed = parser.parse_frame(event)
+                    if not parsed:
+                        continue
+                    board_id, event = parsed
+                    self.receiver.inject(timestamp, event, board_id)
+                else:
+                    self.receiver.inject(timestamp, event)
+                self.samples += len(event)
+        finally:
+            self.elapsed = time.monotonic() - start
+            self._is_running = False
+            if bus:
+                bus.shutdown()
+
+
+class SyntheticBMS:
+    """Generates realistic frames for every ID CANParser understands.
+
+    Each call to ``cycle`` advances a simple pack model (slow discharge, noisy
+    current, per-cell spread, warming thermistors) and returns one complete
+    set of frames per board: 0x40xx-0x43xx summaries followed by packed
+    0x44xx cell and 0x45xx thermistor frames, four readings per frame.
+    """
+
+    _VOLTAGE_CURRENT = struct.Struct("<I i")
+    _CELL_VOLTAGE = struct.Struct("<I I")
+    _SOC_DUTY = struct.Struct("<H H B B B B")
+    _TEMP = struct.Struct("<h h h h")
+    _PACKED = struct.Struct("<H H H H")
+
+    def __init__(
+        self,
+        board_ids: Iterable[int] = (0x01,),
+        cells: int = 96,
+        thermistors: int = 32,
+        seed: int = 0,
+    ):
+        if cells > len(cu.CANParser.CELL_KEYS):
+            raise ValueError(f"at most {len(cu.CANParser.CELL_KEYS)} cells")
+        if thermistors > len(cu.CANParser.THRM_KEYS):
+            raise ValueError(f"at most {len(cu.CANParser.THRM_KEYS)} thermistors")
+        self.board_ids = list(board_ids)
+        self.cells = cells
+        self.thermistors = thermistors
+        self._rng = random.Random(seed)
+        self._soc = {board_id: 95.0 for board_id in self.board_ids}
+        self._current = {board_id: -20.0 for board_id in self.board_ids}
+        self._cell_offsets = {
+            board_id: [self._rng.gauss(0, 0.02) for _ in range(cells)]
+            for board_id in self.board_ids
+        }
+        self._temperatures = {
+            board_id: [25.0 + self._rng.gauss(0, 1) for _ in range(thermistors)]
+            for board_id in self.board_ids
+        }
+
+    @property
+    def frames_per_cycle(self) -> int:
+        per_board = 4 + -(-self.cells // 4) + -(-self.thermistors // 4)
+        return per_board * len(self.board_ids)
+
+    def cycle(self, timestamp: float = 0.0) -> List[can.Message]:
+        frames = []
+        for board_id in self.board_ids:
+            frames.extend(self._board_frames(board_id, timestamp))
+        return frames
+
+    def iter_frames(
+        self, frame_rate: float = 0.0, start: float = 0.0
+    ) -> Iterator[can.Message]:
+        """Endless frame stream, timestamped at ``frame_rate`` frames/s if given."""
+        timestamp = start
+        while True:
+            for message in self.cycle(timestamp):
+                if frame_rate > 0:
+                    message.timestamp = timestamp
+                    timestamp += 1.0 / frame_rate
+                yield message
+
+    def send(self, bus: can.BusABC, count: int, frame_rate: float = 0.0) -> None:
+        """Put ``count`` frames on ``bus``, paced at ``frame_rate`` if given."""
+        start = time.monotonic()
+        frames = self.iter_frames()
+        for index in range(count):
+            if frame_rate > 0:
+                delay = start + index / frame_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            bus.send(next(frames))
+
+    def _board_frames(self, board_id: int, timestamp: float) -> List[can.Message]:
+        rng = self._rng
+        current = self._current[board_id] = max(
+            -200.0, min(200.0, self._current[board_id] + rng.gauss(0, 0.5))
+        )
+        soc = self._soc[board_id] = max(0.0, self._soc[board_id] - 0.001)
+        base = 3.3 + 0.9 * soc / 100 + current * 0.0005
+        cells = [
+            max(0.0, min(5.11, base + offset + rng.gauss(0, 0.003)))
+            for offset in self._cell_offsets[board_id]
+        ]
+        temperatures = self._temperatures[board_id]
+        for i in range(len(temperatures)):
+            temperatures[i] = max(
+                -40.0, min(120.0, temperatures[i] + rng.gauss(0.001, 0.05))
+            )
+
+        pack_voltage = sum(cells) if cells else base * 14
+        min_cell, max_cell = min(cells, default=base), max(cells, default=base)
+        average_temp = sum(temperatures) / len(temperatures) if temperatures else 25.0
+        max_temp = max(temperatures, default=average_temp)
+        payloads = [
+            (
+                cu.CANParser.BATTERY_VOLTAGE_CURRENT_ID,
+                self._VOLTAGE_CURRENT.pack(
+                    round(pack_voltage / 100e-6), round(current / 1e-3)
+                ),
+            ),
+            (
+                cu.CANParser.CELL_VOLTAGE_ID,
+                self._CELL_VOLTAGE.pack(
+                    round(min_cell / 100e-6), round(max_cell / 100e-6)
+                ),
+            ),
+            (
+                cu.CANParser.SOC_DUTY_ID,
+                self._SOC_DUTY.pack(0, round(soc * 50), round(soc), 0, 0, 0),
+            ),
+            (
+                cu.CANParser.TEMP_ID,
+                self._TEMP.pack(
+                    round(average_temp),
+                    round(max_temp),
+                    round(average_temp) + 3,
+                    round(max_temp) + 5,
+                ),
+            ),
+        ]
+        for first in range(0, self.cells, 4):
+            words = [
+                (cell << 9) | round(cells[cell] / 10e-3)
+                for cell in range(first, min(first + 4, self.cells))
+            ]
+            words += words[-1:] * (4 - len(words))
+            payloads.append(
+                (cu.CANParser.EACH_CELL_VOLTAGE_ID, self._PACKED.pack(*words))
+            )
+        for first in range(0, self.thermistors, 4):
+            words = []
+            for thrm in range(first, min(first + 4, self.thermistors)):
+                temperature = round(temperatures[thrm])
+                sign = 0x0200 if temperature < 0 else 0
+                words.append((thrm << 10) | sign | min(abs(temperature), 0x01FF))
+            words += words[-1:] * (4 - len(words))
+            payloads.append(
+                (cu.CANParser.EACH_TEMPERATURE_ID, self._PACKED.pack(*words))
+            )
+
+        return [
+            can.Message(
+                timestamp=timestamp,
+                arbitration_id=base_id + board_id,
+                data=data,
+                is_extended_id=True,
+            )
+            for base_id, data in payloads
+        ]
+
+
+class SyntheticBus:
+    """Bus stand-in yielding SyntheticBMS frames at ``frame_rate`` frames/s
+    (0 = as fast as they are read), e.g. for capture without hardware."""
+
+    def __init__(self, board_ids: cu.BoardIds, frame_rate: float = 0.0):
+        board_ids = cu.normalize_board_ids(board_ids) or [0x01]
+        self._frames = SyntheticBMS(board_ids=board_ids).iter_frames()
+        self.frame_rate = frame_rate
+        self._start = time.monotonic()
+        self._sent = 0
+
+    def recv(self, timeout: Optional[float] = None):
+        if self.frame_rate > 0:
+            delay = self._start + self._sent / self.frame_rate - time.monotonic()
+            if delay > 0:
+                if timeout is not None and delay > timeout:
+                    time.sleep(timeout)
+                    return None
+                time.sleep(delay)
+        self._sent += 1
+        return next(self._frames)
+
+    def shutdown(self) -> None:
+        pass
+
+
+async def _replay(receiver: cu.CANReceiver, replayer: Replayer) -> float:
+    stop_event = asyncio.Event()
+    consumer = asyncio.create_task(receiver.process_messages(stop_event))
+    start = time.monotonic()
+    receiver.start_receiving()
+    replayer.start()
+    await asyncio.to_thread(replayer.join)
+    # Frames the receiver's filters drop are never counted, so wait for the
+    # ones that pass them rather than for everything that was sent.
+    progress = None
+    progressed = time.monotonic()
+    while (
+        not consumer.done()
+        and receiver.is_reading
+        and (
+            receiver.frames_received < replayer.matched_frames
+            or receiver.pending_frames
+        )
+    ):
+        await asyncio.sleep(0.01)
+        now = time.monotonic()
+        if (receiver.frames_received, receiver.pending_frames) != progress:
+            progress = (receiver.frames_received, receiver.pending_frames)
+            progressed = now
+        elif now - progressed > STALL_TIMEOUT:
+            break
+    elapsed = time.monotonic() - start
+    if receiver.frames_received < replayer.matched_frames:
+        print(
+            f"Replay error: the receiver stopped after {receiver.frames_received}"
+            f" of {replayer.matched_frames} frames"
+        )
+    stop_event.set()
+    receiver.stop_receiving()
+    await consumer
+    return elapsed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argparser = argparse.ArgumentParser(
+        description="Replay a recording through CANReceiver without hardware."
+    )
+    argparser.add_argument("path", help="session log, candump .log, .asc, .blf, ...")
+    argparser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="N x real time, 0 = as fast as possible",
+    )
+    argparser.add_argument(
+        "--bms-id",
+        type=int,
+        nargs="*",
+        default=[0x01],
+        help="board IDs to decode, none given = every board",
+    )
+    argparser.add_argument("--max-data-points", type=int, default=1000)
+    argparser.add_argument(
+        "--schema",
+        default="",
+        metavar="PATH",
+        help="JSON frame schema to decode with instead of the built-in layout",
+    )
+    args = argparser.parse_args(argv)
+
+    receiver = cu.CANReceiver(
+        channel="replay",
+        bms_id=args.bms_id,
+        max_data_points=args.max_data_points,
+        interface="virtual",
+    )
+    if args.schema:
+        receiver.use_schema(frame_schema.load(args.schema))
+    replayer = Replayer(args.path, receiver, speed=args.speed)
+    elapsed = asyncio.run(_replay(receiver, replayer))
+
+    stored = sum(
+        buffer.seq for board in receiver.boards.values() for buffer in board.values()
+    )
+    print(f"replayed {replayer.frames} frames, {stored} samples in {elapsed:.2f} s")
+    if elapsed > 0:
+        frame_rate = replayer.frames / elapsed
+        print(f"{frame_rate:,.0f} frames/s, {stored / elapsed:,.0f} samples/s")
@@ -0,0 +1,3 @@
+from replay import main
+
+main()
@@ -0,0 +1,861 @@
+import csv
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import (
+    IO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+import metrics
+
+Samples = Dict[str, Sequence[Tuple[float, Union[int, float]]]]
+Columns = Dict[str, Tuple[array, array]]
+
+
+class LogWriter:
+    EXTENSION = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO] = None
+
+    def write(self, samples: Samples) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        if self._file:
+            self._file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class CSVLogWriter(LogWriter):
+    """One row per timestamp, one column per key, under a single header row,
+    so any CSV reader takes the file as it is.
+
+    When a key appears that the header lacks, the file is closed and the
+    rows continue in a new one ("log-2.csv", "log-3.csv", ...) whose header
+    has every column so far. An existing file is never appended to; the
+    next free name is used instead. ``paths`` lists the files written.
+    """
+
+    EXTENSION = ".csv"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.columns: List[str] = []
+        self.paths: List[str] = []
+        self._writer = None
+
+    def _part_path(self, part: int) -> str:
+        if part == 1:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return f"{root}-{part}{extension}"
+
+    def _open_part(self) -> None:
+        self.close()
+        part = len(self.paths) + 1
+        while os.path.exists(self._part_path(part)):
+            part += 1
+        path = self._part_path(part)
+        self.paths.append(path)
+        self._file = open(path, mode="w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["timestamp"] + self.columns)
+
+    def write(self, samples: Samples) -> None:
+        if not samples:
+            return
+        new_keys = [key for key in samples if key not in self.columns]
+        if new_keys or self._file is None:
+            self.columns += new_keys
+            self._open_part()
+
+        rows: Dict[float, Dict[str, Union[int, float]]] = {}
+        for key, key_data in samples.items():
+            for timestamp, value in key_data:
+                rows.setdefault(timestamp, {}).setdefault(key, value)
+
+        columns = self.columns
+        self._writer.writerows(
+            [timestamp] + [row.get(key, "") for key in columns]
+            for timestamp, row in sorted(rows.items())
+        )
+
+
+# Columnar session log (".bmslog")
+#
+#   file   := MAGIC record*
+#   record := tag (4 bytes) | payload length (u32) | payload
+#
+#   SGNL   declares signals as they first appear: (index u16, len u8, utf-8 name)*
+#   CHNK   zlib-compressed columns: column count u32, then per column
+#          index u16 | value typecode (1 byte) | count u32 | f8 timestamps | values
+#
+# Records are only ever appended, so a log cut short by a crash stays readable
+# up to its last complete record.
+#
+# Sidecar index (log path + ".idx"), same record framing:
+#
+#   file   := INDEX_MAGIC record*
+#   SGNL   copy of the log's signal declarations
+#   BLCK   one per CHNK record: log offset u64 | record size u32 | first and
+#          last timestamp f8 f8, then per column index u16 | count u32 |
+#          min f8 | max f8 | mean f8
+#
+# so a reader can pick the chunks covering a time range without touching the
+# rest of the log, and draw an overview from the summaries alone.
+MAGIC = b"BMSLOG\x00\x01"
+INDEX_MAGIC = b"BMSIDX\x00\x01"
+INDEX_EXTENSION = ".idx"
+TAG_SIGNALS = b"SGNL"
+TAG_CHUNK = b"CHNK"
+TAG_BLOCK = b"BLCK"
+_RECORD = struct.Struct("<4s I")
+_SIGNAL = struct.Struct("<H B")
+_COLUMN_COUNT = struct.Struct("<I")
+_COLUMN = struct.Struct("<H c I")
+_BLOCK = struct.Struct("<Q I d d")
+_SUMMARY = struct.Struct("<H I d d d")
+
+
+class Block(NamedTuple):
+    """One CHNK record of a columnar log, as described by the index.
+
+    The per-column summaries stay packed until an overview needs them, so
+    opening the index of a long session only decodes the block headers.
+    """
+
+    offset: int
+    size: int
+    start: float
+    end: float
+    names: Dict[int, str]  # column index -> key, shared by consecutive blocks
+    summaries: bytes
+
+
+def _column_typecode(values: array) -> str:
+    if values.typecode == "d":
+        return "f"
+    low, high = min(values), max(values)
+    if -0x8000 <= low and high <= 0x7FFF:
+        return "h"
+    if -0x80000000 <= low and high <= 0x7FFFFFFF:
+        return "i"
+    return "q"
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class ColumnarLogWriter(LogWriter):
+    EXTENSION = ".bmslog"
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 8192,
+        compress_level: int = 6,
+        index: bool = True,
+    ):
+        super().__init__(path)
+        self.chunk_size = chunk_size
+        self.compress_level = compress_level
+        self.index_path = path + INDEX_EXTENSION if index else None
+        self.signals: Dict[str, int] = {}
+        self._next_signal = 0
+        self._pending: Dict[str, Tuple[array, array]] = {}
+        self._pending_count = 0
+        self._index_file: Optional[IO] = None
+
+    def write(self, samples: Samples) -> None:
+        for key, key_data in samples.items():
+            if not key_data:
+                continue
+            column = self._pending.get(key)
+            if column is None:
+                typecode = "q" if isinstance(key_data[0][1], int) else "d"
+                column = self._pending[key] = (array("d"), array(typecode))
+            timestamps, values = column
+            for timestamp, value in key_data:
+                timestamps.append(timestamp)
+                values.append(value)
+            self._pending_count += len(key_data)
+
+        if self._pending_count >= self.chunk_size:
+            self._write_chunk()
+
+    def flush(self) -> None:
+        self._write_chunk()
+        super().flush()
+        if self._index_file:
+            self._index_file.flush()
+
+    def close(self) -> None:
+        super().close()
+        if self._index_file:
+            self._index_file.close()
+            self._index_file = None
+
+    def _open(self) -> IO:
+        if self._file is None:
+            if os.path.exists(self.path):
+                self._resume()
+            self._file = open(self.path, mode="ab")
+            if self._file.tell() == 0:
+                self._file.write(MAGIC)
+        return self._file
+
+    def _resume(self) -> None:
+        """Prepare to append to an existing log.
+
+        A record torn by a crash is cut off, or the new records would be read
+        as its missing tail; signal numbering carries on from the log's, and
+        the index is rebuilt if it does not match what is left.
+        """
+        names: Dict[int, str] = {}
+        with open(self.path, mode="rb") as file:
+            head = file.read(len(MAGIC))
+            if head == MAGIC:
+                end = _records_end(file, len(MAGIC), names)
+            elif MAGIC.startswith(head):
+                end = 0  # torn before the magic was complete
+            else:
+                raise ValueError(f"{self.path} is not a columnar session log")
+        self.signals = {key: index for index, key in names.items()}
+        self._next_signal = max(names, default=-1) + 1
+        if end < os.path.getsize(self.path):
+            os.truncate(self.path, end)
+        if self.index_path and end and not _index_complete(self.path):
+            build_index(self.path)
+
+    def _open_index(self) -> IO:
+        if self._index_file is None:
+            self._index_file = open(self.index_path, mode="ab")
+            if self._index_file.tell() == 0:
+                self._index_file.write(INDEX_MAGIC)
+        return self._index_file
+
+    def _write_chunk(self) -> None:
+        if not self._pending_count:
+            return
+        file = self._open()
+
+        signals_record = b""
+        new_signals = [key for key in self._pending if key not in self.signals]
+        if new_signals:
+            for key in new_signals:
+                self.signals[key] = self._next_signal
+                self._next_signal += 1
+            payload = _signals_payload((self.signals[key], key) for key in new_signals)
+            signals_record = _RECORD.pack(TAG_SIGNALS, len(payload)) + payload
+            file.write(signals_record)
+
+        payload = bytearray(_COLUMN_COUNT.pack(len(self._pending)))
+        columns = []
+        for key, (timestamps, values) in self._pending.items():
+            typecode = _column_typecode(values)
+            payload += _COLUMN.pack(
+                self.signals[key], typecode.encode(), len(timestamps)
+            )
+            values = array(typecode, values)
+            payload += _to_bytes(timestamps)
+            payload += _to_bytes(values)
+            columns.append((self.signals[key], timestamps, values))
+        payload = zlib.compress(payload, self.compress_level)
+        offset = file.tell()
+        file.write(_RECORD.pack(TAG_CHUNK, len(payload)) + payload)
+
+        if self.index_path:
+            block = _block_payload(offset, _RECORD.size + len(payload), columns)
+            self._open_index().write(
+                signals_record + _RECORD.pack(TAG_BLOCK, len(block)) + block
+            )
+
+        self._pending.clear()
+        self._pending_count = 0
+
+
+def _signals_payload(signals: Iterable[Tuple[int, str]]) -> bytes:
+    payload = bytearray()
+    for index, key in signals:
+        name = key.encode()
+        payload += _SIGNAL.pack(index, len(name)) + name
+    return bytes(payload)
+
+
+def _parse_signals(payload: bytes, signals: Dict[int, str]) -> None:
+    offset = 0
+    while offset < len(payload):
+        index, name_length = _SIGNAL.unpack_from(payload, offset)
+        offset += _SIGNAL.size
+        signals[index] = payload[offset : offset + name_length].decode()
+        offset += name_length
+
+
+def _iter_records(file: IO, offset: int) -> Iterator[Tuple[int, bytes, bytes]]:
+    """Yield (offset, tag, payload) for each complete record from ``offset``."""
+    file.seek(offset)
+    while True:
+        header = file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return
+        tag, length = _RECORD.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length:
+            return
+        yield offset, tag, payload
+        offset += _RECORD.size + length
+
+
+def _records_end(file: IO, offset: int, names: Dict[int, str]) -> int:
+    """End of the last complete record from ``offset``, collecting the signal
+    declarations on the way."""
+    for record_offset, tag, payload in _iter_records(file, offset):
+        if tag == TAG_SIGNALS:
+            _parse_signals(payload, names)
+        offset = record_offset + _RECORD.size + len(payload)
+    return offset
+
+
+def _open_log(path: str, magic: bytes = MAGIC) -> IO:
+    file = open(path, mode="rb")
+    if file.read(len(magic)) != magic:
+        file.close()
+        raise ValueError(f"{path} is not a columnar session log")
+    return file
+
+
+def iter_chunks(path: str) -> Iterator[Columns]:
+    """Yield each chunk of a columnar log as {key: (timestamps, values)}."""
+    signals: Dict[int, str] = {}
+    with _open_log(path) as file:
+        for _, tag, payload in _iter_records(file, len(MAGIC)):
+            if tag == TAG_SIGNALS:
+                _parse_signals(payload, signals)
+            elif tag == TAG_CHUNK:
+                yield _decode_chunk(zlib.decompress(payload), signals)
+
+
+def _decode_chunk(
+    payload: bytes,
+    signals: Dict[int, str],
+    keys: Optional[Iterable[str]] = None,
+) -> Columns:
+    columns: Columns = {}
+    (count,) = _COLUMN_COUNT.unpack_from(payload)
+    offset = _COLUMN_COUNT.size
+    for _ in range(count):
+        index, typecode, length = _COLUMN.unpack_from(payload, offset)
+        offset += _COLUMN.size
+        typecode = typecode.decode()
+        itemsize = array(typecode).itemsize
+        end = offset + (8 + itemsize) * length
+        key = signals[index]
+        if keys is None or key in keys:
+            timestamps = _from_bytes("d", payload[offset : offset + 8 * length])
+            values = _from_bytes(typecode, payload[offset + 8 * length : end])
+            columns[key] = (timestamps, values)
+        offset = end
+    return columns
+
+
+def _extend_columns(result: Columns, chunk: Columns) -> None:
+    for key, (timestamps, values) in chunk.items():
+        if key not in result:
+            result[key] = (timestamps, values)
+            continue
+        stored_timestamps, stored_values = result[key]
+        stored_timestamps.extend(timestamps)
+        if stored_values.typecode != values.typecode:
+            typecode = "d" if "f" in (stored_values.typecode, values.typecode) else "q"
+            if stored_values.typecode != typecode:
+                stored_values = array(typecode, stored_values)
+                result[key] = (stored_timestamps, stored_values)
+            values = array(typecode, values)
+        stored_values.extend(values)
+
+
+def read_log(path: str) -> Columns:
+    """Load a whole columnar log, concatenating each signal's chunks."""
+    result: Columns = {}
+    for chunk in iter_chunks(path):
+        _extend_columns(result, chunk)
+    return result
+
+
+def _block_payload(
+    offset: int, size: int, columns: Iterable[Tuple[int, array, array]]
+) -> bytes:
+    """Index entry for a chunk stored at ``offset``, from its (stored) columns."""
+    summaries = bytearray()
+    start, end = float("inf"), float("-inf")
+    for index, timestamps, values in columns:
+        start = min(start, min(timestamps))
+        end = max(end, max(timestamps))
+        summaries += _SUMMARY.pack(
+            index, len(values), min(values), max(values), sum(values) / len(values)
+        )
+    return _BLOCK.pack(offset, size, start, end) + summaries
+
+
+def _parse_block(payload: bytes, names: Dict[int, str]) -> Block:
+    return Block(*_BLOCK.unpack_from(payload), names, payload[_BLOCK.size :])
+
+
+def read_index(path: str) -> List[Block]:
+    """Load the sidecar index of a columnar log, empty if there is none.
+
+    See IndexedLogReader for logs whose index lags behind.
+    """
+    blocks: List[Block] = []
+    if not os.path.exists(path + INDEX_EXTENSION):
+        return blocks
+    signals: Dict[int, str] = {}
+    with _open_log(path + INDEX_EXTENSION, INDEX_MAGIC) as file:
+        for _, tag, payload in _iter_records(file, len(INDEX_MAGIC)):
+            if tag == TAG_SIGNALS:
+                signals = dict(signals)  # earlier blocks keep their names
+                _parse_signals(payload, signals)
+            elif tag == TAG_BLOCK:
+                blocks.append(_parse_block(payload, signals))
+    return blocks
+
+
+def _index_end(blocks: List[Block]) -> int:
+    return blocks[-1].offset + blocks[-1].size if blocks else len(MAGIC)
+
+
+def _index_complete(path: str) -> bool:
+    """Whether the index covers the whole log and has no torn record itself."""
+    index_path = path + INDEX_EXTENSION
+    if not os.path.exists(index_path):
+        return os.path.getsize(path) == len(MAGIC)
+    try:
+        blocks = read_index(path)
+        with _open_log(index_path, INDEX_MAGIC) as file:
+            index_end = _records_end(file, len(INDEX_MAGIC), {})
+    except ValueError:
+        return False
+    return _index_end(blocks) == os.path.getsize(path) and index_end == (
+        os.path.getsize(index_path)
+    )
+
+
+def _scan_log(path: str, offset: int, names: Dict[int, str]) -> List[Block]:
+    """Index the chunks of a log from ``offset`` on, the slow way.
+
+    ``names`` are the signals declared before ``offset``.
+    """
+    blocks = []
+    with _open_log(path) as file:
+        for record_offset, tag, payload in _iter_records(file, offset):
+            if tag == TAG_SIGNALS:
+                names = dict(names)
+                _parse_signals(payload, names)
+            elif tag == TAG_CHUNK:
+                indexes = {key: index for index, key in names.items()}
+                chunk = _decode_chunk(zlib.decompress(payload), names)
+                block = _block_payload(
+                    record_offset,
+                    _RECORD.size + len(payload),
+                    (
+                        (indexes[key], timestamps, values)
+                        for key, (timestamps, values) in chunk.items()
+                    ),
+                )
+                blocks.append(_parse_block(block, names))
+    return blocks
+
+
+def build_index(path: str) -> int:
+    """(Re)write the sidecar index of a columnar log; returns the block count."""
+    blocks = _scan_log(path, len(MAGIC), {})
+    temporary = path + INDEX_EXTENSION + ".tmp"
+    with open(temporary, mode="wb") as file:
+        file.write(INDEX_MAGIC)
+        declared: Dict[int, str] = {}
+        for block in blocks:
+            new_signals = [
+                (index, key)
+                for index, key in block.names.items()
+                if declared.get(index) != key
+            ]
+            if new_signals:
+                declared.update(new_signals)
+                payload = _signals_payload(new_signals)
+                file.write(_RECORD.pack(TAG_SIGNALS, len(payload)) + payload)
+            payload = _BLOCK.pack(*block[:4]) + block.summaries
+            file.write(_RECORD.pack(TAG_BLOCK, len(payload)) + payload)
+    os.replace(temporary, path + INDEX_EXTENSION)
+    return len(blocks)
+
+
+class Overview(NamedTuple):
+    """Per-bucket summaries of one signal, in time order."""
+
+    start: List[float]
+    end: List[float]
+    count: List[int]
+    low: List[float]
+    high: List[float]
+    mean: List[float]
+
+
+class IndexedLogReader:
+    """Time-range access to a columnar log through its sidecar index.
+
+    ``read`` maps the log into memory and decompresses only the chunks
+    overlapping the requested range;
+    ``overview`` answers from the per-chunk summaries without reading the log
+    at all. Chunks the index does not cover yet (a log still being written,
+    one cut short by a crash, one from before indexing) are summarized from
+    the log itself; call ``refresh`` to pick up chunks written since.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.blocks = read_index(path)
+        size = os.path.getsize(path)
+        while self.blocks and _index_end(self.blocks) > size:
+            self.blocks.pop()
+        self.refresh()
+
+    def refresh(self) -> int:
+        """Index chunks appended to the log since; returns how many."""
+        names = self.blocks[-1].names if self.blocks else {}
+        new_blocks = _scan_log(self.path, _index_end(self.blocks), names)
+        self.blocks.extend(new_blocks)
+        return len(new_blocks)
+
+    @property
+    def keys(self) -> List[str]:
+        keys: Dict[str, None] = {}
+        names = None
+        for block in self.blocks:
+            if block.names is not names:
+                names = block.names
+                keys.update(dict.fromkeys(names.values()))
+        return list(keys)
+
+    @property
+    def start(self) -> Optional[float]:
+        return min((block.start for block in self.blocks), default=None)
+
+    @property
+    def end(self) -> Optional[float]:
+        return max((block.end for block in self.blocks), default=None)
+
+    def _blocks(self, start: Optional[float], end: Optional[float]) -> List[Block]:
+        return [
+            block
+            for block in self.blocks
+            if (start is None or block.end >= start)
+            and (end is None or block.start <= end)
+        ]
+
+    def read(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        keys: Optional[List[str]] = None,
+    ) -> Columns:
+        """Samples with ``start <= timestamp <= end``, as read_log returns them."""
+        result: Columns = {}
+        wanted = None if keys is None else set(keys)
+        low = float("-inf") if start is None else start
+        high = float("inf") if end is None else end
+        with open(self.path, mode="rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            if data[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{self.path} is not a columnar session log")
+            for block in self._blocks(start, end):
+                payload = zlib.decompress(
+                    data[block.offset + _RECORD.size : block.offset + block.size]
+                )
+                chunk = _decode_chunk(payload, block.names, wanted)
+                if block.start < low or block.end > high:
+                    for key, (timestamps, values) in chunk.items():
+                        inside = [
+                            i for i, t in enumerate(timestamps) if low <= t <= high
+                        ]
+                        chunk[key] = (
+                            array("d", [timestamps[i] for i in inside]),
+                            array(values.typecode, [values[i] for i in inside]),
+                        )
+                _extend_columns(result, chunk)
+        return result
+
+    def overview(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        keys: Optional[List[str]] = None,
+        points: int = 1000,
+    ) -> Dict[str, Overview]:
+        """Min/max/mean of each signal in at most ``points`` time buckets.
+
+        Built from the index only, so chunks straddling ``start`` or ``end``
+        contribute their whole summary.
+        """
+        blocks = self._blocks(start, end)
+        if not blocks:
+            return {}
+        low = min(block.start for block in blocks) if start is None else start
+        high = max(block.end for block in blocks) if end is None else end
+        width = (high - low) / points
+        wanted = None if keys is None else set(keys)
+
+        # {key: {bucket: [start, end, count, low, high, sum]}}
+        buckets: Dict[str, Dict[int, list]] = {}
+        for position, block in enumerate(blocks):
+            if len(blocks) <= points or width <= 0:
+                bucket = position
+            else:
+                bucket = min(max(int((block.start - low) / width), 0), points - 1)
+            names = block.names
+            for index, count, minimum, maximum, mean in _SUMMARY.iter_unpack(
+                block.summaries
+            ):
+                key = names[index]
+                if wanted is not None and key not in wanted:
+                    continue
+                key_buckets = buckets.setdefault(key, {})
+                entry = key_buckets.get(bucket)
+                if entry is None:
+                    key_buckets[bucket] = [
+                        block.start,
+                        block.end,
+                        count,
+                        minimum,
+                        maximum,
+                        mean * count,
+                    ]
+                    continue
+                entry[0] = min(entry[0], block.start)
+                entry[1] = max(entry[1], block.end)
+                entry[2] += count
+                entry[3] = min(entry[3], minimum)
+                entry[4] = max(entry[4], maximum)
+                entry[5] += mean * count
+
+        result = {}
+        for key, key_buckets in buckets.items():
+            entries = [key_buckets[bucket] for bucket in sorted(key_buckets)]
+            for entry in entries:
+                entry[5] /= entry[2]
+            result[key] = Overview(*map(list, zip(*entries)))
+        return result
+
+
+_WRITE_SECONDS = metrics.REGISTRY.histogram(
+    "bms_log_write_seconds", "Time to hand one batch to the log writers"
+)
+_FLUSH_SECONDS = metrics.REGISTRY.histogram(
+    "bms_log_flush_seconds", "Time to flush the log writers"
+)
+_WRITTEN_SAMPLES = metrics.REGISTRY.counter(
+    "bms_log_written_samples_total", "Samples written to session logs"
+)
+_DROPPED_SAMPLES = metrics.REGISTRY.counter(
+    "bms_log_dropped_samples_total",
+    "Samples dropped because the log writer queue was full",
+)
+_WRITE_ERRORS = metrics.REGISTRY.counter(
+    "bms_log_write_errors_total", "Log writer calls that raised"
+)
+
+
+class BackgroundLogWriter:
+    """Runs a set of LogWriters on a dedicated thread.
+
+    Batches are handed over through a bounded queue; when the disk falls
+    behind, new batches are dropped and counted instead of blocking the
+    caller. Files are flushed once ``flush_samples`` samples are pending or
+    ``flush_interval`` seconds have passed. Rotation is queued behind the
+    batches already submitted, so every sample lands in exactly one file; if
+    the queue is full it is held back, and batches are dropped, until it
+    fits. A writer that raises is counted and its message kept in ``error``;
+    the thread carries on with the next batch.
+    """
+
+    _WRITE = "write"
+    _ROTATE = "rotate"
+    _STOP = "stop"
+
+    def __init__(
+        self,
+        writers: List[LogWriter],
+        max_batches: int = 256,
+        flush_interval: float = 5.0,
+        flush_samples: int = 65536,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_samples = flush_samples
+        self.submitted_samples = 0
+        self.written_samples = 0
+        self.dropped_batches = 0
+        self.dropped_samples = 0
+        self.queue_high_water = 0
+        self.flushes = 0
+        self.write_errors = 0
+        self.error: Optional[str] = None
+        self._writers = writers
+        self._rotation: Optional[List[LogWriter]] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_batches)
+        self._thread = threading.Thread(
+            target=self._run, name="session-log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, samples: Samples, count: Optional[int] = None) -> bool:
+        """Queue ``samples`` for the writers; False if dropped. ``count`` is
+        needed for batches that are not Samples (e.g. alarm events)."""
+        if count is None:
+            count = sum(len(key_data) for key_data in samples.values())
+        try:
+            if self._rotation is not None:
+                self._queue.put_nowait((self._ROTATE, self._rotation, 0))
+                self._rotation = None
+            self._queue.put_nowait((self._WRITE, samples, count))
+        except queue.Full:
+            self.dropped_batches += 1
+            self.dropped_samples += count
+            _DROPPED_SAMPLES.inc(count)
+            return False
+        self.submitted_samples += count
+        self.queue_high_water = max(self.queue_high_water, self._queue.qsize())
+        return True
+
+    def rotate(self, writers: List[LogWriter]) -> None:
+        """Switch to ``writers`` after the batches submitted so far; never
+        blocks."""
+        if self._rotation is not None:
+            for writer in self._rotation:  # superseded before it was used
+                writer.close()
+            self._rotation = None
+        try:
+            self._queue.put_nowait((self._ROTATE, writers, 0))
+        except queue.Full:
+            self._rotation = writers
+
+    def close(self) -> None:
+        commands = [(self._STOP, None, 0)]
+        if self._rotation is not None:
+            commands.insert(0, (self._ROTATE, self._rotation, 0))
+            self._rotation = None
+        for command in commands:
+            while self._thread.is_alive():
+                try:
+                    self._queue.put(command, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+        self._thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_high_water": self.queue_high_water,
+            "submitted_samples": self.submitted_samples,
+            "written_samples": self.written_samples,
+            "dropped_batches": self.dropped_batches,
+            "dropped_samples": self.dropped_samples,
+            "flushes": self.flushes,
+            "write_errors": self.write_errors,
+        }
+
+    def _run(self) -> None:
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                command, payload, count = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                command, payload, count = None, None, 0
+
+            if command == self._WRITE:
+                with _WRITE_SECONDS.time():
+                    self._call("write", payload)
+                self.written_samples += count
+                _WRITTEN_SAMPLES.inc(count)
+                pending += count
+            elif command == self._ROTATE:
+                self._call("close")
+                self._writers = payload
+                pending = 0
+                last_flush = time.monotonic()
+            elif command == self._STOP:
+                self._call("close")
+                return
+
+            if pending and (
+                pending >= self.flush_samples
+                or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                with _FLUSH_SECONDS.time():
+                    self._call("flush")
+                self.flushes += 1
+                pending = 0
+                last_flush = time.monotonic()
+            elif not pending:
+                last_flush = time.monotonic()
+
+    def _call(self, method: str, *args) -> None:
+        for writer in self._writers:
+            try:
+                getattr(writer, method)(*args)
+            except Exception as e:
+                self.write_errors += 1
+                self.error = f"Log {method} error ({writer.path}): {e!r}"
+                _WRITE_ERRORS.inc()
+                print(self.error)
+
+
+WRITERS: Dict[str, Type[LogWriter]] = {
+    "csv": CSVLogWriter,
+    "bmslog": ColumnarLogWriter,
+}
+
+
+def create_writer(log_format: str, basename: str) -> LogWriter:
+    writer_class = WRITERS[log_format]
+    directory = os.path.dirname(basename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    return writer_class(basename + writer_class.EXTENSION)
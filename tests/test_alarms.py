@@ -0,0 +1,95 @@
+import csv
+
+import alarms
+
+
+def run(rule, samples, key="x"):
+    """States (True = raised) of the events ``samples`` produce."""
+    engine = alarms.AlarmEngine([rule])
+    engine.process([(timestamp, 1, {key: value}) for timestamp, value in samples])
+    return [(event.timestamp, event.active) for event in engine.events]
+
+
+def test_debounce_needs_the_whole_interval():
+    rule = alarms.Rule("high", "x", above=10, debounce=1.0)
+    # A 0.5 s excursion is ignored; the next one raises once it lasts 1 s.
+    samples = [(0.0, 5), (1.0, 11), (1.5, 5), (2.0, 11), (2.5, 12), (3.0, 12)]
+    assert run(rule, samples) == [(3.0, True)]
+
+
+def test_hysteresis_delays_clearing():
+    rule = alarms.Rule("high", "x", above=10, hysteresis=2)
+    samples = [(0.0, 11), (1.0, 9), (2.0, 10), (3.0, 7.9), (4.0, 11)]
+    assert run(rule, samples) == [(0.0, True), (3.0, False), (4.0, True)]
+
+
+def test_rate_rule_watches_change_per_second():
+    rule = alarms.Rule("rising", "x", above=1.0, rate=True)
+    samples = [(0.0, 20), (1.0, 20.5), (2.0, 22), (3.0, 22.5)]
+    engine = alarms.AlarmEngine([rule])
+    engine.process([(t, 1, {"x": value}) for t, value in samples])
+    events = list(engine.events)
+    assert [(e.timestamp, e.active, e.value) for e in events] == [
+        (2.0, True, 1.5),
+        (3.0, False, 0.5),
+    ]
+    assert not engine.active
+
+
+def test_wildcard_rules_are_per_signal_and_board():
+    rule = alarms.Rule("cell high", "cell_id_*", above=4.2)
+    engine = alarms.AlarmEngine([rule])
+    engine.process(
+        [(0.0, 1, {"cell_id_0": 4.3, "cell_id_1": 4.0}), (0.0, 2, {"cell_id_1": 4.3})]
+    )
+    assert set(engine.active) == {
+        (1, "cell_id_0", "cell high"),
+        (2, "cell_id_1", "cell high"),
+    }
+
+
+def test_submit_evaluates_on_the_engine_thread_and_logs(tmp_path):
+    path = tmp_path / "alarms.csv"
+    engine = alarms.AlarmEngine([alarms.Rule("high", "x", above=10)])
+    log = alarms.AlarmLog(str(path))
+    seen = []
+    engine.listeners += [log, seen.append]
+
+    engine.submit([(0.0, 1, {"x": 11}), (1.0, 1, {"x": 5})])
+    engine.submit_columns(1, {"x": ([2.0], [12])})
+    engine.close()
+    log.close()
+
+    assert [(event.timestamp, event.active) for event in seen] == [
+        (0.0, True),
+        (1.0, False),
+        (2.0, True),
+    ]
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == list(alarms.AlarmCSVWriter.HEADER)
+    assert [row[5] for row in rows[1:]] == ["active", "cleared", "active"]
+
+
+def test_backlog_raises_an_alarm_instead_of_dropping_batches():
+    import threading
+
+    engine = alarms.AlarmEngine([alarms.Rule("high", "x", above=10)], backlog_limit=2)
+    release = threading.Event()
+    seen = []
+
+    def listener(event):
+        seen.append(event)
+        release.wait(5)
+
+    engine.listeners.append(listener)
+    for index in range(6):
+        engine.submit([(float(index), 1, {"x": 11 if index % 2 == 0 else 5})])
+    release.set()
+    engine.close()
+
+    checks = [(e.timestamp, e.active) for e in seen if e.key == "x"]
+    assert checks == [(float(index), index % 2 == 0) for index in range(6)]
+    backlog = [e.active for e in seen if e.key == alarms.BACKLOG_KEY]
+    assert backlog == [True, False]
+    assert not engine.active
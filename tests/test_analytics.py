@@ -0,0 +1,107 @@
+import random
+
+import can
+import numpy as np
+
+import analytics
+import can_utils as cu
+import frame_schema
+
+
+def pack_samples(start, stop, rate=10):
+    """(timestamp, {key: value}) at ``rate`` Hz: cell 0 flat until t = 20 s,
+    then rising 2 mV/s, with a current that steps every 5 s."""
+    samples = []
+    for index in range(round(start * rate), round(stop * rate)):
+        timestamp = index / rate
+        voltage = 3.7 + 0.002 * max(timestamp - 20.0, 0.0)
+        current = 10.0 if int(timestamp // 5) % 2 else 0.0
+        samples.append(
+            (
+                timestamp,
+                {"cell_id_0": voltage, cu.CANParser.KEY_BATTERY_CURRENT: current},
+            )
+        )
+    return samples
+
+
+def feed(pack, samples, per_update):
+    for first in range(0, len(samples), per_update):
+        chunk = samples[first : first + per_update]
+        new_samples = {}
+        for key in chunk[0][1]:
+            timestamps = [timestamp for timestamp, _ in chunk]
+            values = [data[key] for _, data in chunk]
+            new_samples[key] = cu.RingSnapshot(0, timestamps, values)
+        pack.update(new_samples)
+    return pack.stats()
+
+
+def test_pack_window_is_time_not_update_count():
+    samples = pack_samples(0.0, 60.0)
+    # One update per sample, per 2 s and per 20 s: the same 30 s window.
+    results = [
+        feed(analytics.PackAnalytics(window=30.0), samples, per_update)
+        for per_update in (1, 20, 200)
+    ]
+    for stats in results:
+        assert stats.timestamp == samples[-1][0]
+        assert stats.voltages[0] == samples[-1][1]["cell_id_0"]
+        assert np.isclose(stats.dv_dt[0], 0.002)
+        assert np.allclose(stats.resistance, results[0].resistance, equal_nan=True)
+    assert np.isfinite(results[0].resistance[0])
+    assert np.isnan(results[0].dv_dt[1])
+
+
+def random_frames(count, board_ids):
+    """Frames of every built-in type from each board with random payloads of
+    random length, every tenth one a remote frame."""
+    rng = random.Random(0)
+    base_ids = frame_schema.default_schema().base_ids
+    frames = []
+    for index in range(count):
+        remote = index % 10 == 9
+        frames.append(
+            can.Message(
+                timestamp=float(index),
+                arbitration_id=rng.choice(base_ids) + rng.choice(board_ids),
+                data=None if remote else rng.randbytes(rng.choice((0, 1, 3, 6, 8, 8))),
+                is_remote_frame=remote,
+                dlc=8 if remote else None,
+                is_extended_id=True,
+            )
+        )
+    return frames
+
+
+def test_bulk_decoders_match_parse_frame():
+    board_ids = [0x01, 0x02]
+    frames = random_frames(3000, board_ids)
+    parser = cu.CANParser(board_ids)
+    expected = {}
+    for message in frames:
+        parsed = parser.parse_frame(message)
+        if parsed is not None:
+            board_id, data = parsed
+            expected[message.timestamp, board_id] = data
+    assert 0 < len(expected) < len(frames) * 0.9  # short and remote frames
+
+    arrays = analytics.frame_arrays(frames)
+    decoded = {}
+    for key, columns in analytics.decode_fields(arrays, board_ids).items():
+        for timestamp, board_id, value in zip(
+            columns.timestamps.tolist(), columns.boards.tolist(), columns.values
+        ):
+            decoded.setdefault((timestamp, board_id), {})[key] = value
+    schema = frame_schema.default_schema()
+    packed = [message.packed for message in schema.messages.values() if message.packed]
+    for packing, columns in zip(packed, analytics.decode_packed(arrays, board_ids)):
+        for timestamp, board_id, sensor, value in zip(
+            columns.timestamps.tolist(),
+            columns.boards.tolist(),
+            columns.ids.tolist(),
+            columns.values,
+        ):
+            decoded.setdefault((timestamp, board_id), {})[packing.keys[sensor]] = value
+
+    assert decoded == expected
@@ -0,0 +1,245 @@
+import asyncio
+import time
+
+import can_utils as cu
+import metrics
+
+
+def test_stored_frames_observed_once_per_batch():
+    receiver = cu.CANReceiver(channel="test-stored", interface="virtual")
+    histogram = cu._STORED_FRAMES
+    count, total = histogram.count, histogram.sum
+
+    async def run():
+        stop_event = asyncio.Event()
+        consumer = asyncio.create_task(receiver.process_messages(stop_event))
+        await asyncio.sleep(0.01)  # first wake-up finds nothing pending
+        for index in range(5):
+            receiver.inject(float(index), {"a": index})
+        await asyncio.sleep(0.01)
+        stop_event.set()
+        await consumer
+
+    asyncio.run(run())
+    assert histogram.count - count == 1
+    assert histogram.sum - total == 5
+    assert len(receiver.data_points["a"]) == 5
+
+
+def test_close_releases_function_metrics():
+    receiver = cu.CANReceiver(channel="test-close", interface="virtual")
+    receiver.frames_received = 7
+    metric = metrics.REGISTRY.counter(
+        "bms_can_frames_received_total", "", channel="test-close"
+    )
+    assert metric.value == 7
+
+    receiver.close()
+    receiver.frames_received = 9
+    assert metric.function is None and metric.value == 7
+    # A receiver bound since keeps its own function.
+    newer = cu.CANReceiver(channel="test-close", interface="virtual")
+    receiver.close()
+    newer.frames_received = 3
+    assert metric.value == 3
+
+
+def test_malformed_frame_does_not_stop_receiving():
+    import can
+
+    receiver = cu.CANReceiver(channel="test-malformed", interface="virtual")
+    ignored = metrics.REGISTRY.counter(
+        "bms_can_frames_ignored_total", "", channel="test-malformed"
+    )
+    ignored_before = ignored.value
+    sender = can.interface.Bus(channel="test-malformed", interface="virtual")
+
+    async def run():
+        stop_event = asyncio.Event()
+        consumer = asyncio.create_task(receiver.process_messages(stop_event))
+        receiver.start_receiving()
+        sender.send(can.Message(arbitration_id=0x4001, data=b"\x01\x02"))
+        sender.send(
+            can.Message(arbitration_id=0x4001, data=bytes([0x80, 0x1A, 6, 0] * 2))
+        )
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if receiver.frames_received == 2:
+                break
+        receiver.stop_receiving()
+        stop_event.set()
+        await consumer
+
+    try:
+        asyncio.run(run())
+    finally:
+        sender.shutdown()
+        receiver.close()
+    assert receiver.frames_received == 2
+    assert ignored.value - ignored_before == 1
+    assert list(receiver.data_points["battery_voltage"].snapshot().values) == [40.0]
+
+
+def test_first_wakeup_handoff_is_not_the_uptime():
+    receiver = cu.CANReceiver(channel="test-handoff", interface="virtual")
+    histogram = cu._HANDOFF_LATENCY
+    count, total = histogram.count, histogram.sum
+
+    async def run():
+        stop_event = asyncio.Event()
+        consumer = asyncio.create_task(receiver.process_messages(stop_event))
+        await asyncio.sleep(0.01)
+        stop_event.set()
+        await consumer
+
+    asyncio.run(run())
+    assert histogram.count - count == 1
+    assert histogram.sum - total < 0.5
+
+
+def test_frame_clock_reanchors_device_epochs():
+    import can
+
+    clock = cu.FrameClock(60.0)
+    now = time.time()
+    # An adapter counting from power-on is moved onto the wall clock...
+    first = clock(can.Message(timestamp=5.0))
+    assert abs(first - now) < 1.0
+    assert clock(can.Message(timestamp=6.5)) == first + 1.5
+    # ...while kernel timestamps are kept as they are.
+    clock.reset()
+    assert clock(can.Message(timestamp=now - 2.0)) == now - 2.0
+
+
+def test_parser_dispatches_by_frame_id():
+    import struct
+
+    import can
+
+    parser = cu.CANParser(0x01)
+
+    def message(arbitration_id, data):
+        return can.Message(arbitration_id=arbitration_id, data=data)
+
+    assert parser.parse_message(message(0x4001, struct.pack("<Ii", 480000, -2500))) == {
+        "battery_voltage": 48.0,
+        "battery_current": -2.5,
+    }
+    assert parser.parse_message(
+        message(0x4201, struct.pack("<HHBBBB", 0, 5000, 80, 0, 30, 0))
+    ) == {"remain": 5000, "soc": 80, "duty": 30}
+    assert parser.parse_frame(
+        message(0x4501, struct.pack("<H", (3 << 10) | 0x205))
+    ) == (
+        0x01,
+        {"thrm_id_3": -5},
+    )
+    # Other boards, unknown frame types and IDs outside the board byte.
+    for arbitration_id in (0x4002, 0x4600 + 0x01, 0x14001):
+        assert parser.parse_frame(message(arbitration_id, bytes(8))) is None
+    assert parser.can_filters() == [
+        {"can_id": base_id + 0x01, "can_mask": 0x1FFFFFFF, "extended": True}
+        for base_id in parser.schema.base_ids
+    ]
+
+
+def test_ring_buffer_wraps_like_a_bounded_deque():
+    import random
+    from array import array
+    from collections import deque
+
+    rng = random.Random(0)
+    ring = cu.RingBuffer(8, "q")
+    reference = deque(maxlen=8)
+    seq = 0
+    for _ in range(200):
+        if rng.random() < 0.5:
+            sample = (float(seq), seq)
+            ring.append(*sample)
+            reference.append(sample)
+            seq += 1
+        else:
+            count = rng.randint(0, 20)  # may exceed the capacity
+            samples = [(float(seq + i), seq + i) for i in range(count)]
+            ring.extend(
+                array("d", [t for t, _ in samples]), array("q", [v for _, v in samples])
+            )
+            reference.extend(samples)
+            seq += count
+        assert ring.items() == list(reference)
+        assert len(ring) == len(reference)
+        assert ring.seq == seq
+
+    ring.clear()
+    assert ring.items() == [] and ring.seq == seq
+    ring.append(1.5, 7)
+    assert ring.items() == [(1.5, 7)]
+
+
+def test_read_since_returns_what_each_cursor_has_not_seen():
+    receiver = cu.CANReceiver(
+        channel="test-cursor", max_data_points=4, interface="virtual"
+    )
+
+    def store(*frames):
+        receiver._store([(timestamp, 0x01, data) for timestamp, data in frames])
+
+    def read(cursor):
+        new_samples, cursor = asyncio.run(receiver.read_since(cursor))
+        return {
+            key: list(samples.timestamps) for key, samples in new_samples.items()
+        }, cursor
+
+    store((1.0, {"a": 1}), (2.0, {"a": 2}))
+    first, cursor = read(None)
+    assert first == {"a": [1.0, 2.0]}
+    assert read(cursor) == ({}, cursor)
+
+    store((3.0, {"a": 3, "b": 30}))
+    late, other = read(None)  # a second consumer starts from scratch
+    assert late == {"a": [1.0, 2.0, 3.0], "b": [3.0]}
+    new, cursor = read(cursor)
+    assert new == {"a": [3.0], "b": [3.0]}
+    assert cursor == other == {"a": 3, "b": 1}
+
+    # Past the capacity only what is still buffered comes back; the cursor
+    # gap (seq) tells how much was overwritten.
+    store(*((float(t), {"a": t}) for t in range(4, 10)))
+    new_samples, cursor = asyncio.run(receiver.read_since(cursor))
+    assert list(new_samples["a"].timestamps) == [6.0, 7.0, 8.0, 9.0]
+    assert new_samples["a"].seq - 3 - len(new_samples["a"].timestamps) == 2
+
+    receiver.reset_data_points()
+    assert read(cursor) == ({}, cursor)
+    store((10.0, {"a": 10}))
+    assert read(cursor)[0] == {"a": [10.0]}
+
+
+def test_boards_are_demultiplexed_by_id():
+    import struct
+
+    import can
+
+    def soc_frame(board_id, soc):
+        data = struct.pack("<HHBBBB", 0, 0, soc, 0, 0, 0)
+        return can.Message(
+            timestamp=time.time(), arbitration_id=0x4200 + board_id, data=data
+        )
+
+    frames = [soc_frame(board_id, 10 * board_id) for board_id in (1, 2, 3, 0x11)]
+    chosen = cu.CANReceiver(channel="test-boards", bms_id=[3, 1], interface="virtual")
+    every = cu.CANReceiver(channel="test-all-boards", bms_id=None, interface="virtual")
+    for receiver in (chosen, every):
+        receiver._decode(frames)
+
+    assert chosen.board_ids == [1, 3]
+    assert chosen.primary_board == 1
+    assert every.board_ids == [1, 2, 3, 0x11]
+    assert every.primary_board == 1
+    for board_id in every.board_ids:
+        new_samples, _ = asyncio.run(every.read_since(None, board_id))
+        assert list(new_samples["soc"].values) == [10 * board_id]
+    assert every.parser.can_filters() == [
+        {"can_id": base_id, "can_mask": 0x1FFFFF00, "extended": True}
+        for base_id in every.parser.schema.base_ids
+    ]
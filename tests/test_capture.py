@@ -0,0 +1,51 @@
+import json
+import time
+
+import can_utils as cu
+import capture
+import frame_schema
+
+
+def run_capture(capture_: capture.MultiChannelCapture, until) -> None:
+    capture_.start()
+    deadline = time.monotonic() + 10
+    while not until() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    capture_.stop()
+
+
+def test_capture_decodes_with_channel_schema(tmp_path):
+    with open(frame_schema.SCHEMA_PATH) as file:
+        spec = json.load(file)
+    for message in spec["messages"]:
+        for field in message.get("fields", []):
+            if isinstance(field, dict) and field["name"] == "battery_voltage":
+                field["name"] = "pack_voltage"
+    schema_path = tmp_path / "renamed.json"
+    schema_path.write_text(json.dumps(spec))
+
+    receiver = cu.CANReceiver(channel="test-capture-schema", interface="virtual")
+    config = capture.ChannelConfig(
+        "synthetic",
+        "synthetic",
+        bms_id=0x01,
+        schema_path=str(schema_path),
+        frame_rate=2000,
+    )
+    capture_ = capture.MultiChannelCapture(receiver, [config])
+    run_capture(capture_, lambda: capture_.samples > 100)
+    receiver._store(receiver._drain())
+
+    assert capture_.error is None
+    assert "pack_voltage" in receiver.data_points
+    assert "battery_voltage" not in receiver.data_points
+
+
+def test_capture_reports_channel_errors():
+    receiver = cu.CANReceiver(channel="test-capture-error", interface="virtual")
+    config = capture.ChannelConfig("missing0", "no-such-interface")
+    capture_ = capture.MultiChannelCapture(receiver, [config])
+    run_capture(capture_, lambda: capture_.error is not None)
+
+    assert capture_.error.startswith("Capture error (missing0):")
+    assert capture_.samples == 0
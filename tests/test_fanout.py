@@ -0,0 +1,44 @@
+import asyncio
+from array import array
+
+import can_utils as cu
+import fanout
+
+
+def store(receiver, first, count):
+    timestamps = array("d", [float(t) for t in range(first, first + count)])
+    receiver.store_columns(0x01, {"soc": (timestamps, array("d", timestamps))})
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_subscription_snapshot_is_not_sent_again(tmp_path):
+    source = cu.CANReceiver(channel="test-fanout-source", interface="virtual")
+    viewer = cu.CANReceiver(channel="test-fanout-viewer", interface="virtual")
+    address = str(tmp_path / "fanout.sock")
+
+    async def run():
+        server = fanout.FanoutServer(source, address, interval=3600)
+        await server.start()
+        store(source, 0, 5)
+        client = fanout.FanoutClient(viewer, address)
+        await client.start()
+        await wait_for(lambda: server.subscribers and client.samples)
+
+        store(source, 5, 2)
+        await server.publish()
+        await wait_for(lambda: client.samples >= 3)
+        await asyncio.sleep(0.05)
+        client.stop()
+        await server.stop()
+        return client.samples
+
+    assert asyncio.run(run()) == 3
+    timestamps = viewer.boards[0x01]["soc"].snapshot().timestamps
+    assert list(timestamps) == [4.0, 5.0, 6.0]
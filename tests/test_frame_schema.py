@@ -0,0 +1,55 @@
+import random
+import sys
+from pathlib import Path
+
+import can
+
+import can_utils as cu
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from bench_parser import LegacyCANParser  # noqa: E402
+
+BOARD_ID = 0x01
+BASE_IDS = (0x4000, 0x4100, 0x4200, 0x4300, 0x4400, 0x4500)
+
+
+def random_frames(count: int):
+    """Frames of every built-in type with random payloads; 0x45xx frames also
+    get random lengths, since their word count varies."""
+    rng = random.Random(0)
+    frames = []
+    for index in range(count):
+        base_id = BASE_IDS[index % len(BASE_IDS)]
+        length = rng.randint(1, 8) if base_id == 0x4500 else 8
+        frames.append(
+            can.Message(
+                timestamp=float(index),
+                arbitration_id=base_id + BOARD_ID,
+                data=bytes(rng.getrandbits(8) for _ in range(length)),
+                is_extended_id=True,
+            )
+        )
+    return frames
+
+
+def test_default_schema_matches_legacy_parser():
+    parser = cu.CANParser(BOARD_ID)
+    legacy = LegacyCANParser(BOARD_ID)
+    for message in random_frames(6000):
+        assert parser.parse_message(message) == legacy.parse_message(message), message
+
+
+def test_short_and_remote_frames_are_not_decoded():
+    parser = cu.CANParser(BOARD_ID)
+    for base_id in BASE_IDS:
+        remote = can.Message(
+            arbitration_id=base_id + BOARD_ID, is_remote_frame=True, dlc=8
+        )
+        assert parser.parse_frame(remote) is None
+        for length in range(1, 8):
+            short = can.Message(arbitration_id=base_id + BOARD_ID, data=bytes(length))
+            if base_id == 0x4500 and length % 2 == 0:
+                assert parser.parse_frame(short) is not None
+            else:
+                assert parser.parse_frame(short) is None, (hex(base_id), length)
@@ -0,0 +1,77 @@
+import random
+
+import layout
+
+
+def feed(series, xs, ys, rng):
+    """Extend ``series`` in random chunks, mirroring it the way a chart does
+    with ``changes`` and checking the mirror after every chunk."""
+    shown = []
+    index = 0
+    while index < len(xs):
+        step = rng.randint(1, 50)
+        series.extend(xs[index : index + step], ys[index : index + step])
+        index += step
+        start, points = series.changes()
+        shown[start:] = points
+        assert shown == series.points()
+    return shown
+
+
+def test_minmax_series_invariants():
+    rng = random.Random(1)
+    xs = [index * 0.1 for index in range(20000)]
+    ys = [rng.gauss(0, 1) for _ in xs]
+    ys[12345] = 50.0
+    ys[777] = -50.0
+    series = layout.MinMaxSeries(max_points=100)
+
+    points = feed(series, xs, ys, rng)
+
+    assert len(points) == len(series) <= 100
+    assert [x for x, _ in points] == sorted(x for x, _ in points)
+    # The extremes survive downsampling.
+    assert (xs[12345], 50.0) in points
+    assert (xs[777], -50.0) in points
+    assert (series.low, series.high) == (min(ys), max(ys))
+    assert (series.first_x, series.last_x) == (xs[0], xs[-1])
+    assert set(points) <= set(zip(xs, ys))
+
+
+def test_minmax_series_short_series_kept_whole():
+    series = layout.MinMaxSeries(max_points=100)
+    xs, ys = [0.0, 1.0, 2.0], [3.0, 1.0, 2.0]
+    series.extend(xs, ys)
+    # Until the buckets run out, each sample is a bucket of its own.
+    assert series.points() == [point for point in zip(xs, ys) for _ in range(2)]
+
+    series.clear()
+    assert series.points() == [] and series.low is None
+
+
+def test_idle_steps_back_off_and_flush_reports_work():
+    import asyncio
+    import types
+
+    page = types.SimpleNamespace(updates=[])
+    page.update = lambda *controls: page.updates.append(controls)
+    renderer = layout.RenderScheduler(page)
+    control = types.SimpleNamespace(page=page)
+
+    async def step():
+        return renderer.flush()
+
+    scheduler = layout.AdaptiveScheduler(step, min_interval=0.01, max_interval=0.08)
+    intervals = []
+
+    async def run():
+        for marked in (True, False, False, False, True):
+            if marked:
+                renderer.mark(control)
+            scheduler.interval = scheduler.next_interval(await step())
+            intervals.append(scheduler.interval)
+
+    asyncio.run(run())
+    assert page.updates == [(control,), (control,)]
+    assert intervals[1:4] == [0.02, 0.04, 0.08]
+    assert intervals[4] == 0.01
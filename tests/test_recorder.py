@@ -0,0 +1,61 @@
+import asyncio
+from array import array
+
+import can_utils as cu
+import recorder
+
+
+def test_ring_capacity_covers_drain_margin():
+    assert recorder.ring_capacity(0.5, 10.0) == recorder.MIN_RING_CAPACITY
+    assert recorder.ring_capacity(0.5, 1000.0) == 2000
+
+
+def test_drain_counts_overrun_samples(tmp_path):
+    receiver = cu.CANReceiver(
+        channel="test-recorder", max_data_points=4, interface="virtual"
+    )
+    rec = recorder.Recorder(receiver, log_directory=str(tmp_path))
+    overruns = recorder._OVERRUN_SAMPLES.value
+
+    def store(first, count):
+        timestamps = array("d", [float(t) for t in range(first, first + count)])
+        receiver.store_columns(0x01, {"soc": (timestamps, array("d", timestamps))})
+
+    store(0, 10)
+    asyncio.run(rec.drain())
+    store(10, 3)
+    asyncio.run(rec.drain())
+    for log_writer in rec.log_writers.values():
+        log_writer.close()
+
+    assert rec.stats()["overrun_samples"] == 6
+    assert recorder._OVERRUN_SAMPLES.value - overruns == 6
+    assert rec.stats()["written_samples"] == 7
+
+
+def test_run_shuts_down_when_the_serve_port_is_taken(tmp_path):
+    import socket
+
+    taken = socket.socket()
+    taken.bind(("127.0.0.1", 0))
+    taken.listen()
+    receiver = cu.CANReceiver(channel="test-recorder-serve", interface="virtual")
+    rec = recorder.Recorder(
+        receiver,
+        log_directory=str(tmp_path),
+        serve=f"127.0.0.1:{taken.getsockname()[1]}",
+    )
+
+    async def run():
+        try:
+            await rec.run()
+        except OSError:
+            return asyncio.all_tasks()
+        raise AssertionError("serving on a taken port succeeded")
+
+    try:
+        tasks = asyncio.run(run())
+    finally:
+        taken.close()
+    assert len(tasks) == 1  # just run() itself: the consumer was awaited
+    assert not receiver.is_reading
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import can
+
+import can_utils as cu
+import replay
+
+
+def write_candump(path, board_ids, cycles, start, step=0.01):
+    """Log ``cycles`` synthetic cycles per board, ``step`` s apart from ``start``."""
+    bms = replay.SyntheticBMS(board_ids, cells=8, thermistors=4)
+    writer = can.Logger(str(path))
+    for index in range(cycles):
+        for message in bms.cycle(start + index * step):
+            writer.on_message_received(message)
+    writer.stop()
+    return bms.frames_per_cycle // len(board_ids) * cycles
+
+
+def test_replay_keeps_recorded_timestamps_and_filters(tmp_path):
+    path = tmp_path / "capture.log"
+    # Recent enough that the receiver does not re-anchor the clock.
+    start = round(time.time()) - 10.0
+    frames = write_candump(path, [0x01, 0x02], 20, start)
+    receiver = cu.CANReceiver(channel="test-replay", bms_id=[0x01], interface="virtual")
+    replayer = replay.Replayer(str(path), receiver, speed=0)
+
+    # Board 2 never passes the receiver's filters; this used to hang.
+    asyncio.run(asyncio.wait_for(replay._replay(receiver, replayer), timeout=10))
+
+    assert replayer.frames == 2 * frames
+    assert receiver.frames_received == replayer.matched_frames == frames
+    assert receiver.board_ids == [0x01]
+    timestamps = list(
+        receiver.boards[0x01][cu.CANParser.KEY_BATTERY_VOLTAGE].snapshot().timestamps
+    )
+    assert timestamps == [start + index * 0.01 for index in range(20)]
+
+
+def test_replay_stop_interrupts_pacing(tmp_path):
+    path = tmp_path / "capture.log"
+    write_candump(path, [0x01], 2, time.time() - 1000.0, step=60.0)
+    receiver = cu.CANReceiver(channel="test-stop", interface="virtual")
+    replayer = replay.Replayer(str(path), receiver, speed=1.0)
+    replayer.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    replayer.stop()
+    assert time.monotonic() - started < 0.5
+    assert not replayer._thread.is_alive()
+
+
+def test_replay_skips_remote_frames_and_stops_with_the_reader(tmp_path):
+    path = tmp_path / "capture.log"
+    start = round(time.time()) - 10.0
+    frames = write_candump(path, [0x01], 5, start)
+    with open(path, "a") as file:
+        file.write(f"({start + 1:.6f}) vcan0 00004001#R\n")
+    assert sum(1 for _ in replay.iter_events(str(path))) == frames
+
+    receiver = cu.CANReceiver(channel="test-replay-dead", interface="virtual")
+
+    async def run():
+        replayer = replay.Replayer(str(path), receiver, speed=0)
+        run_task = asyncio.create_task(replay._replay(receiver, replayer))
+        await asyncio.sleep(0)  # started receiving; end the reader task
+        receiver._reader_task.cancel()
+        return await run_task
+
+    elapsed = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert elapsed < replay.STALL_TIMEOUT
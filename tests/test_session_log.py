@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+import replay
+import session_log
+
+
+def write_columnar(path, batches, **kwargs):
+    writer = session_log.ColumnarLogWriter(path, **kwargs)
+    for batch in batches:
+        writer.write(batch)
+        writer.flush()
+    writer.close()
+
+
+def test_csv_late_keys_start_a_new_file(tmp_path):
+    import csv
+
+    path = str(tmp_path / "log.csv")
+    writer = session_log.CSVLogWriter(path)
+    writer.write({"a": [(1.0, 1)]})
+    writer.write({"a": [(2.0, 2)], "b": [(2.0, 3.5)]})
+    writer.close()
+    # Reopening never appends to an existing file.
+    writer = session_log.CSVLogWriter(path)
+    writer.write({"c": [(3.0, 7)]})
+    writer.close()
+
+    second, third = str(tmp_path / "log-2.csv"), str(tmp_path / "log-3.csv")
+    assert writer.paths == [third]
+    for part in (path, second, third):
+        with open(part, newline="") as file:
+            rows = list(csv.reader(file))
+        # One header, and every row as wide as it.
+        assert rows[0][0] == "timestamp"
+        assert all(row[0] != "timestamp" for row in rows[1:])
+        assert {len(row) for row in rows} == {len(rows[0])}
+    assert [list(replay._iter_session_csv(part)) for part in (path, second, third)] == [
+        [(1.0, {"a": 1})],
+        [(2.0, {"a": 2, "b": 3.5})],
+        [(3.0, {"c": 7})],
+    ]
+
+
+def test_columnar_round_trip_and_index(tmp_path):
+    path = str(tmp_path / "log.bmslog")
+    write_columnar(
+        path,
+        [
+            {"a": [(1.0, 1), (2.0, 2)], "b": [(1.0, 0.5)]},
+            {"a": [(3.0, 3)], "c": [(3.0, 70000)]},
+        ],
+    )
+    columns = session_log.read_log(path)
+    assert list(columns["a"][0]) == [1.0, 2.0, 3.0]
+    assert list(columns["a"][1]) == [1, 2, 3]
+    assert list(columns["b"][1]) == [0.5]
+    assert list(columns["c"][1]) == [70000]
+
+    blocks = session_log.read_index(path)
+    assert [(block.start, block.end) for block in blocks] == [(1.0, 2.0), (3.0, 3.0)]
+    assert session_log._index_complete(path)
+    reader = session_log.IndexedLogReader(path)
+    assert list(reader.read(2.5, 3.5)["a"][1]) == [3]
+
+
+def test_columnar_append_after_torn_tail(tmp_path):
+    path = str(tmp_path / "log.bmslog")
+    write_columnar(path, [{"a": [(1.0, 1)]}, {"b": [(2.0, 2)]}])
+    os.truncate(path, os.path.getsize(path) - 5)  # crash mid-record
+
+    write_columnar(path, [{"b": [(3.0, 3)], "c": [(3.0, 4)]}])
+
+    columns = session_log.read_log(path)
+    assert {key: list(values) for key, (_, values) in columns.items()} == {
+        "a": [1],
+        "b": [3],
+        "c": [4],
+    }
+    assert session_log._index_complete(path)
+    assert len(session_log.read_index(path)) == 2
+
+
+def test_columnar_append_keeps_signal_numbering(tmp_path):
+    path = str(tmp_path / "log.bmslog")
+    write_columnar(path, [{"a": [(1.0, 1)]}])
+    write_columnar(path, [{"b": [(2.0, 2)]}, {"a": [(3.0, 3)]}])
+
+    columns = session_log.read_log(path)
+    assert list(columns["a"][1]) == [1, 3]
+    assert list(columns["b"][1]) == [2]
+    assert session_log._index_complete(path)
+
+
+class RecordingWriter(session_log.LogWriter):
+    """Keeps what it is given; ``gate`` stalls writes, ``fail`` makes them raise."""
+
+    def __init__(self, path, gate=None, fail=False):
+        super().__init__(path)
+        self.gate = gate
+        self.fail = fail
+        self.samples = []
+        self.closed = False
+
+    def write(self, samples):
+        if self.gate:
+            self.gate.wait()
+        if self.fail:
+            raise TypeError("bad sample")
+        self.samples.append(samples)
+
+    def close(self):
+        self.closed = True
+
+
+def test_background_rotate_never_blocks(tmp_path):
+    gate = threading.Event()
+    first = RecordingWriter("first", gate)
+    second = RecordingWriter("second")
+    writer = session_log.BackgroundLogWriter([first], max_batches=2)
+    for index in range(4):
+        writer.submit({"a": [(float(index), index)]})
+
+    started = time.monotonic()
+    writer.rotate([second])  # queue full: held back instead of blocking
+    assert time.monotonic() - started < 0.1
+    assert not writer.submit({"a": [(9.0, 9)]})
+
+    gate.set()
+    writer.close()
+    assert first.closed and second.closed
+    # Nothing submitted before the rotation went to the new writer.
+    assert second.samples == []
+    assert writer.stats()["dropped_batches"] >= 1
+
+
+def test_background_writer_survives_errors(tmp_path):
+    failing = RecordingWriter("failing", fail=True)
+    working = RecordingWriter("working")
+    writer = session_log.BackgroundLogWriter([failing, working])
+    writer.submit({"a": [(1.0, 1)]})
+    writer.submit({"a": [(2.0, 2)]})
+    writer.close()
+
+    assert len(working.samples) == 2
+    assert writer.write_errors == 2
+    assert "bad sample" in writer.error